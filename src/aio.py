@@ -0,0 +1,233 @@
+"""
+asyncio facade for embedding OnlyFiles operations in services.
+
+Every operation runs its blocking filesystem work on a bounded, managed
+thread pool and returns an Operation right away. Await it for the result,
+iterate it for progress, cancel it, or give it a timeout::
+
+    from src import aio
+
+    async def ingest(directory):
+        operation = aio.organize(directory, by='type', timeout=600)
+        async for update in operation:
+            print(f"{update.completed}/{update.total} {update.path}")
+        return await operation
+
+Cancelling (or timing out) stops the operation before its next file and
+waits for the file in progress to finish, so the filesystem is quiet by
+the time CancelledError or TimeoutError is raised.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from src.core.backup_retention import RetentionPolicy
+from src.core.file_operations import FileOperations
+from src.core.file_organizer import FileOrganizer
+from src.core.throttle import Throttle
+
+# Operations running at once; the IOScheduler still bounds the I/O each device sees
+DEFAULT_MAX_WORKERS = 16
+
+ORGANIZERS: Dict[str, Callable[..., Dict[str, List[str]]]] = {
+    'type': FileOrganizer.organize_by_type,
+    'extension': FileOrganizer.organize_by_extension,
+    'date': FileOrganizer.organize_by_date,
+    'size': FileOrganizer.organize_by_size,
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def configure(max_workers: int = DEFAULT_MAX_WORKERS):
+    """
+    Set how many operations may run at once; further ones wait their turn.
+
+    Operations already running keep running on the previous pool.
+
+    Args:
+        max_workers: Maximum number of concurrently running operations
+    """
+    global _executor
+    with _executor_lock:
+        previous, _executor = _executor, ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="onlyfiles-aio")
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the managed pool, creating it with default limits on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="onlyfiles-aio")
+        return _executor
+
+
+@dataclass(frozen=True)
+class Progress:
+    """Progress of an operation: files completed out of total, and the latest file."""
+
+    completed: int
+    total: int
+    path: str
+
+
+class Operation:
+    """
+    A running operation: awaitable for its result, async-iterable for its progress.
+
+    Progress reports from worker threads are coalesced, so a fast operation
+    over many files wakes the event loop at most once per loop iteration
+    and iterators always see the latest state rather than every step.
+    """
+
+    def __init__(self, function: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Args:
+            function: Blocking operation accepting ``progress`` and ``cancel`` keyword arguments
+            *args: Positional arguments for the function
+            timeout: Seconds after which the operation is cancelled, None for no limit
+            **kwargs: Keyword arguments for the function
+        """
+        self._loop = asyncio.get_running_loop()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._latest: Optional[Progress] = None
+        self._published: Optional[Progress] = None
+        self._flush_scheduled = False
+        self._wakeup = self._loop.create_future()
+
+        call = partial(function, *args, progress=self._report, cancel=self._cancel, **kwargs)
+        self._future = self._loop.run_in_executor(_get_executor(), call)
+        self._task = self._loop.create_task(self._run(timeout))
+
+    @property
+    def progress(self) -> Optional[Progress]:
+        """The latest progress published to the event loop, if any."""
+        return self._published
+
+    def done(self) -> bool:
+        """Whether the operation has finished, failed or been cancelled."""
+        return self._task.done()
+
+    def cancel(self):
+        """Ask the operation to stop; awaiting it then raises CancelledError."""
+        self._cancel.set()
+        self._task.cancel()
+
+    def __await__(self):
+        return self._task.__await__()
+
+    def __aiter__(self) -> AsyncIterator[Progress]:
+        return self._updates()
+
+    async def _run(self, timeout: Optional[float]) -> Any:
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self._cancel.set()
+            # Let the file in progress finish so nothing is touched after we return
+            await asyncio.wait({self._future})
+            raise
+        finally:
+            self._flush()
+
+    async def _updates(self) -> AsyncIterator[Progress]:
+        seen = None
+        while True:
+            current = self._published
+            if current is not None and current is not seen:
+                seen = current
+                yield current
+                continue
+            if self._task.done():
+                return
+            await asyncio.wait({self._wakeup, self._task}, return_when=asyncio.FIRST_COMPLETED)
+
+    def _report(self, completed: int, total: int, path: str):
+        """Progress callback, called from worker threads."""
+        with self._lock:
+            self._latest = Progress(completed, total, path)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._flush)
+        except RuntimeError:
+            # The event loop was closed; nobody is listening any more
+            pass
+
+    def _flush(self):
+        """Publish the latest progress and wake up iterators (runs on the event loop)."""
+        with self._lock:
+            self._published = self._latest
+            self._flush_scheduled = False
+        waiter, self._wakeup = self._wakeup, self._loop.create_future()
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+def organize(directory: str, by: str = 'type', date_source: str = 'birth',
+             timeout: Optional[float] = None) -> Operation:
+    """
+    Organize a directory without blocking the event loop.
+
+    Args:
+        directory: Directory to organize
+        by: 'type', 'extension', 'date' or 'size'
+        date_source: Date used when organizing by date ('birth', 'ctime', 'mtime' or 'capture')
+        timeout: Seconds after which the operation is cancelled
+
+    Returns:
+        Operation: Resolves to the organizer's result, category to moved files
+    """
+    if by not in ORGANIZERS:
+        raise ValueError(f"Unknown organization '{by}', expected one of {', '.join(ORGANIZERS)}")
+    if by == 'date':
+        return Operation(ORGANIZERS[by], directory, date_source, timeout=timeout)
+    return Operation(ORGANIZERS[by], directory, timeout=timeout)
+
+
+def backup(path: str, throttle: Optional[Throttle] = None, verify: bool = False,
+           retention: Optional[RetentionPolicy] = None, chunked: bool = False, archive: bool = False,
+           compression: Optional[str] = None, timeout: Optional[float] = None) -> Operation:
+    """
+    Back up a file or directory without blocking the event loop.
+
+    Takes the same options as FileOperations.create_backup.
+
+    Returns:
+        Operation: Resolves to True if the backup was made
+    """
+    return Operation(FileOperations.create_backup, path, throttle=throttle, verify=verify, retention=retention,
+                     chunked=chunked, archive=archive, compression=compression, timeout=timeout)
+
+
+def revert(path: str, members: Optional[List[str]] = None, timeout: Optional[float] = None) -> Operation:
+    """
+    Restore a path, or some files/subtrees in it, from its latest backup without blocking the event loop.
+
+    Returns:
+        Operation: Resolves to True if the revert succeeded
+    """
+    return Operation(FileOperations.revert_to_backup, path, members, timeout=timeout)
+
+
+def move(source_path: str, destination_path: str, file_pattern: Optional[str] = None,
+         throttle: Optional[Throttle] = None, verify: bool = False, timeout: Optional[float] = None) -> Operation:
+    """
+    Move files between directories without blocking the event loop.
+
+    Takes the same options as FileOperations.move_files.
+
+    Returns:
+        Operation: Resolves to the names of the files moved
+    """
+    return Operation(FileOperations.move_files, source_path, destination_path, file_pattern,
+                     throttle=throttle, verify=verify, timeout=timeout)
@@ -2,15 +2,41 @@ import click
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
-from typing import Optional
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+from datetime import datetime
+import hashlib
+import itertools
+import json
+import os
+import signal
 import sys
+import threading
+import time
 
 from src.utils.logging import Logger
 from src.utils.file_navigator import FileNavigator
 from src.utils.path_utils import PathUtils
-from src.core.file_organizer import FileOrganizer
+from src.core.file_organizer import ARCHIVE_FORMATS, DATE_SOURCES, ORGANIZE_METHODS, FileOrganizer
 from src.core.file_operations import FileOperations
 from src.core.drive_operations import DriveOperations
+from src.core.io_scheduler import IOScheduler
+from src.core.throttle import Throttle, set_process_priority
+from src.core.backup_verifier import BackupVerifier, DEFAULT_ALGORITHM
+from src.core.backup_retention import BackupRetention, RetentionPolicy
+from src.core.archive_backup import ARCHIVE_EXTENSIONS, available_codecs
+from src.core.backup_index import ARCHIVE_SUFFIXES, MANIFEST_SUFFIX, BackupIndex
+from src.core.merkle_index import MerkleIndex
+from src.core.metadata_index import MetadataIndex
+from src.core.query import QueryError, parse_query
+from src.core.tree_cleanup import CleanupReport, TreeCleanup
+from src.core.rename_engine import DEFAULT_CONFLICT_TEMPLATE, RenameEngine
+from src.core.job_queue import DEFAULT_MAX_ATTEMPTS, JOB_STATES, Job, JobQueue
+from src.core.job_daemon import DEFAULT_WORKERS, DaemonAlreadyRunning, JobDaemon
+from src.core.rpc_server import DEFAULT_WORKERS as RPC_WORKERS, RPCServer
+from src.core.dir_lock import DEFAULT_LOCK_TIMEOUT, LockManager, LockTimeout
+from src.core.batch import DEFAULT_BATCH_WORKERS, BatchRunner, parse_manifest
+from src.utils.metrics import STATS_FORMATS, Metrics
+from src.utils.profiling import Profiler
 from src.cli.cli_app import print_help
 
 
@@ -18,8 +44,71 @@ from src.cli.cli_app import print_help
 console = Console()
 logger = Logger()
 
+def _parse_size_option(value: Optional[str]) -> Optional[int]:
+    """Convert a size option such as '20M' to bytes for click."""
+    if value is None:
+        return None
+    try:
+        return PathUtils.parse_size(value)
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is not a valid size (e.g. 512K, 20M, 1G)")
+
+def _parse_retention_option(value: Optional[str]) -> Optional[RetentionPolicy]:
+    """Convert a retention specification such as 'last=3,daily=7' for click."""
+    if value is None:
+        return None
+    try:
+        return RetentionPolicy.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+def _write_stats(stats_format: str, stats_file: Optional[str]):
+    """Write the run's metrics for --stats."""
+    try:
+        Metrics.shared().write(stats_format, stats_file)
+    except OSError as e:
+        console.print(f"[red]Could not write stats: {str(e)}[/red]")
+        logger.error(f"Could not write stats to {stats_file}: {str(e)}")
+
+def _finish_profile(show: bool, trace_file: Optional[str], pstats_file: Optional[str]):
+    """Stop the profiler and report what --profile, --profile-trace and --profile-pstats asked for."""
+    profiler = Profiler.shared()
+    profiler.stop()
+    if show:
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Span", style="dim")
+        table.add_column("Calls", justify="right")
+        table.add_column("Total", justify="right")
+        table.add_column("Self", justify="right")
+        table.add_column("Mean", justify="right")
+        table.add_column("Max", justify="right")
+        for entry in profiler.summary():
+            table.add_row(entry.name, str(entry.calls), f"{entry.total:.3f}s", f"{entry.self_total:.3f}s",
+                          f"{entry.mean * 1000:.2f}ms", f"{entry.max * 1000:.2f}ms")
+        console.print(Panel(table, title="Profile", border_style="blue"))
+    try:
+        if trace_file:
+            profiler.write_chrome_trace(trace_file)
+            console.print(f"Trace written to {trace_file}")
+        if pstats_file:
+            profiler.write_pstats(pstats_file)
+            console.print(f"cProfile statistics written to {pstats_file}")
+    except OSError as e:
+        console.print(f"[red]Could not write profile: {str(e)}[/red]")
+
+class _LockAwareGroup(click.Group):
+    """Command group that reports a directory busy in another run instead of a traceback."""
+    
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except LockTimeout as e:
+            console.print(f"[red]{str(e)}[/red]")
+            logger.error(str(e))
+            ctx.exit(1)
+
 # Modificando o grupo principal para não exigir subcomandos
-@click.group(invoke_without_command=True, context_settings=dict(help_option_names=[]))
+@click.group(cls=_LockAwareGroup, invoke_without_command=True, context_settings=dict(help_option_names=[]))
 @click.version_option(version="1.0.0", prog_name="OnlyFiles")
 @click.option('--help', '-h', is_flag=True, help='Show this help message')
 @click.option('--directory', '-d', type=click.Path(exists=True, file_okay=False, dir_okay=True), help='Directory to work with')
@@ -33,10 +122,52 @@ logger = Logger()
 @click.option('--drives', '-v', is_flag=True, help='List available drives')
 @click.option('--logs', '-l', is_flag=True, help='View operation logs')
 @click.option('--clear-logs', '-c', is_flag=True, help='Clear operation logs')
+@click.option('--io-workers', type=click.IntRange(min=1), help='Concurrent I/O workers per device (default: tuned per device)')
+@click.option('--max-bytes-per-sec', callback=lambda ctx, param, value: _parse_size_option(value), help='Limit backup/move bandwidth (e.g. 20M)')
+@click.option('--max-files-per-sec', type=click.FloatRange(min=0, min_open=True), help='Limit backup/move file rate')
+@click.option('--nice', type=click.IntRange(min=0, max=19), help='Lower CPU priority by this niceness increment')
+@click.option('--ionice', help='I/O scheduling class: idle, best-effort[:0-7] or realtime[:0-7]')
+@click.option('--verify', is_flag=True, help='Verify copied data right after backup/move')
+@click.option('--keep', callback=lambda ctx, param, value: _parse_retention_option(value),
+              help='Prune old backups after backing up, e.g. last=3,daily=7,weekly=4,monthly=12')
+@click.option('--date-source', type=click.Choice(list(DATE_SOURCES)), default='birth', show_default=True,
+              help="Date used by -t: creation (birth) time, inode change time, modification time, or photo/video capture time")
+@click.option('--chunked', is_flag=True, help='Make an incremental, deduplicated chunked backup')
+@click.option('--archive', is_flag=True, help='Make a compressed tar archive backup')
+@click.option('--compression', type=click.Choice(list(ARCHIVE_EXTENSIONS)),
+              help='Archive compression (default: zstd if installed, else gzip)')
+@click.option('--stats', 'stats_format', type=click.Choice(list(STATS_FORMATS)),
+              help='Write run metrics (counters, phase timings, errors) when done')
+@click.option('--stats-file', type=click.Path(dir_okay=False),
+              help='File for --stats, e.g. a node exporter textfile (default: stderr)')
+@click.option('--profile', is_flag=True, help='Time each phase and show where the run spent its time')
+@click.option('--profile-trace', type=click.Path(dir_okay=False),
+              help='Write the phase timings as a Chrome trace (chrome://tracing, Perfetto)')
+@click.option('--profile-pstats', type=click.Path(dir_okay=False), help='Run cProfile and write its pstats dump')
+@click.option('--lock-timeout', type=click.FloatRange(min=0), default=DEFAULT_LOCK_TIMEOUT, show_default=True,
+              help='Seconds to wait for a directory another OnlyFiles run is using')
+@click.option('--sharded', is_flag=True, help='Organize huge flat directories in parallel shards with bounded memory')
+@click.option('--archive-to', type=click.Choice(list(ARCHIVE_FORMATS)),
+              help='Organize into one archive per category instead of subdirectories (tar uses --compression)')
+@click.option('--archive-workers', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Category archives written at the same time')
+@click.option('--cleanup', is_flag=True, help='Remove empty directories left after organizing or reverting')
+@click.option('--manifest', type=click.File('r'), help='Run the chosen operations on every directory listed in FILE')
+@click.option('--stdin', 'from_stdin', is_flag=True, help='Read the manifest from standard input')
+@click.option('--batch-workers', type=click.IntRange(min=1), default=DEFAULT_BATCH_WORKERS, show_default=True,
+              help='Manifest entries processed at the same time')
 @click.pass_context
 def cli(ctx, help: bool = False, directory: Optional[str] = None, extension: bool = False, date: bool = False, size: bool = False, 
         type: bool = False, backup: bool = False, revert: bool = False, move: bool = False, 
-        drives: bool = False, logs: bool = False, clear_logs: bool = False):
+        drives: bool = False, logs: bool = False, clear_logs: bool = False, io_workers: Optional[int] = None,
+        max_bytes_per_sec: Optional[int] = None, max_files_per_sec: Optional[float] = None,
+        nice: Optional[int] = None, ionice: Optional[str] = None, verify: bool = False,
+        keep: Optional[RetentionPolicy] = None, chunked: bool = False, archive: bool = False,
+        compression: Optional[str] = None, date_source: str = 'birth', stats_format: Optional[str] = None,
+        stats_file: Optional[str] = None, profile: bool = False, profile_trace: Optional[str] = None,
+        profile_pstats: Optional[str] = None, lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+        sharded: bool = False, archive_to: Optional[str] = None, archive_workers: int = 1, cleanup: bool = False,
+        manifest: Optional[TextIO] = None, from_stdin: bool = False, batch_workers: int = DEFAULT_BATCH_WORKERS):
     """
     Main CLI command group for OnlyFiles.
     
@@ -48,30 +179,89 @@ def cli(ctx, help: bool = False, directory: Optional[str] = None, extension: boo
     - Drive listing
     - Log management
     """
-    # Se nenhum comando foi fornecido ou --help foi especificado, mostrar a ajuda personalizada
-    if ctx.invoked_subcommand is None or help:
+    # Se --help foi especificado, mostrar a ajuda personalizada
+    if help:
         print_help()
         return
+
+    if profile or profile_trace or profile_pstats:
+        Profiler.shared().start(cprofile=bool(profile_pstats))
+        ctx.call_on_close(lambda: _finish_profile(profile, profile_trace, profile_pstats))
+
+    LockManager.shared().default_timeout = lock_timeout
+
+    if stats_format:
+        # Runs once the command, or any subcommand, has finished, even if it exits with an error
+        ctx.call_on_close(lambda: _write_stats(stats_format, stats_file))
+
+    # Subcomandos (como 'start') tratam suas próprias opções
+    if ctx.invoked_subcommand is not None:
+        return
         
     # Verifique se alguma opção foi fornecida
-    if not any([extension, date, size, type, backup, revert, move, drives, logs, clear_logs]):
+    if not any([extension, date, size, type, backup, revert, move, drives, logs, clear_logs, manifest, from_stdin]):
         # Nenhuma opção fornecida, mostrar ajuda
         print_help()
         return
 
+    if io_workers:
+        IOScheduler.shared().set_default_limit(io_workers)
+
+    if nice or ionice:
+        try:
+            if not set_process_priority(nice, ionice):
+                console.print("[yellow]Could not apply all requested process priorities[/yellow]")
+        except ValueError as e:
+            console.print(f"[red]{str(e)}[/red]")
+            return
+
+    if sharded and archive_to:
+        console.print("[red]--sharded and --archive-to cannot be combined[/red]")
+        sys.exit(2)
+    if compression and compression not in available_codecs():
+        console.print(f"[red]{compression} compression is not available (install 'zstandard')[/red]")
+        sys.exit(2)
+
+    if manifest or from_stdin:
+        if manifest and from_stdin:
+            console.print("[red]--manifest and --stdin cannot be combined[/red]")
+            sys.exit(2)
+        if move:
+            console.print("[red]-m asks for paths interactively; list moves in the manifest as JSON lines[/red]")
+            sys.exit(2)
+        backup_options = {'chunked': chunked, 'archive': archive, 'compression': compression, 'verify': verify,
+                          'keep': keep, 'max_bytes_per_sec': max_bytes_per_sec, 'max_files_per_sec': max_files_per_sec}
+        _run_batch(
+            manifest or sys.stdin, batch_workers,
+            lambda path: _operations_from_flags(path, extension, date, size, type, backup, revert, date_source,
+                                                backup_options, sharded, archive_to, archive_workers, cleanup)
+        )
+        return
+
+    throttle = None
+    if max_bytes_per_sec or max_files_per_sec:
+        throttle = Throttle(max_bytes_per_sec, max_files_per_sec)
+
     # Handle file organization operations
     if extension or date or size or type:
         if not directory:
             console.print("[red]Directory (-d) is required for organization operations[/red]")
             return
-        organize_files(directory, extension, date, size, type)
+        organize_files(directory, extension, date, size, type, date_source, sharded,
+                       archive_to, compression, archive_workers)
+        if cleanup:
+            _cleanup_directory(directory)
 
     # Handle backup operations
     if backup:
         if not directory:
             console.print("[red]Directory (-d) is required for backup operation[/red]")
             return
-        if FileOperations.create_backup(directory):
+        if chunked and archive:
+            console.print("[red]--chunked and --archive cannot be combined[/red]")
+            return
+        if FileOperations.create_backup(directory, throttle=throttle, verify=verify, retention=keep,
+                                        chunked=chunked, archive=archive, compression=compression):
             console.print(f"[green]Backup created successfully for {directory}[/green]")
             logger.info(f"Backup created for {directory}")
         else:
@@ -86,6 +276,8 @@ def cli(ctx, help: bool = False, directory: Optional[str] = None, extension: boo
         if FileOrganizer.revert_last_organization(directory):
             console.print(f"[green]Organization in {directory} reverted successfully[/green]")
             logger.info(f"Organization in {directory} reverted")
+            if cleanup:
+                _cleanup_directory(directory)
         else:
             console.print(f"[red]Failed to revert organization in {directory}[/red]")
             logger.error(f"Failed to revert organization in {directory}")
@@ -98,7 +290,7 @@ def cli(ctx, help: bool = False, directory: Optional[str] = None, extension: boo
         source, destination = PathUtils.get_paths()
         if not source or not destination:
             return
-        moved_files = FileOperations.move_files(source, destination)
+        moved_files = FileOperations.move_files(source, destination, throttle=throttle, verify=verify)
         if moved_files:
             console.print(f"[green]Successfully moved {len(moved_files)} files[/green]")
             for file in moved_files:
@@ -109,13 +301,27 @@ def cli(ctx, help: bool = False, directory: Optional[str] = None, extension: boo
 
     # Handle drive listing operations
     if drives:
-        drives_list = DriveOperations.get_available_drives()
+        drives_list = DriveOperations.get_drive_details()
         table = Table(show_header=True, header_style="bold magenta")
         table.add_column("Drive", style="dim")
+        table.add_column("Device")
+        table.add_column("Type")
+        table.add_column("Media")
+        table.add_column("Size", justify="right")
+        table.add_column("Free", justify="right")
         table.add_column("Status")
         
         for drive in drives_list:
-            table.add_row(drive, "[green]Available[/green]")
+            status = "[yellow]Read-only[/yellow]" if drive.read_only else "[green]Available[/green]"
+            table.add_row(
+                drive.mount_point,
+                drive.device,
+                drive.fs_type,
+                drive.media.upper() if drive.media in ('nvme', 'ssd', 'hdd') else drive.media,
+                PathUtils.format_size(drive.total_bytes) if drive.total_bytes else "-",
+                PathUtils.format_size(drive.free_bytes) if drive.total_bytes else "-",
+                status
+            )
         
         console.print(Panel(table, title="Available Drives", border_style="blue"))
 
@@ -144,13 +350,520 @@ def start():
     interface = TerminalInterface()
     interface.start()
 
+@cli.command(name='verify')
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('backup_path', required=False, type=click.Path(exists=True))
+@click.option('--algorithm', default=DEFAULT_ALGORITHM, show_default=True, help='hashlib algorithm to use')
+@click.option('--workers', type=click.IntRange(min=1), help='Hashing threads (default: tuned per device)')
+def verify_backup(path: str, backup_path: Optional[str], algorithm: str, workers: Optional[int]):
+    """Verify that a backup matches its source (defaults to the latest backup)."""
+    if algorithm not in hashlib.algorithms_available:
+        console.print(f"[red]Unknown hash algorithm: {algorithm}[/red]")
+        sys.exit(2)
+    
+    backup_path = backup_path or FileOperations.get_latest_backup(path)
+    if backup_path is None:
+        console.print(f"[red]No backup found for {path}[/red]")
+        sys.exit(1)
+    
+    console.print(f"Verifying [bold]{backup_path}[/bold] against [bold]{path}[/bold]...")
+    mismatches = 0
+    try:
+        for mismatch in BackupVerifier.verify(path, backup_path, algorithm, workers):
+            mismatches += 1
+            console.print(f"[red]{mismatch.status.upper():<9}[/red] {mismatch.relative_path} ({mismatch.detail})")
+    except OSError as e:
+        console.print(f"[red]Verification failed: {str(e)}[/red]")
+        logger.error(f"Verification of {backup_path} failed: {str(e)}")
+        sys.exit(1)
+    
+    if mismatches:
+        console.print(f"[red]{mismatches} difference(s) found between {path} and {backup_path}[/red]")
+        logger.warning(f"Backup {backup_path} has {mismatches} difference(s) from {path}")
+        sys.exit(1)
+    console.print(f"[green]Backup {backup_path} matches {path}[/green]")
+    logger.info(f"Backup {backup_path} verified against {path}")
+
+@cli.command()
+@click.argument('path', type=click.Path())
+@click.option('--keep', required=True, callback=lambda ctx, param, value: _parse_retention_option(value),
+              help='Backups to keep, e.g. last=3,hourly=24,daily=7,weekly=4,monthly=12')
+@click.option('--dry-run', is_flag=True, help='Only show which backups would be removed')
+def prune(path: str, keep: RetentionPolicy, dry_run: bool):
+    """Delete old backups of PATH according to a retention policy."""
+    result = BackupRetention.prune(path, keep, dry_run=dry_run)
+    
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Backup", style="dim")
+    table.add_column("Created")
+    table.add_column("Action")
+    for record in sorted(result.kept + result.removed, key=lambda r: r.created, reverse=True):
+        if record in result.kept:
+            action = "[green]keep[/green]"
+        elif dry_run:
+            action = "[yellow]would remove[/yellow]"
+        else:
+            action = "[red]removed[/red]"
+        created = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')
+        table.add_row(os.path.basename(record.path), created, action)
+    for failed_path, error in result.errors.items():
+        table.add_row(os.path.basename(failed_path), "", f"[red]failed: {error}[/red]")
+    console.print(Panel(table, title=f"Backups of {path}", border_style="blue"))
+    
+    if not dry_run:
+        logger.info(f"Pruned {len(result.removed)} backup(s) of {path}, kept {len(result.kept)}")
+    if result.errors:
+        sys.exit(1)
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('members', nargs=-1)
+def restore(path: str, members: tuple):
+    """Restore PATH, or only the given MEMBERS inside it, from its latest backup."""
+    if FileOperations.revert_to_backup(path, list(members) or None):
+        restored = ', '.join(members) if members else path
+        console.print(f"[green]Restored {restored} from the latest backup[/green]")
+        logger.info(f"Restored {restored} in {path} from the latest backup")
+    else:
+        console.print(f"[red]Failed to restore {path} from its latest backup[/red]")
+        logger.error(f"Failed to restore {path} from its latest backup")
+        sys.exit(1)
+
+@cli.command()
+@click.argument('left', type=click.Path(exists=True))
+@click.argument('right', required=False, type=click.Path(exists=True))
+@click.option('--rescan', is_flag=True, help='Re-index backups too, even if they were indexed before')
+def diff(left: str, right: Optional[str], rescan: bool):
+    """Show what changed between LEFT and RIGHT, or since LEFT's latest backup."""
+    if right is None:
+        latest = BackupIndex().latest(left, kind='copy')
+        if latest is None:
+            console.print(f"[red]No copy backup found for {left}[/red]")
+            sys.exit(2)
+        # Report what changed since the backup was made
+        left, right = latest.path, left
+    
+    for path in (left, right):
+        if path.endswith(MANIFEST_SUFFIX) or path.endswith(ARCHIVE_SUFFIXES):
+            console.print(f"[red]{path} is a chunked or archive backup; diff compares directories and copy backups[/red]")
+            sys.exit(2)
+    
+    merkle = MerkleIndex()
+    for path in (left, right):
+        # Backups never change, so their index can be trusted without walking them again
+        merkle.snapshot(path, rescan=rescan or BackupIndex.parse_backup_time(path) is None)
+    
+    changes = 0
+    colors = {'added': 'green', 'removed': 'red', 'modified': 'yellow'}
+    for change in merkle.diff(left, right):
+        changes += 1
+        suffix = os.sep if change.kind == 'd' else ''
+        color = colors[change.status]
+        console.print(f"[{color}]{change.status.upper():<9}[/{color}] {change.relative_path}{suffix}")
+    
+    if changes:
+        console.print(f"{changes} change(s) between {left} and {right}")
+        sys.exit(1)
+    console.print(f"[green]No changes between {left} and {right}[/green]")
+
+@cli.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False, dir_okay=True))
+@click.argument('template')
+@click.option('--match', help='Only rename files matching this glob, e.g. "*.jpg"')
+@click.option('--start', type=int, default=1, show_default=True, help='First value of {index}')
+@click.option('--on-conflict', default=DEFAULT_CONFLICT_TEMPLATE, show_default=True,
+              help='Name used when the new name is taken')
+@click.option('--dry-run', is_flag=True, help='Only show the new names')
+def rename(directory: str, template: str, match: Optional[str], start: int, on_conflict: str, dry_run: bool):
+    """
+    Rename the files in DIRECTORY after TEMPLATE.
+    
+    Tokens: {name} {stem} {ext} {index} {date} {hash} {parent}, with Python
+    format specs, e.g. "{date:%Y%m%d}_{index:05d}{ext}" or "{hash:.12}{ext}".
+    """
+    # Held from planning to applying, so nothing renames or adds files in between
+    with LockManager.shared().acquire(directory, exclusive=not dry_run, purpose='rename'):
+        try:
+            operations = RenameEngine.plan(directory, template, match, start, on_conflict)
+        except (OSError, ValueError) as e:
+            console.print(f"[red]{str(e)}[/red]")
+            sys.exit(2)
+        if not dry_run:
+            applied, errors = RenameEngine.apply(operations)
+    
+    if dry_run:
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Current Name", style="dim")
+        table.add_column("New Name")
+        for op in operations[:50]:
+            table.add_row(os.path.basename(op.source), os.path.basename(op.destination))
+        if len(operations) > 50:
+            table.add_row(f"... and {len(operations) - 50} more", "")
+        console.print(Panel(table, title=f"Renames planned in {directory}", border_style="blue"))
+        return
+    
+    for source, error in errors.items():
+        console.print(f"[red]Failed to rename {os.path.basename(source)}: {error}[/red]")
+    console.print(f"[green]Renamed {len(applied)} file(s) in {directory}[/green]")
+    logger.info(f"Renamed {len(applied)} file(s) in {directory} using '{template}'")
+    if errors:
+        logger.error(f"{len(errors)} rename(s) failed in {directory}")
+        sys.exit(1)
+
+@cli.command()
+@click.argument('root', type=click.Path(exists=True, file_okay=False, dir_okay=True))
+@click.argument('expression', nargs=-1)
+@click.option('--live', is_flag=True, help='Scan ROOT now instead of answering from the index')
+@click.option('--json', 'as_json', is_flag=True, help='Write one JSON record per file instead of its path')
+@click.option('--limit', type=click.IntRange(min=1), help='Stop after this many files')
+@click.option('--move-to', type=click.Path(exists=True, file_okay=False), help='Move the matching files here')
+@click.option('--organize', 'organize_by', type=click.Choice(list(ORGANIZE_METHODS)),
+              help='Organize the matching files within their directories')
+@click.option('--date-source', type=click.Choice(list(DATE_SOURCES)), default='birth', show_default=True,
+              help='Date used by --organize date')
+@click.option('--backup', is_flag=True, help='Back up each matching file')
+def query(root: str, expression: Tuple[str, ...], live: bool, as_json: bool, limit: Optional[int],
+          move_to: Optional[str], organize_by: Optional[str], date_source: str, backup: bool):
+    """
+    List the files under ROOT matching EXPRESSION, or act on them.
+    
+    Terms: ext:pdf,docx  category:images  size>50M  size:1M..1G
+    mtime:2024  mtime>=2024-06  mtime:last-year  ctime:today  age<30d
+    name:'*.tmp'  path:'*/reports/*'; combine with or, not and ( ).
+    Quote terms containing > or < for the shell.
+    
+    Answers come from the metadata index (~/.onlyfiles/metadata.db);
+    ROOT is scanned first if the index has never covered it, and --live
+    always rescans, streaming matches as they are found.
+    """
+    try:
+        predicate = parse_query(' '.join(expression))
+    except QueryError as e:
+        console.print(f"[red]{str(e)}[/red]")
+        sys.exit(2)
+    if sum(bool(action) for action in (move_to, organize_by, backup)) > 1:
+        console.print("[red]Choose one of --move-to, --organize and --backup[/red]")
+        sys.exit(2)
+    
+    index = MetadataIndex()
+    scanned = index.scanned_at(root)
+    if live or scanned is None:
+        records = index.scan(root, predicate)
+    else:
+        records = index.query(root, predicate)
+        Console(stderr=True).print(
+            f"[dim]From the index of {datetime.fromtimestamp(scanned):%Y-%m-%d %H:%M}; --live rescans[/dim]"
+        )
+    if limit:
+        records = itertools.islice(records, limit)
+    
+    if not (move_to or organize_by or backup):
+        # Results own stdout, so they can be piped into other tools
+        for record in records:
+            sys.stdout.write((json.dumps(record.to_dict()) if as_json else record.path) + '\n')
+        sys.stdout.flush()
+        return
+    
+    paths = [record.path for record in records]
+    if not paths:
+        console.print("[yellow]No files match[/yellow]")
+        return
+    if move_to:
+        moved = FileOperations.move_paths(paths, move_to)
+        console.print(f"[green]Moved {len(moved)} of {len(paths)} matching file(s) to {move_to}[/green]")
+        logger.info(f"Moved {len(moved)} file(s) matching '{' '.join(expression)}' under {root} to {move_to}")
+        failed = len(paths) - len(moved)
+    elif organize_by:
+        organized = FileOrganizer.organize_paths(paths, organize_by, date_source)
+        _display_organization_results(organize_by.capitalize(), organized)
+        failed = len(paths) - sum(len(files) for files in organized.values())
+    else:
+        failed = 0
+        for path in paths:
+            if FileOperations.create_backup(path):
+                logger.info(f"Backup created for {path}")
+            else:
+                failed += 1
+                console.print(f"[red]Failed to create backup for {path}[/red]")
+                logger.error(f"Failed to create backup for {path}")
+        console.print(f"[green]Backed up {len(paths) - failed} of {len(paths)} matching file(s)[/green]")
+    
+    # Keep later queries right about the files that were just moved or added
+    touched = {os.path.dirname(path) for path in paths} | ({os.path.abspath(move_to)} if move_to else set())
+    for directory in sorted(touched):
+        covered = any(directory.startswith(os.path.join(other, '')) for other in touched)
+        if not covered and index.scanned_at(directory) is not None:
+            index.refresh(directory)
+    if failed:
+        sys.exit(1)
+
+@cli.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False, dir_okay=True))
+@click.option('--dry-run', is_flag=True, help='Only show which directories would be removed')
+@click.option('--include-hidden', is_flag=True, help="Also remove empty directories whose names start with '.'")
+def cleanup(directory: str, dry_run: bool, include_hidden: bool):
+    """Remove the empty directories below DIRECTORY, deepest first."""
+    report = TreeCleanup.remove_empty(directory, dry_run, include_hidden)
+    if not report.empty:
+        console.print(f"[green]No empty directories below {directory}[/green]")
+        return
+    
+    if dry_run:
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Empty Directory", style="dim")
+        table.add_column("Directories", justify="right")
+        counts = {top: 0 for top in report.tops}
+        for path in report.empty:
+            # Every empty directory is the top of its subtree or inside one
+            top = path
+            while top not in counts:
+                top = os.path.dirname(top)
+            counts[top] += 1
+        for top in report.tops[:50]:
+            table.add_row(os.path.relpath(top, directory), str(counts[top]))
+        if len(report.tops) > 50:
+            table.add_row(f"... and {len(report.tops) - 50} more", "")
+        console.print(Panel(table, title=f"Would remove {len(report.empty)} empty directories below {directory}",
+                            border_style="blue"))
+        return
+    
+    _report_cleanup(directory, report)
+    if report.errors:
+        sys.exit(1)
+
+@cli.command()
+@click.option('--directory', '-d', required=True, type=click.Path(file_okay=True, dir_okay=True),
+              help='Directory (or file, for backups) the job works on')
+@click.option('--extension', '-e', is_flag=True, help='Organize by extension')
+@click.option('--date', '-t', is_flag=True, help='Organize by date')
+@click.option('--size', '-s', is_flag=True, help='Organize by size')
+@click.option('--type', '-y', 'by_type', is_flag=True, help='Organize by type')
+@click.option('--backup', '-b', is_flag=True, help='Create a backup')
+@click.option('--revert', '-r', is_flag=True, help='Revert the last organization')
+@click.option('--move-to', type=click.Path(file_okay=False), help='Move the directory\'s files here')
+@click.option('--pattern', help='Only move files ending with this, e.g. ".txt"')
+@click.option('--date-source', type=click.Choice(list(DATE_SOURCES)), default='birth', show_default=True,
+              help='Date used by -t')
+@click.option('--chunked', is_flag=True, help='Make an incremental, deduplicated chunked backup')
+@click.option('--archive', is_flag=True, help='Make a compressed tar archive backup')
+@click.option('--compression', type=click.Choice(list(ARCHIVE_EXTENSIONS)), help='Archive compression')
+@click.option('--verify', is_flag=True, help='Verify copied data right after backup/move')
+@click.option('--keep', help='Prune old backups after backing up, e.g. last=3,daily=7')
+@click.option('--max-bytes-per-sec', callback=lambda ctx, param, value: _parse_size_option(value),
+              help='Limit backup/move bandwidth (e.g. 20M)')
+@click.option('--max-files-per-sec', type=click.FloatRange(min=0, min_open=True), help='Limit backup/move file rate')
+@click.option('--priority', type=int, default=0, show_default=True, help='Jobs with higher priority run first')
+@click.option('--attempts', type=click.IntRange(min=1), default=DEFAULT_MAX_ATTEMPTS, show_default=True,
+              help='Times a failing job is tried')
+def submit(directory: str, extension: bool, date: bool, size: bool, by_type: bool, backup: bool, revert: bool,
+           move_to: Optional[str], pattern: Optional[str], date_source: str, chunked: bool, archive: bool,
+           compression: Optional[str], verify: bool, keep: Optional[str], max_bytes_per_sec: Optional[int],
+           max_files_per_sec: Optional[float], priority: int, attempts: int):
+    """Queue jobs for the daemon instead of running them now."""
+    if keep:
+        _parse_retention_option(keep)
+    if chunked and archive:
+        console.print("[red]--chunked and --archive cannot be combined[/red]")
+        sys.exit(2)
+    
+    limits = {'max_bytes_per_sec': max_bytes_per_sec, 'max_files_per_sec': max_files_per_sec}
+    jobs = _operations_from_flags(directory, extension, date, size, by_type, backup, revert, date_source,
+                                  {'chunked': chunked, 'archive': archive, 'compression': compression,
+                                   'verify': verify, 'keep': keep, **limits})
+    if move_to:
+        jobs.append(('move', {'source': directory, 'destination': move_to, 'pattern': pattern,
+                              'verify': verify, **limits}))
+    if not jobs:
+        console.print("[yellow]Nothing to submit: choose -e, -t, -s, -y, -b, -r or --move-to[/yellow]")
+        sys.exit(2)
+    
+    queue = JobQueue()
+    for operation, params in jobs:
+        job_id = queue.submit(operation, params, priority, attempts)
+        console.print(f"[green]Queued job {job_id}[/green]: {operation} {directory}")
+        logger.info(f"Queued job {job_id}: {operation} {directory}")
+
+@cli.command()
+@click.option('--status', type=click.Choice(list(JOB_STATES)), help='Only show jobs in this state')
+@click.option('--limit', type=click.IntRange(min=1), default=20, show_default=True, help='Jobs to show')
+@click.option('--cancel', 'cancel_id', type=int, help='Cancel a queued or running job')
+def jobs(status: Optional[str], limit: int, cancel_id: Optional[int]):
+    """Show queued, running and finished jobs."""
+    queue = JobQueue()
+    if cancel_id is not None:
+        if queue.cancel(cancel_id):
+            console.print(f"[green]Job {cancel_id} cancelled[/green]")
+            logger.info(f"Cancelled job {cancel_id}")
+            return
+        console.print(f"[red]Job {cancel_id} is not queued or running[/red]")
+        sys.exit(1)
+    
+    colors = {'queued': 'yellow', 'running': 'cyan', 'done': 'green', 'failed': 'red', 'cancelled': 'dim'}
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Id", justify="right")
+    table.add_column("Operation")
+    table.add_column("Target", style="dim")
+    table.add_column("Pri", justify="right")
+    table.add_column("Status")
+    table.add_column("Progress", justify="right")
+    table.add_column("Details")
+    for job in queue.list_jobs(status, limit):
+        progress = f"{job.completed}/{job.total}" if job.total else ""
+        if job.error:
+            details = job.error
+        else:
+            # Nested results (e.g. files per category) are too long for the table
+            details = ', '.join(f"{k}={v}" for k, v in (job.result or {}).items() if not isinstance(v, dict))
+        color = colors[job.status]
+        table.add_row(str(job.id), job.operation, '\n'.join(job.targets), str(job.priority),
+                      f"[{color}]{job.status}[/{color}] {job.attempts}/{job.max_attempts}", progress, details)
+    counts = queue.counts()
+    summary = ', '.join(f"{counts.get(state, 0)} {state}" for state in JOB_STATES)
+    console.print(Panel(table, title=f"Jobs ({summary})", border_style="blue"))
+
+@cli.command()
+@click.option('--workers', type=click.IntRange(min=1), default=DEFAULT_WORKERS, show_default=True,
+              help='Jobs run at the same time')
+@click.option('--drain', is_flag=True, help='Exit once the queue is empty instead of waiting for new jobs')
+def daemon(workers: int, drain: bool):
+    """Run queued jobs in one long-lived process."""
+    def on_event(job: Job, event: str):
+        colors = {'started': 'cyan', 'done': 'green', 'retry': 'yellow', 'failed': 'red', 'cancelled': 'yellow'}
+        target = ', '.join(job.targets)
+        detail = f" ({job.error})" if event in ('retry', 'failed') and job.error else ""
+        console.print(f"[{colors[event]}]{event.upper():<9}[/{colors[event]}] job {job.id} {job.operation} {target}{detail}")
+        if event in ('done', 'cancelled'):
+            logger.info(f"Job {job.id} {event}: {job.operation} {target}")
+        elif event in ('retry', 'failed'):
+            logger.error(f"Job {job.id} {event}: {job.operation} {target}: {job.error}")
+    
+    job_daemon = JobDaemon(JobQueue(), workers, on_event)
+    console.print(f"Serving jobs with {workers} worker(s){' until the queue is empty' if drain else ''}; Ctrl-C to stop")
+    try:
+        job_daemon.run(drain=drain)
+    except DaemonAlreadyRunning as e:
+        console.print(f"[red]{str(e)}[/red]")
+        sys.exit(1)
+
+@cli.command()
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              help='Unix socket to listen on (default: ~/.onlyfiles/onlyfiles.sock)')
+@click.option('--workers', type=click.IntRange(min=1), default=RPC_WORKERS, show_default=True,
+              help='Requests run at the same time')
+def serve(socket_path: Optional[str], workers: int):
+    """Serve operations as JSON-RPC over a Unix socket."""
+    def on_request(method: str, params: dict, error: Optional[str]):
+        target = params.get('directory') or params.get('path') or params.get('source') or ''
+        if error:
+            logger.error(f"RPC {method} {target} failed: {error}")
+        elif method not in ('ping', 'logs', 'analyze'):
+            logger.info(f"RPC {method} {target}")
+    
+    server = RPCServer(socket_path, workers, on_request)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: server.shutdown())
+    try:
+        server.bind()
+    except OSError as e:
+        console.print(f"[red]{str(e)}[/red]")
+        sys.exit(1)
+    console.print(f"Serving JSON-RPC on {server.socket_path} with {workers} worker(s); Ctrl-C to stop")
+    server.serve_forever()
+
+def _operations_from_flags(directory: str, extension: bool, date: bool, size: bool, by_type: bool, backup: bool,
+                           revert: bool, date_source: str, backup_options: Dict[str, Any],
+                           sharded: bool = False, archive_to: Optional[str] = None,
+                           archive_workers: int = 1, cleanup: bool = False) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Translate the organize/backup/revert flags into named operations, in the order the CLI runs them.
+    
+    Args:
+        directory: Directory (or file, for backups) to work on
+        extension: Organize by extension
+        date: Organize by date
+        size: Organize by size
+        by_type: Organize by type
+        backup: Create a backup
+        revert: Revert the last organization
+        date_source: Date used when organizing by date
+        backup_options: Extra backup parameters (chunked, archive, keep, limits, ...)
+        sharded: Organize in parallel shards
+        archive_to: Organize into 'tar' or 'zip' archives, compressed as backup_options['compression'] says
+        archive_workers: Category archives written at the same time
+        cleanup: Remove empty directories after organizing or reverting
+        
+    Returns:
+        List[Tuple[str, Dict[str, Any]]]: (operation, parameters) pairs for run_operation or the job queue
+    """
+    operations = []
+    for flag, by in ((extension, 'extension'), (date, 'date'), (size, 'size'), (by_type, 'type')):
+        if flag:
+            params = {'directory': directory, 'by': by, 'date_source': date_source, 'sharded': sharded,
+                      'cleanup': cleanup}
+            if archive_to:
+                params.update(archive_to=archive_to, compression=backup_options.get('compression'),
+                              archive_workers=archive_workers)
+            operations.append(('organize', params))
+    if backup:
+        operations.append(('backup', {'path': directory, **backup_options}))
+    if revert:
+        operations.append(('revert-organization', {'directory': directory, 'cleanup': cleanup}))
+    return operations
+
+def _run_batch(lines: TextIO, workers: int, default_operations):
+    """
+    Run a manifest in this process, writing one JSON result per operation to stdout.
+    
+    Args:
+        lines: Manifest to read
+        workers: Manifest entries processed at the same time
+        default_operations: Builds the operations for a plain path line
+    """
+    output_lock = threading.Lock()
+    
+    def on_result(record: Dict[str, Any]):
+        if record['status'] == 'ok':
+            logger.info(f"Batch line {record['line']}: {record['operation']} {record['target']} done")
+        elif record['status'] == 'failed':
+            logger.error(f"Batch line {record['line']}: {record['operation'] or 'entry'} {record['target']} failed: "
+                         f"{record['error']}")
+        with output_lock:
+            sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+    
+    start = time.perf_counter()
+    with logger.batch():
+        counts = BatchRunner(workers, on_result).run(parse_manifest(lines, default_operations))
+    elapsed = time.perf_counter() - start
+    # Results own stdout; the summary goes to stderr
+    Console(stderr=True).print(
+        f"Batch finished in {elapsed:.1f}s: [green]{counts['ok']} ok[/green], "
+        f"[red]{counts['failed']} failed[/red], [yellow]{counts['skipped']} skipped[/yellow]"
+    )
+    if counts['failed']:
+        sys.exit(1)
+
+def _cleanup_directory(directory: str):
+    """Remove the empty directories below a directory after organizing or reverting it, for --cleanup."""
+    _report_cleanup(directory, TreeCleanup.remove_empty(directory))
+
+def _report_cleanup(directory: str, report: CleanupReport):
+    """Print and log what a cleanup removed and what it could not."""
+    for path, error in report.errors.items():
+        console.print(f"[red]Could not remove {path}: {error}[/red]")
+    if report.removed:
+        console.print(f"[green]Removed {len(report.removed)} empty directories below {directory}[/green]")
+        logger.info(f"Removed {len(report.removed)} empty directories below {directory}")
+    if report.errors:
+        logger.error(f"{len(report.errors)} empty directories below {directory} could not be removed")
+
 def _display_organization_results(title: str, organized_files: dict):
     """
     Helper function to display organization results in a table.
     
     Args:
         title: Title for the results table
-        organized_files: Dictionary with organization results
+        organized_files: Dictionary with organization results, moved files or their count per key
     """
     if not any(organized_files.values()):
         console.print(f"[yellow]No files were organized by {title.lower()}[/yellow]")
@@ -162,12 +875,14 @@ def _display_organization_results(title: str, organized_files: dict):
     
     for key, files in organized_files.items():
         if files:  # Only show categories that have files
-            table.add_row(key, str(len(files)))
+            table.add_row(key, str(files if isinstance(files, int) else len(files)))
     
     console.print(Panel(table, title=f"Files Organized by {title}", border_style="blue"))
     logger.info(f"Organized files by {title.lower()}")
 
-def organize_files(directory: str, extension: bool, date: bool, size: bool, type: bool):
+def organize_files(directory: str, extension: bool, date: bool, size: bool, type: bool,
+                   date_source: str = 'birth', sharded: bool = False, archive_to: Optional[str] = None,
+                   compression: Optional[str] = None, archive_workers: int = 1):
     """
     Helper function to organize files based on specified criteria.
     
@@ -177,13 +892,33 @@ def organize_files(directory: str, extension: bool, date: bool, size: bool, type
         date: Whether to organize by date
         size: Whether to organize by size
         type: Whether to organize by type
+        date_source: Date used when organizing by date ('birth', 'ctime', 'mtime' or 'capture')
+        sharded: Stream the directory in shards to parallel workers, for huge flat directories
+        archive_to: Write each category into a 'tar' or 'zip' archive instead of a subdirectory
+        compression: Tar archive compression codec
+        archive_workers: Category archives written at the same time
     """
+    titles = (('extension', extension, "Extension"), ('date', date, "Date"),
+              ('size', size, "Size Category"), ('type', type, "File Type"))
+    if archive_to:
+        for by, chosen, title in titles:
+            if chosen:
+                _display_organization_results(title, FileOrganizer.organize_to_archives(
+                    directory, by, date_source, archive_to, compression, archive_workers))
+        return
+    
+    if sharded:
+        for by, chosen, title in titles:
+            if chosen:
+                _display_organization_results(title, FileOrganizer.organize_sharded(directory, by, date_source))
+        return
+    
     if extension:
         organized_files = FileOrganizer.organize_by_extension(directory)
         _display_organization_results("Extension", organized_files)
     
     if date:
-        organized_files = FileOrganizer.organize_by_date(directory)
+        organized_files = FileOrganizer.organize_by_date(directory, date_source)
         _display_organization_results("Date", organized_files)
     
     if size:
@@ -1,15 +1,25 @@
 import os
 import sys
+import threading
+import time
+from typing import Dict, List
 from rich.console import Console
 from rich.panel import Panel
+from rich.progress import BarColumn, Progress, TextColumn, TimeRemainingColumn
+from rich.table import Table
 from src.core.file_organizer import FileOrganizer
 from src.utils.logging import Logger
 from src.utils.file_navigator import FileNavigator
+from src.utils.keyboard import ESCAPE, KeyReader
+from src.utils.path_utils import PathUtils
 from src.core.file_operations import FileOperations
 
 console = Console()
 logger = Logger()
 
+# Seconds between refreshes of the progress display
+REFRESH_INTERVAL = 0.1
+
 class TerminalInterface:
     """Provides a terminal-based user interface for file organization operations."""
     
@@ -71,15 +81,124 @@ class TerminalInterface:
         """Organizes files in the current directory."""
         console.print(f"\n[bold]Organizing files in:[/bold] {self.current_path}")
         try:
-            FileOrganizer.organize_directory(self.current_path)
-            console.print("[green]Files organized successfully![/green]")
-            logger.info(f"Files organized in: {self.current_path}")
+            self.organize_with_progress(self.current_path)
         except Exception as e:
             error_msg = f"Error organizing files: {str(e)}"
             console.print(f"[red]{error_msg}[/red]")
             logger.error(error_msg)
         input("\nPress Enter to continue...")
 
+    def organize_with_progress(self, directory: str):
+        """
+        Organizes a directory on a background thread while showing live progress.
+        
+        Esc (or Ctrl-C) stops the run at the next file boundary; files
+        already moved stay organized. A summary is shown when the run ends.
+        
+        Args:
+            directory: Directory to organize
+        """
+        # Sizes of the files about to be moved, to turn file progress into bytes/s
+        sizes: Dict[str, int] = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        sizes[entry.path] = entry.stat().st_size
+                except OSError:
+                    continue
+        
+        state = {'completed': 0, 'total': len(sizes), 'bytes': 0}
+        state_lock = threading.Lock()
+        cancel = threading.Event()
+        outcome = {}
+        
+        def progress(completed: int, total: int, path: str):
+            # Called from the I/O scheduler's worker threads
+            with state_lock:
+                state['completed'] = max(state['completed'], completed)
+                state['total'] = total
+                state['bytes'] += sizes.get(path, 0)
+        
+        def work():
+            try:
+                outcome['result'] = FileOrganizer.organize_directory(directory, progress, cancel)
+            except Exception as e:
+                outcome['error'] = e
+        
+        worker = threading.Thread(target=work, name="onlyfiles-organize", daemon=True)
+        bar = Progress(
+            TextColumn("[bold blue]{task.description}"),
+            BarColumn(),
+            TextColumn("{task.fields[files]} files"),
+            TextColumn("{task.fields[file_rate]} files/s"),
+            TextColumn("{task.fields[byte_rate]}/s"),
+            TimeRemainingColumn(),
+            console=console,
+        )
+        task = bar.add_task("Organizing", total=max(1, len(sizes)), files=f"0/{len(sizes)}",
+                            file_rate="0", byte_rate="0 B")
+        console.print("[dim]Press Esc to cancel[/dim]")
+        
+        started = time.monotonic()
+        with KeyReader() as keys, bar:
+            worker.start()
+            while worker.is_alive():
+                try:
+                    key = keys.poll(REFRESH_INTERVAL)
+                except KeyboardInterrupt:
+                    key = ESCAPE
+                if key == ESCAPE and not cancel.is_set():
+                    cancel.set()
+                    bar.update(task, description="Cancelling")
+                self._update_progress(bar, task, state, state_lock, started)
+            worker.join()
+            self._update_progress(bar, task, state, state_lock, started)
+        
+        if 'error' in outcome:
+            raise outcome['error']
+        self._display_organize_summary(directory, outcome['result'], state, time.monotonic() - started,
+                                       cancel.is_set())
+
+    @staticmethod
+    def _update_progress(bar: Progress, task, state: Dict[str, int], state_lock: threading.Lock, started: float):
+        """Copies the worker's progress into the live display."""
+        with state_lock:
+            completed, total, moved_bytes = state['completed'], state['total'], state['bytes']
+        elapsed = max(time.monotonic() - started, 1e-6)
+        bar.update(task, completed=completed, total=max(1, total), files=f"{completed}/{total}",
+                   file_rate=f"{completed / elapsed:.0f}", byte_rate=PathUtils.format_size(moved_bytes / elapsed))
+
+    @staticmethod
+    def _display_organize_summary(directory: str, organized: Dict[str, List[str]], state: Dict[str, int],
+                                  elapsed: float, cancelled: bool):
+        """Shows what an organize run did and how fast it went."""
+        moved = sum(len(files) for files in organized.values())
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Category", style="dim")
+        table.add_column("Files Moved", justify="right")
+        for category, files in organized.items():
+            if files:
+                table.add_row(category, str(len(files)))
+        
+        elapsed = max(elapsed, 1e-6)
+        lines = [
+            f"Moved {moved} of {state['total']} files ({PathUtils.format_size(state['bytes'])}) in {elapsed:.1f}s",
+            f"{moved / elapsed:.0f} files/s, {PathUtils.format_size(state['bytes'] / elapsed)}/s",
+        ]
+        if cancelled:
+            lines.append(f"[yellow]Cancelled: {state['total'] - moved} files left in place[/yellow]")
+        elif moved < state['total']:
+            lines.append(f"[red]{state['total'] - moved} files could not be moved[/red]")
+        
+        console.print(table if moved else "[yellow]No files were moved[/yellow]")
+        console.print(Panel("\n".join(lines), title="Organization Summary",
+                            border_style="yellow" if cancelled else "green"))
+        if cancelled:
+            logger.warning(f"Organization of {directory} cancelled after {moved} files")
+        else:
+            logger.info(f"Files organized in: {directory} ({moved} moved)")
+
     def organize_other_directory(self):
         """Organizes files in another directory."""
         self.clear_screen()
@@ -92,9 +211,7 @@ class TerminalInterface:
             
         try:
             console.print(f"\n[bold]Organizing files in:[/bold] {selected_path}")
-            FileOrganizer.organize_directory(selected_path)
-            console.print("[green]Files organized successfully![/green]")
-            logger.info(f"Files organized in: {selected_path}")
+            self.organize_with_progress(selected_path)
         except Exception as e:
             error_msg = f"Error: {str(e)}"
             console.print(f"[red]{error_msg}[/red]")
@@ -0,0 +1,529 @@
+import bisect
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import stat
+import tarfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core.backup_index import ARCHIVE_INDEX_SUFFIX
+from src.core.backup_verifier import BackupVerifier, VerifyMismatch
+from src.core.io_scheduler import OperationCancelled, ProgressCallback
+from src.core.throttle import Throttle
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+INDEX_FORMAT = "onlyfiles-archive"
+INDEX_VERSION = 1
+
+# Uncompressed bytes per independently compressed block
+BLOCK_SIZE = 4 * 1024 * 1024
+TAR_COPY_BUFFER_SIZE = 1024 * 1024
+
+ARCHIVE_EXTENSIONS = {'gzip': '.tar.gz', 'xz': '.tar.xz', 'zstd': '.tar.zst'}
+
+
+def available_codecs() -> List[str]:
+    """Return the compression codecs usable in this environment."""
+    return [codec for codec in ARCHIVE_EXTENSIONS if codec != 'zstd' or zstandard is not None]
+
+
+def default_codec() -> str:
+    """Prefer zstd when it is installed, as it compresses fastest at a good ratio."""
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def _compressor(codec: str) -> Callable[[bytes], bytes]:
+    """
+    Return a function compressing one block into a self-contained frame.
+
+    Concatenated gzip members, xz streams and zstd frames are each valid
+    files of their format, so the archive stays readable by standard tools.
+    """
+    if codec == 'gzip':
+        def compress(data: bytes) -> bytes:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            return compressor.compress(data) + compressor.flush()
+        return compress
+    if codec == 'xz':
+        return lambda data: lzma.compress(data, format=lzma.FORMAT_XZ, preset=6)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        return lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unknown compression codec '{codec}'")
+
+
+def _decompressor(codec: str) -> Callable[[bytes], bytes]:
+    """Return a function decompressing one block written by _compressor."""
+    if codec == 'gzip':
+        return gzip.decompress
+    if codec == 'xz':
+        return lzma.decompress
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading zstd archives requires the 'zstandard' package")
+        return lambda data: zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression codec '{codec}'")
+
+
+class _BlockWriter:
+    """
+    File-like sink that compresses fixed-size blocks on a thread pool.
+
+    zlib, lzma and zstd release the GIL while compressing, so blocks are
+    compressed on all cores while tarfile keeps producing data. Finished
+    blocks are written in order, with a bounded number in flight.
+    """
+
+    def __init__(self, out, codec: str, workers: int, throttle: Optional[Throttle] = None):
+        self._out = out
+        self._compress = _compressor(codec)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-compress")
+        self._in_flight: Deque[Tuple[int, int, Future]] = deque()
+        self._max_in_flight = workers * 2
+        self._throttle = throttle
+        self._buffer = bytearray()
+        self._raw_offset = 0
+        self._compressed_offset = 0
+        self.blocks: List[List[int]] = []
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if self._throttle is not None:
+            self._throttle.data(len(data))
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._raw_offset + len(self._buffer)
+
+    def close(self):
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._in_flight:
+            self._drain()
+        self._executor.shutdown()
+
+    def _submit(self, block: bytes):
+        self._in_flight.append((self._raw_offset, len(block), self._executor.submit(self._compress, block)))
+        self._raw_offset += len(block)
+        while len(self._in_flight) > self._max_in_flight:
+            self._drain()
+
+    def _drain(self):
+        raw_offset, raw_size, future = self._in_flight.popleft()
+        compressed = future.result()
+        self._out.write(compressed)
+        self.blocks.append([raw_offset, raw_size, self._compressed_offset, len(compressed)])
+        self._compressed_offset += len(compressed)
+
+
+class _BlockReader:
+    """
+    Seekable, read-only view of the uncompressed archive.
+
+    Only the blocks covering the requested range are decompressed; while
+    reading sequentially the next few blocks are decompressed ahead on a
+    thread pool.
+    """
+
+    def __init__(self, path: str, index: dict, readahead: int = 0):
+        self._f = open(path, 'rb')
+        self._decompress = _decompressor(index['codec'])
+        self._blocks = index['blocks']
+        self._starts = [block[0] for block in self._blocks]
+        self._size = sum(block[1] for block in self._blocks)
+        self._position = 0
+        self._cache: Dict[int, Future] = {}
+        self._readahead = readahead
+        self._executor = ThreadPoolExecutor(max_workers=max(1, readahead), thread_name_prefix="onlyfiles-decompress")
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        end = self._size if size is None or size < 0 else min(self._size, self._position + size)
+        parts = []
+        while self._position < end:
+            number = bisect.bisect_right(self._starts, self._position) - 1
+            raw_offset, raw_size = self._blocks[number][:2]
+            data = self._block(number)
+            start = self._position - raw_offset
+            stop = min(raw_size, end - raw_offset)
+            parts.append(data[start:stop])
+            self._position = raw_offset + stop
+        return b''.join(parts)
+
+    def close(self):
+        self._executor.shutdown()
+        self._f.close()
+
+    def _block(self, number: int) -> bytes:
+        for ahead in range(number, min(number + 1 + self._readahead, len(self._blocks))):
+            if ahead not in self._cache:
+                _, _, offset, size = self._blocks[ahead]
+                self._f.seek(offset)
+                compressed = self._f.read(size)
+                self._cache[ahead] = self._executor.submit(self._decompress, compressed)
+        # Blocks before the current one are not needed again when reading forwards
+        for old in [n for n in self._cache if n < number or n > number + self._readahead]:
+            del self._cache[old]
+        return self._cache[number].result()
+
+
+class ArchiveBackup:
+    """Creates, verifies and extracts compressed tar archive backups, and the archives organize writes."""
+
+    @staticmethod
+    def create(source: str, archive_path: str, codec: Optional[str] = None,
+               throttle: Optional[Throttle] = None, workers: Optional[int] = None,
+               progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None) -> Dict[str, int]:
+        """
+        Write a file or directory into a compressed tar archive.
+
+        Files are streamed straight into the tar stream and compressed in
+        independent blocks on all cores. A sidecar index records where each
+        block and each member starts, so single members can be extracted
+        later without decompressing the whole archive.
+
+        Args:
+            source: File or directory to archive
+            archive_path: Archive to write
+            codec: 'gzip', 'xz' or 'zstd', defaults to zstd when installed
+            throttle: Optional bandwidth/file-rate limits on the data archived
+            workers: Compression threads, defaults to the number of CPUs
+            progress: Called with (completed, total, path) as members are added
+            cancel: Event that stops the backup when set
+
+        Returns:
+            Dict[str, int]: Statistics: members, bytes, compressed_bytes
+
+        Raises:
+            OperationCancelled: If the backup was cancelled
+        """
+        source = os.path.abspath(source)
+        root = os.path.basename(source.rstrip(os.sep)) or '.'
+        return ArchiveBackup.write_tar(list(ArchiveBackup._walk(source, root)), archive_path, root, source,
+                                       codec, throttle, workers, progress, cancel)
+
+    @staticmethod
+    def write_tar(paths: List[Tuple[str, str]], archive_path: str, root: str, source: str,
+                  codec: Optional[str] = None, throttle: Optional[Throttle] = None, workers: Optional[int] = None,
+                  progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None,
+                  sync: bool = False) -> Dict[str, int]:
+        """
+        Write files into a compressed tar archive with a member index, as create() does.
+
+        Args:
+            paths: (path, archive name) pairs, parents before children; names start with root
+            archive_path: Archive to write
+            root: Archive name that extract() restores to its destination
+            source: Path recorded in the index as where the members came from
+            codec: 'gzip', 'xz' or 'zstd', defaults to zstd when installed
+            throttle: Optional bandwidth/file-rate limits on the data archived
+            workers: Compression threads, defaults to the number of CPUs
+            progress: Called with (completed, total, path) as members are added
+            cancel: Event that stops writing when set
+            sync: Flush the archive to disk before it is put in place, for callers that delete the sources
+
+        Returns:
+            Dict[str, int]: Statistics: members, bytes, compressed_bytes
+
+        Raises:
+            OperationCancelled: If writing was cancelled; no archive is left behind
+        """
+        codec = codec or default_codec()
+        workers = workers or os.cpu_count() or 1
+        members: Dict[str, int] = {}
+        stats = {'members': 0, 'bytes': 0, 'compressed_bytes': 0}
+
+        tmp_path = archive_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as out:
+                writer = _BlockWriter(out, codec, workers, throttle)
+                tar = tarfile.TarFile(fileobj=writer, mode='w', format=tarfile.PAX_FORMAT,
+                                      copybufsize=TAR_COPY_BUFFER_SIZE)
+                for number, (path, arcname) in enumerate(paths, 1):
+                    if cancel is not None and cancel.is_set():
+                        raise OperationCancelled()
+                    info = tar.gettarinfo(path, arcname)
+                    if info is None:
+                        # Sockets and other special files cannot be archived
+                        continue
+                    if info.islnk():
+                        # Store hard links as regular files so every member extracts on its own
+                        info.type = tarfile.REGTYPE
+                        info.linkname = ''
+                        info.size = os.lstat(path).st_size
+                    members[arcname] = tar.offset
+                    if throttle is not None:
+                        throttle.file()
+                    if info.isreg():
+                        with open(path, 'rb') as f:
+                            tar.addfile(info, f)
+                        stats['bytes'] += info.size
+                    else:
+                        tar.addfile(info)
+                    stats['members'] += 1
+                    if progress is not None:
+                        progress(number, len(paths), path)
+                tar.close()
+                writer.close()
+                if sync:
+                    out.flush()
+                    os.fsync(out.fileno())
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        stats['compressed_bytes'] = os.path.getsize(archive_path)
+        index = {
+            'format': INDEX_FORMAT,
+            'version': INDEX_VERSION,
+            'source': source,
+            'codec': codec,
+            'root': root,
+            'blocks': writer.blocks,
+            'members': members,
+        }
+        with open(archive_path + ARCHIVE_INDEX_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+        return stats
+
+    @staticmethod
+    def write_zip(paths: List[Tuple[str, str]], archive_path: str, progress: Optional[ProgressCallback] = None,
+                  cancel: Optional[threading.Event] = None, sync: bool = False, comment: bytes = b'') -> Dict[str, int]:
+        """
+        Write regular files into a deflate-compressed zip archive.
+
+        A zip's central directory already records where every member
+        starts, so any zip tool can extract single members without a
+        sidecar index.
+
+        Args:
+            paths: (path, archive name) pairs of regular files
+            archive_path: Archive to write
+            progress: Called with (completed, total, path) as members are added
+            cancel: Event that stops writing when set
+            sync: Flush the archive to disk before it is put in place, for callers that delete the sources
+            comment: Archive comment, e.g. to recognize the archive later
+
+        Returns:
+            Dict[str, int]: Statistics: members, bytes, compressed_bytes
+
+        Raises:
+            OperationCancelled: If writing was cancelled; no archive is left behind
+        """
+        stats = {'members': 0, 'bytes': 0, 'compressed_bytes': 0}
+        tmp_path = archive_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as out:
+                with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+                    archive.comment = comment
+                    for number, (path, arcname) in enumerate(paths, 1):
+                        if cancel is not None and cancel.is_set():
+                            raise OperationCancelled()
+                        archive.write(path, arcname)
+                        stats['members'] += 1
+                        stats['bytes'] += archive.getinfo(arcname).file_size
+                        if progress is not None:
+                            progress(number, len(paths), path)
+                if sync:
+                    out.flush()
+                    os.fsync(out.fileno())
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        stats['compressed_bytes'] = os.path.getsize(archive_path)
+        return stats
+
+    @staticmethod
+    def extract(archive_path: str, destination: str, members: Optional[Iterable[str]] = None,
+                progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None) -> int:
+        """
+        Extract an archive backup, or only some of its files and subtrees.
+
+        Args:
+            archive_path: Archive to extract from
+            destination: Path the archived file or directory is restored to
+            members: Optional paths relative to the archived directory; by default everything
+            progress: Called with (completed, total, path) as members are extracted
+            cancel: Event that stops the extraction when set
+
+        Returns:
+            int: Number of members extracted
+
+        Raises:
+            KeyError: If a requested member is not in the archive
+            OperationCancelled: If the extraction was cancelled
+        """
+        index = ArchiveBackup.load_index(archive_path)
+        root = index['root']
+        offsets = ArchiveBackup._select(index, members)
+
+        reader = _BlockReader(archive_path, index, readahead=2 if members is None else 0)
+        try:
+            tar = tarfile.TarFile(fileobj=reader, mode='r')
+            # Opening reads the first header ahead; drop it so next() reads at the offset set below
+            tar.firstmember = None
+            reader.seek(0)
+            extract_options = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+            directories = []
+            for number, offset in enumerate(offsets, 1):
+                if cancel is not None and cancel.is_set():
+                    raise OperationCancelled()
+                tar.offset = offset
+                info = tar.next()
+                relative = os.path.relpath(info.name, root)
+                target = os.path.abspath(destination if relative == '.' else os.path.join(destination, relative))
+                if info.isdir():
+                    os.makedirs(target, exist_ok=True)
+                    directories.append((target, info))
+                else:
+                    if os.path.lexists(target) and not os.path.isdir(target):
+                        os.remove(target)
+                    # Extract under the target's own name, so the restored path need not match the archived one
+                    info.name = os.path.basename(target)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    tar.extract(info, path=os.path.dirname(target), **extract_options)
+                if progress is not None:
+                    progress(number, len(offsets), target)
+
+            # Set directory metadata last, as creating their contents changed it
+            for target, info in reversed(directories):
+                os.chmod(target, info.mode)
+                os.utime(target, (info.mtime, info.mtime))
+            return len(offsets)
+        finally:
+            reader.close()
+
+    @staticmethod
+    def verify(source: str, archive_path: str, algorithm: str = 'blake2b',
+               workers: int = 1) -> Iterator[VerifyMismatch]:
+        """
+        Compare a file or directory with an archive backup of it.
+
+        The archive is read sequentially, decompressing ahead on a thread
+        pool, while the source files are hashed concurrently.
+
+        Args:
+            source: Original file or directory
+            archive_path: Archive backup to check
+            algorithm: Any hashlib algorithm name
+            workers: Threads used to hash source files
+
+        Returns:
+            Iterator[VerifyMismatch]: Every missing, extra, modified or unreadable file
+        """
+        index = ArchiveBackup.load_index(archive_path)
+        root = index['root']
+        archived = set()
+        reader = _BlockReader(archive_path, index, readahead=max(2, workers))
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="onlyfiles-verify") as executor:
+                tar = tarfile.TarFile(fileobj=reader, mode='r')
+                for info in tar:
+                    if not info.isreg():
+                        continue
+                    relative = os.path.relpath(info.name, root)
+                    archived.add(relative)
+                    path = source if relative == '.' else os.path.join(source, relative)
+                    try:
+                        size = os.lstat(path).st_size
+                    except OSError:
+                        yield VerifyMismatch(relative, 'extra', 'only in backup')
+                        continue
+                    if size != info.size:
+                        yield VerifyMismatch(relative, 'modified', f"size {size} != {info.size}")
+                        continue
+                    source_hash = executor.submit(BackupVerifier.hash_file, path, algorithm)
+                    digest = hashlib.new(algorithm)
+                    member = tar.extractfile(info)
+                    for data in iter(lambda: member.read(TAR_COPY_BUFFER_SIZE), b''):
+                        digest.update(data)
+                    try:
+                        if source_hash.result() != BackupVerifier.hexdigest(digest):
+                            yield VerifyMismatch(relative, 'modified', 'content differs')
+                    except OSError as e:
+                        yield VerifyMismatch(relative, 'error', str(e))
+        finally:
+            reader.close()
+
+        for path, arcname in ArchiveBackup._walk(os.path.abspath(source), root):
+            relative = os.path.relpath(arcname, root)
+            if relative not in archived and stat.S_ISREG(os.lstat(path).st_mode):
+                yield VerifyMismatch(relative, 'missing', 'not in backup')
+
+    @staticmethod
+    def load_index(archive_path: str) -> dict:
+        """
+        Read the member and block index written next to an archive.
+
+        Raises:
+            ValueError: If the index is missing or not an archive index
+        """
+        try:
+            with open(archive_path + ARCHIVE_INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{archive_path} has no member index")
+        if index.get('format') != INDEX_FORMAT:
+            raise ValueError(f"{archive_path}{ARCHIVE_INDEX_SUFFIX} is not an archive index")
+        return index
+
+    @staticmethod
+    def _select(index: dict, members: Optional[Iterable[str]]) -> List[int]:
+        """Return the tar header offsets of the requested members, in archive order."""
+        root = index['root']
+        if members is None:
+            return sorted(index['members'].values())
+        offsets = set()
+        for member in members:
+            name = os.path.normpath(os.path.join(root, member))
+            found = False
+            for arcname, offset in index['members'].items():
+                if arcname == name or arcname.startswith(name + '/'):
+                    offsets.add(offset)
+                    found = True
+            if not found:
+                raise KeyError(f"{member} is not in the archive")
+        return sorted(offsets)
+
+    @staticmethod
+    def _walk(source: str, root: str) -> Iterator[Tuple[str, str]]:
+        """Yield (path, archive name) for a file or directory tree, parents before children."""
+        yield source, root
+        if not os.path.isdir(source) or os.path.islink(source):
+            return
+        for directory, dirs, files in os.walk(source):
+            dirs.sort()
+            relative_dir = os.path.relpath(directory, source)
+            for name in dirs + sorted(files):
+                relative = name if relative_dir == '.' else os.path.join(relative_dir, name)
+                yield os.path.join(directory, name), f"{root}/{relative.replace(os.sep, '/')}"
@@ -0,0 +1,204 @@
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from src.core.file_stat import StatCollector
+
+BACKUP_SUFFIX = ".backup_"
+# Suffix of chunked backup manifests (see src.core.chunk_store)
+MANIFEST_SUFFIX = ".chunks"
+# Archive backups (see src.core.archive_backup) and the member index kept next to each
+ARCHIVE_SUFFIXES = (".tar.gz", ".tar.xz", ".tar.zst")
+ARCHIVE_INDEX_SUFFIX = ".idx"
+BACKUP_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+@dataclass
+class BackupRecord:
+    """A backup known to the index."""
+
+    source: str
+    path: str
+    created: float
+    kind: str = 'copy'
+
+
+class BackupIndex:
+    """
+    SQLite index of the backups made for each source path.
+
+    Recording every backup as it is created lets retention and revert pick
+    backups by querying the index instead of listing the (possibly huge)
+    parent directory each time.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = db_path or Path.home() / '.onlyfiles' / 'backups.db'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS backups ("
+                " path TEXT PRIMARY KEY,"
+                " source TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " kind TEXT NOT NULL DEFAULT 'copy')"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS backups_source ON backups (source, created)")
+            conn.execute("CREATE TABLE IF NOT EXISTS scanned_sources (source TEXT PRIMARY KEY)")
+
+    def record(self, source: str, path: str, created: Optional[float] = None, kind: str = 'copy'):
+        """
+        Add a backup to the index.
+
+        Args:
+            source: Path that was backed up
+            path: Path of the backup
+            created: Creation time as a Unix timestamp, defaults to now
+            kind: Backup format
+        """
+        created = datetime.now().timestamp() if created is None else created
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO backups (path, source, created, kind) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), os.path.abspath(source), created, kind)
+            )
+
+    def list_backups(self, source: str) -> List[BackupRecord]:
+        """
+        List the backups of a source, newest first.
+
+        Backups made before the index existed are imported with a one-time
+        scan of the source's parent directory.
+
+        Args:
+            source: Path that was backed up
+
+        Returns:
+            List[BackupRecord]: Known backups of the source
+        """
+        source = os.path.abspath(source)
+        self._import_existing(source)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT source, path, created, kind FROM backups WHERE source = ? ORDER BY created DESC",
+                (source,)
+            ).fetchall()
+        return [BackupRecord(*row) for row in rows]
+
+    def latest(self, source: str, kind: Optional[str] = None) -> Optional[BackupRecord]:
+        """
+        Get the newest backup of a source that still exists.
+
+        Args:
+            source: Path that was backed up
+            kind: Only consider backups of this format
+
+        Returns:
+            Optional[BackupRecord]: The newest backup, or None if there is none
+        """
+        stale = []
+        latest = None
+        for record in self.list_backups(source):
+            if kind is not None and record.kind != kind:
+                continue
+            if os.path.lexists(record.path):
+                latest = record
+                break
+            stale.append(record.path)
+        if stale:
+            self.remove(stale)
+        return latest
+
+    def list_in_directory(self, directory: str, kind: str) -> List[BackupRecord]:
+        """
+        List the backups of one format stored directly in a directory.
+
+        Args:
+            directory: Directory holding the backups
+            kind: Backup format
+
+        Returns:
+            List[BackupRecord]: Matching backups of any source
+        """
+        directory = os.path.abspath(directory)
+        pattern = os.path.join(directory, '').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT source, path, created, kind FROM backups WHERE kind = ? AND path LIKE ? ESCAPE '\\'",
+                (kind, pattern)
+            ).fetchall()
+        return [BackupRecord(*row) for row in rows if os.path.dirname(row[1]) == directory]
+
+    def remove(self, paths: Iterable[str]):
+        """
+        Drop backups from the index.
+
+        Args:
+            paths: Paths of the backups to forget
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM backups WHERE path = ?", ((os.path.abspath(p),) for p in paths))
+
+    @staticmethod
+    def parse_backup_time(path: str) -> Optional[float]:
+        """
+        Extract the creation time encoded in a backup name.
+
+        Args:
+            path: Backup path such as 'notes.txt.backup_20240131_120000'
+
+        Returns:
+            Optional[float]: Unix timestamp, or None if the name has no timestamp
+        """
+        name = os.path.basename(path)
+        if BACKUP_SUFFIX not in name:
+            return None
+        stamp = name.rsplit(BACKUP_SUFFIX, 1)[1][:15]
+        try:
+            return datetime.strptime(stamp, BACKUP_TIMESTAMP_FORMAT).timestamp()
+        except ValueError:
+            return None
+
+    def _import_existing(self, source: str):
+        """Record backups that exist on disk but predate the index, once per source."""
+        with closing(self._connect()) as conn, conn:
+            if conn.execute("SELECT 1 FROM scanned_sources WHERE source = ?", (source,)).fetchone():
+                return
+            directory = os.path.dirname(source)
+            prefix = os.path.basename(source) + BACKUP_SUFFIX
+            rows = []
+            undated = []
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if not entry.name.startswith(prefix) or entry.name.endswith(ARCHIVE_INDEX_SUFFIX):
+                            continue
+                        if entry.name.endswith(MANIFEST_SUFFIX):
+                            kind = 'chunked'
+                        elif entry.name.endswith(ARCHIVE_SUFFIXES):
+                            kind = 'archive'
+                        else:
+                            kind = 'copy'
+                        created = self.parse_backup_time(entry.path)
+                        if created is None:
+                            undated.append((entry.path, kind))
+                        else:
+                            rows.append((entry.path, source, created, kind))
+            except OSError:
+                pass
+            if undated:
+                # Copies keep the mtime of what they copied, so only the birth time dates the backup itself
+                stats = StatCollector.collect(path for path, _ in undated)
+                rows.extend((path, source, stats[path].created, kind) for path, kind in undated if path in stats)
+            conn.executemany(
+                "INSERT OR IGNORE INTO backups (path, source, created, kind) VALUES (?, ?, ?, ?)", rows
+            )
+            conn.execute("INSERT INTO scanned_sources (source) VALUES (?)", (source,))
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; each call gets its own so threads never share one."""
+        return sqlite3.connect(str(self.db_path), timeout=30)
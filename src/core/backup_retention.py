@@ -0,0 +1,173 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.core.backup_index import ARCHIVE_INDEX_SUFFIX, BackupIndex, BackupRecord
+from src.core.io_scheduler import IOScheduler
+from src.core.merkle_index import MerkleIndex
+
+# strftime patterns that identify the period each generation keeps one backup of
+GENERATIONS = (
+    ('hourly', '%Y%m%d%H'),
+    ('daily', '%Y%m%d'),
+    ('weekly', '%G%V'),
+    ('monthly', '%Y%m'),
+)
+
+
+@dataclass
+class RetentionPolicy:
+    """How many backups to keep: the newest N plus one per recent hour/day/week/month."""
+
+    last: int = 0
+    hourly: int = 0
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+
+    @staticmethod
+    def parse(spec: str) -> "RetentionPolicy":
+        """
+        Parse a policy such as 'last=3,daily=7,weekly=4,monthly=12'.
+
+        Args:
+            spec: Comma separated generation=count pairs
+
+        Returns:
+            RetentionPolicy: The parsed policy
+
+        Raises:
+            ValueError: If the specification is malformed
+        """
+        policy = RetentionPolicy()
+        for part in filter(None, (p.strip() for p in spec.split(','))):
+            name, _, value = part.partition('=')
+            name = name.strip().lower()
+            if name not in vars(policy):
+                raise ValueError(f"Unknown retention generation '{name}'")
+            if not value.strip().isdigit():
+                raise ValueError(f"Retention count for '{name}' must be a non-negative integer")
+            setattr(policy, name, int(value))
+        if policy.is_empty():
+            raise ValueError("Retention policy must keep at least one generation")
+        return policy
+
+    def is_empty(self) -> bool:
+        """Whether the policy keeps nothing (and would therefore never be applied)."""
+        return not any(vars(self).values())
+
+    def select(self, records: List[BackupRecord]) -> List[BackupRecord]:
+        """
+        Choose which backups the policy keeps.
+
+        Args:
+            records: Backups of one source, newest first
+
+        Returns:
+            List[BackupRecord]: Backups to keep, newest first
+        """
+        if self.is_empty():
+            return list(records)
+
+        keep = {record.path for record in records[:max(self.last, 1)]}
+        for name, pattern in GENERATIONS:
+            count = getattr(self, name)
+            periods = set()
+            for record in records:
+                if len(periods) >= count:
+                    break
+                period = datetime.fromtimestamp(record.created).strftime(pattern)
+                if period not in periods:
+                    # The newest backup of each period represents it
+                    periods.add(period)
+                    keep.add(record.path)
+        return [record for record in records if record.path in keep]
+
+
+@dataclass
+class PruneResult:
+    """Outcome of applying a retention policy."""
+
+    kept: List[BackupRecord] = field(default_factory=list)
+    removed: List[BackupRecord] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class BackupRetention:
+    """Applies retention policies to the backups of a path."""
+
+    @staticmethod
+    def prune(source: str, policy: RetentionPolicy, dry_run: bool = False,
+              index: Optional[BackupIndex] = None) -> PruneResult:
+        """
+        Delete the backups of a source that the policy does not keep.
+
+        The decision comes from the backup index; only the backups being
+        removed are touched on disk, and they are deleted in parallel.
+
+        Args:
+            source: Path whose backups should be pruned
+            policy: Retention policy to apply
+            dry_run: Only report what would be removed
+            index: Backup index to use, defaults to the user's index
+
+        Returns:
+            PruneResult: Kept and removed backups, plus any deletion errors
+        """
+        index = index or BackupIndex()
+        records = index.list_backups(source)
+        kept = policy.select(records)
+        kept_paths = {record.path for record in kept}
+        doomed = [record for record in records if record.path not in kept_paths]
+        result = PruneResult(kept=kept)
+        if dry_run or not doomed:
+            result.removed = doomed
+            return result
+
+        workers = IOScheduler.shared().limit_for(os.path.dirname(os.path.abspath(source)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-prune") as executor:
+            outcomes = list(executor.map(BackupRetention._delete, doomed))
+
+        for record, error in zip(doomed, outcomes):
+            if error is None:
+                result.removed.append(record)
+            else:
+                result.errors[record.path] = error
+        index.remove(record.path for record in result.removed)
+        merkle = MerkleIndex()
+        for record in result.removed:
+            merkle.forget(record.path)
+        if any(record.kind == 'chunked' for record in result.removed):
+            BackupRetention._collect_chunks(source, result)
+        return result
+
+    @staticmethod
+    def _collect_chunks(source: str, result: PruneResult):
+        """Delete chunks no longer referenced by any chunked backup next to the source."""
+        from src.core.chunk_store import ChunkStore
+        store = ChunkStore.for_path(source)
+        try:
+            store.collect_garbage()
+        except (OSError, ValueError) as e:
+            # The removed backups are gone either way; their chunks wait for the next prune
+            result.errors[store.root] = f"Chunks not collected: {e}"
+
+    @staticmethod
+    def _delete(record: BackupRecord) -> Optional[str]:
+        """Delete one backup from disk, returning an error message on failure."""
+        try:
+            if os.path.isdir(record.path) and not os.path.islink(record.path):
+                shutil.rmtree(record.path)
+            else:
+                os.remove(record.path)
+            if record.kind == 'archive' and os.path.exists(record.path + ARCHIVE_INDEX_SUFFIX):
+                os.remove(record.path + ARCHIVE_INDEX_SUFFIX)
+            return None
+        except FileNotFoundError:
+            # Already gone; dropping it from the index is all that is left to do
+            return None
+        except OSError as e:
+            return str(e)
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.core.backup_index import ARCHIVE_SUFFIXES, MANIFEST_SUFFIX
+from src.core.io_scheduler import IOScheduler
+
+# Read size for hashing; large reads keep per-call overhead negligible
+HASH_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_ALGORITHM = 'blake2b'
+# Digest length used for variable-length algorithms (shake_128, shake_256)
+VARIABLE_DIGEST_SIZE = 32
+
+
+@dataclass
+class VerifyMismatch:
+    """A difference found between a source tree and its backup."""
+
+    relative_path: str
+    status: str  # 'modified', 'missing', 'extra' or 'error'
+    detail: str = ''
+
+
+class BackupVerifier:
+    """Compares files and backups by content hash, using a thread pool."""
+
+    _local = threading.local()
+
+    @staticmethod
+    def hexdigest(digest) -> str:
+        """Return a hash object's hex digest, at VARIABLE_DIGEST_SIZE bytes for variable-length algorithms."""
+        if digest.digest_size == 0:
+            return digest.hexdigest(VARIABLE_DIGEST_SIZE)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_file(path: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
+        """
+        Hash a file's contents.
+
+        Each thread reuses one large buffer and reads with readinto, and
+        hashlib releases the GIL while digesting big chunks, so several
+        files can be hashed truly in parallel.
+
+        Args:
+            path: File to hash
+            algorithm: Any hashlib algorithm name
+
+        Returns:
+            str: Hex digest of the file contents
+        """
+        buffer = getattr(BackupVerifier._local, 'buffer', None)
+        if buffer is None:
+            buffer = BackupVerifier._local.buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+
+        digest = hashlib.new(algorithm)
+        with open(path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                digest.update(view[:read])
+        return BackupVerifier.hexdigest(digest)
+
+    @staticmethod
+    def files_match(first: str, second: str, algorithm: str = DEFAULT_ALGORITHM) -> bool:
+        """
+        Check whether two files have identical contents.
+
+        Args:
+            first: Path of the first file
+            second: Path of the second file
+            algorithm: Any hashlib algorithm name
+
+        Returns:
+            bool: True if sizes and hashes are equal
+        """
+        if os.path.getsize(first) != os.path.getsize(second):
+            return False
+        return BackupVerifier.hash_file(first, algorithm) == BackupVerifier.hash_file(second, algorithm)
+
+    @staticmethod
+    def verify(source: str, backup: Optional[str] = None, algorithm: str = DEFAULT_ALGORITHM,
+               workers: Optional[int] = None) -> Iterator[VerifyMismatch]:
+        """
+        Compare a file or directory with its backup, yielding differences as they are found.
+
+        Files present on both sides are first compared by size; only files
+        of equal size are hashed, with the source and backup copies hashed
+        concurrently. Results stream out as soon as each pair is decided.
+
+        Args:
+            source: Original file or directory
+            backup: Backup to compare against, defaults to the most recent one
+            algorithm: Any hashlib algorithm name
+            workers: Hashing threads, defaults to what the slower device suits
+
+        Returns:
+            Iterator[VerifyMismatch]: Every missing, extra, modified or unreadable file
+
+        Raises:
+            FileNotFoundError: If the source or the backup does not exist
+        """
+        if backup is None:
+            from src.core.file_operations import FileOperations
+            backup = FileOperations.get_latest_backup(source)
+        if backup is None or not os.path.exists(backup):
+            raise FileNotFoundError(f"No backup found for {source}")
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Source not found: {source}")
+
+        if workers is None:
+            scheduler = IOScheduler.shared()
+            workers = min(scheduler.limit_for(source), scheduler.limit_for(backup), os.cpu_count() or 1)
+        workers = max(1, workers)
+
+        from src.core.chunk_store import ChunkedBackup
+        from src.core.archive_backup import ArchiveBackup
+        if backup.endswith(MANIFEST_SUFFIX):
+            yield from ChunkedBackup.verify(source, backup, workers)
+            return
+        if backup.endswith(ARCHIVE_SUFFIXES):
+            yield from ArchiveBackup.verify(source, backup, algorithm, workers)
+            return
+
+        pairs = BackupVerifier._pair_files(source, backup)
+        with ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="onlyfiles-verify") as executor:
+            pending: Dict[Future, Tuple[int, int]] = {}
+            hashes: Dict[int, List[Optional[str]]] = {}
+            max_in_flight = workers * 8
+
+            for position, (relative, source_file, backup_file) in enumerate(pairs):
+                if source_file is None:
+                    yield VerifyMismatch(relative, 'extra', 'only in backup')
+                    continue
+                if backup_file is None:
+                    yield VerifyMismatch(relative, 'missing', 'not in backup')
+                    continue
+                try:
+                    source_size, backup_size = os.path.getsize(source_file), os.path.getsize(backup_file)
+                except OSError as e:
+                    yield VerifyMismatch(relative, 'error', str(e))
+                    continue
+                if source_size != backup_size:
+                    yield VerifyMismatch(relative, 'modified', f"size {source_size} != {backup_size}")
+                    continue
+
+                hashes[position] = [None, None, relative]
+                pending[executor.submit(BackupVerifier.hash_file, source_file, algorithm)] = (position, 0)
+                pending[executor.submit(BackupVerifier.hash_file, backup_file, algorithm)] = (position, 1)
+                while len(pending) >= max_in_flight:
+                    yield from BackupVerifier._collect(pending, hashes)
+
+            while pending:
+                yield from BackupVerifier._collect(pending, hashes)
+
+    @staticmethod
+    def _collect(pending: Dict[Future, Tuple[int, int]], hashes: Dict[int, list]) -> Iterator[VerifyMismatch]:
+        """Wait for at least one hash to finish and yield any decided mismatches."""
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            position, side = pending.pop(future)
+            entry = hashes.get(position)
+            if entry is None:
+                # The pair already failed on its other side
+                continue
+            try:
+                entry[side] = future.result()
+            except OSError as e:
+                del hashes[position]
+                yield VerifyMismatch(entry[2], 'error', str(e))
+                continue
+            if entry[0] is not None and entry[1] is not None:
+                del hashes[position]
+                if entry[0] != entry[1]:
+                    yield VerifyMismatch(entry[2], 'modified', 'content differs')
+
+    @staticmethod
+    def _pair_files(source: str, backup: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """Yield (relative path, source file, backup file) for every file on either side."""
+        if os.path.isfile(source) or os.path.isfile(backup):
+            yield os.path.basename(source), source, backup
+            return
+
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            relative_root = os.path.relpath(root, source)
+            backup_root = os.path.normpath(os.path.join(backup, relative_root))
+            try:
+                backup_names = set(os.listdir(backup_root))
+            except OSError:
+                backup_names = set()
+
+            for name in sorted(files):
+                relative = os.path.normpath(os.path.join(relative_root, name))
+                backup_file = os.path.join(backup_root, name) if name in backup_names else None
+                yield relative, os.path.join(root, name), backup_file
+            for name in sorted(backup_names - set(files) - set(dirs)):
+                backup_path = os.path.join(backup_root, name)
+                relative = os.path.normpath(os.path.join(relative_root, name))
+                if os.path.isdir(backup_path):
+                    for extra_root, _, extra_files in os.walk(backup_path):
+                        for extra in sorted(extra_files):
+                            extra_path = os.path.join(extra_root, extra)
+                            yield os.path.relpath(extra_path, backup), None, extra_path
+                else:
+                    yield relative, None, backup_path
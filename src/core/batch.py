@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core.operations import operation_targets, run_operation
+
+DEFAULT_BATCH_WORKERS = 4
+
+# (operation name, parameters)
+Operation = Tuple[str, Dict[str, Any]]
+# Called from worker threads with one result record per operation
+ResultCallback = Callable[[Dict[str, Any]], None]
+
+
+@dataclass
+class BatchEntry:
+    """One manifest line: the operations to run, in order, or why the line was rejected."""
+
+    line: int
+    operations: List[Operation] = field(default_factory=list)
+    error: Optional[str] = None
+    source: str = ''
+
+
+def parse_manifest(lines: Iterable[str], default_operations: Callable[[str], List[Operation]]) -> Iterator[BatchEntry]:
+    """
+    Read manifest lines lazily, so a manifest of any length is never held in memory.
+
+    Each non-empty line that does not start with '#' is either a path,
+    which gets the operations chosen on the command line, or a JSON
+    object naming one operation and its parameters, like a queued job or
+    an RPC request::
+
+        /srv/uploads/customer1
+        {"operation": "backup", "path": "/srv/uploads/customer2", "archive": true}
+
+    Args:
+        lines: Manifest lines, e.g. an open file or sys.stdin
+        default_operations: Builds the operations for a plain path line
+
+    Returns:
+        Iterator[BatchEntry]: One entry per manifest line that is not blank or a comment
+    """
+    for number, raw in enumerate(lines, 1):
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        entry = BatchEntry(number, source=line)
+        if line.startswith('{'):
+            try:
+                params = json.loads(line)
+                if not isinstance(params, dict):
+                    raise ValueError("expected a JSON object")
+                operation = params.pop('operation', None)
+                if not isinstance(operation, str):
+                    raise ValueError("missing 'operation'")
+                operation_targets(operation, params)
+                entry.operations.append((operation, params))
+            except ValueError as e:
+                entry.error = f"Invalid manifest entry: {e}"
+        else:
+            entry.operations = default_operations(line)
+            if not entry.operations:
+                entry.error = "No operation chosen for plain path lines"
+        yield entry
+
+
+class BatchRunner:
+    """
+    Runs the entries of a manifest in one process.
+
+    Entries run in parallel on a small pool of threads, while the
+    operations of one entry run one after another. Everything shares the
+    process-wide I/O scheduler, listing cache and log writer, so a nightly
+    run over thousands of directories is bound by the disks rather than by
+    starting a process per directory. Entries whose paths overlap are kept
+    apart by the directory locks the operations take.
+    """
+
+    def __init__(self, workers: int = DEFAULT_BATCH_WORKERS, on_result: Optional[ResultCallback] = None):
+        """
+        Args:
+            workers: Entries processed at the same time
+            on_result: Called with a JSON-serializable record after each operation
+        """
+        self.workers = max(1, workers)
+        self.on_result = on_result
+        self._counts = {'ok': 0, 'failed': 0, 'skipped': 0}
+        self._counts_lock = threading.Lock()
+
+    def run(self, entries: Iterable[BatchEntry]) -> Dict[str, int]:
+        """
+        Run every entry and report each operation's outcome.
+
+        When an operation fails, the operations after it on the same
+        manifest line are skipped; other lines are not affected.
+
+        Args:
+            entries: Entries from parse_manifest()
+
+        Returns:
+            Dict[str, int]: Number of operations that were 'ok', 'failed' and 'skipped'
+        """
+        # Bounds how many entries are read ahead of the workers
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="onlyfiles-batch") as executor:
+            for entry in entries:
+                slots.acquire()
+                future = executor.submit(self._run_entry, entry)
+                future.add_done_callback(lambda _: slots.release())
+        return dict(self._counts)
+
+    def _run_entry(self, entry: BatchEntry):
+        """Run the operations of one manifest line in order."""
+        if entry.error is not None:
+            self._report(entry, None, {}, 'failed', error=entry.error)
+            return
+        failed = False
+        for operation, params in entry.operations:
+            if failed:
+                self._report(entry, operation, params, 'skipped')
+                continue
+            start = time.perf_counter()
+            try:
+                result = run_operation(operation, params)
+            except Exception as e:
+                failed = True
+                self._report(entry, operation, params, 'failed', error=f"{type(e).__name__}: {e}",
+                             seconds=time.perf_counter() - start)
+            else:
+                self._report(entry, operation, params, 'ok', result=result, seconds=time.perf_counter() - start)
+
+    def _report(self, entry: BatchEntry, operation: Optional[str], params: Dict[str, Any], status: str,
+                result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                seconds: Optional[float] = None):
+        with self._counts_lock:
+            self._counts[status] += 1
+        if self.on_result is None:
+            return
+        target = params.get('directory') or params.get('path') or params.get('source') or entry.source
+        record: Dict[str, Any] = {
+            'line': entry.line,
+            'target': os.path.abspath(target) if operation else target,
+            'operation': operation,
+            'status': status,
+        }
+        if result is not None:
+            record['result'] = result
+        if error is not None:
+            record['error'] = error
+        if seconds is not None:
+            record['seconds'] = round(seconds, 6)
+        self.on_result(record)
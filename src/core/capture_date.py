@@ -0,0 +1,407 @@
+import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.core.file_stat import FileStat, StatCollector
+from src.core.io_scheduler import IOScheduler
+
+# Bytes read from the start of each file; EXIF data and MP4/HEIC box
+# headers almost always fit
+HEADER_READ_SIZE = 64 * 1024
+# Upper bound for the follow-up read when metadata lives further into the file
+METADATA_READ_SIZE = 64 * 1024
+
+JPEG_EXTENSIONS = {'.jpg', '.jpeg', '.jpe'}
+TIFF_EXTENSIONS = {'.tif', '.tiff', '.dng', '.cr2', '.nef', '.arw', '.orf', '.rw2', '.pef', '.srw'}
+BMFF_EXTENSIONS = {'.heic', '.heif', '.avif', '.mp4', '.m4v', '.mov', '.3gp', '.3g2'}
+CAPTURE_EXTENSIONS = JPEG_EXTENSIONS | TIFF_EXTENSIONS | BMFF_EXTENSIONS
+
+# EXIF tags holding dates, in order of preference
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATE_TAGS = (0x9003, 0x9004)  # DateTimeOriginal, DateTimeDigitized
+TIFF_DATE_TAG = 0x0132  # DateTime (last modification, used only as a last resort)
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+# Top-level boxes examined before giving up on an ISO BMFF file
+MAX_TOP_LEVEL_BOXES = 64
+
+# Seconds between the QuickTime epoch (1904-01-01) and the Unix epoch
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+ReadAt = Callable[[int, int], bytes]
+
+
+def read_capture_time(path: str) -> Optional[float]:
+    """
+    Read the time a photo or video was taken from its metadata.
+
+    Only the first HEADER_READ_SIZE bytes are read, with one pread. A
+    second bounded read is made only when the metadata is known to sit
+    further into the file (an MP4 'moov' box after the media data, or an
+    HEIC Exif item).
+
+    Args:
+        path: JPEG, TIFF/raw, HEIC/HEIF or MP4/MOV file
+
+    Returns:
+        Optional[float]: Capture time as a Unix timestamp, or None if the file has none
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    extension = os.path.splitext(path)[1].lower()
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        def read_at(size: int, offset: int) -> bytes:
+            if hasattr(os, 'pread'):
+                return os.pread(fd, size, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, size)
+
+        head = read_at(HEADER_READ_SIZE, 0)
+        try:
+            if head[:2] == b'\xff\xd8':
+                return _parse_jpeg(head, read_at)
+            if head[:4] in (b'II*\x00', b'MM\x00*'):
+                return _parse_tiff(head)
+            if extension in BMFF_EXTENSIONS or head[4:8] == b'ftyp':
+                return _parse_bmff(head, read_at)
+        except (struct.error, ValueError, IndexError):
+            # Corrupt or unexpected metadata: treat as having no capture time
+            return None
+        return None
+    finally:
+        os.close(fd)
+
+
+def _parse_jpeg(data: bytes, read_at: ReadAt) -> Optional[float]:
+    """Find the EXIF APP1 segment of a JPEG and read its date."""
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan: no metadata after this point
+            return None
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        if marker == 0xE1:
+            end = position + 2 + length
+            segment = data[position + 4:end] if end <= len(data) else read_at(length - 2, position + 4)
+            if segment[:6] == b'Exif\x00\x00':
+                return _parse_tiff(segment[6:])
+        position += 2 + length
+    return None
+
+
+def _parse_tiff(tiff: bytes) -> Optional[float]:
+    """Read the capture date from a TIFF structure (EXIF payload or TIFF-based file)."""
+    if tiff[:4] == b'II*\x00':
+        endian = '<'
+    elif tiff[:4] == b'MM\x00*':
+        endian = '>'
+    else:
+        return None
+
+    ifd0 = _read_ifd(tiff, struct.unpack(endian + 'I', tiff[4:8])[0], endian)
+    candidates = []
+    if EXIF_IFD_POINTER in ifd0:
+        exif_offset = struct.unpack(endian + 'I', ifd0[EXIF_IFD_POINTER][2])[0]
+        exif = _read_ifd(tiff, exif_offset, endian)
+        candidates.extend(exif[tag] for tag in EXIF_DATE_TAGS if tag in exif)
+    if TIFF_DATE_TAG in ifd0:
+        candidates.append(ifd0[TIFF_DATE_TAG])
+
+    for field_type, count, value in candidates:
+        if field_type != 2:
+            continue
+        if count <= 4:
+            text = value[:count]
+        else:
+            offset = struct.unpack(endian + 'I', value)[0]
+            text = tiff[offset:offset + count]
+        timestamp = _parse_exif_datetime(text)
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> Dict[int, Tuple[int, int, bytes]]:
+    """Read one TIFF IFD into {tag: (type, count, raw 4-byte value/offset)}."""
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    for i in range(count):
+        start = offset + 2 + 12 * i
+        if start + 12 > len(tiff):
+            break
+        tag, field_type, field_count = struct.unpack(endian + 'HHI', tiff[start:start + 8])
+        entries[tag] = (field_type, field_count, tiff[start + 8:start + 12])
+    return entries
+
+
+def _parse_exif_datetime(text: bytes) -> Optional[float]:
+    """Convert an EXIF 'YYYY:MM:DD HH:MM:SS' value (local time) to a timestamp."""
+    try:
+        value = text[:19].decode('ascii')
+        return datetime.strptime(value, EXIF_DATE_FORMAT).timestamp()
+    except (UnicodeDecodeError, ValueError, OverflowError, OSError):
+        # Blank dates such as '0000:00:00 00:00:00' end up here
+        return None
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yield (type, payload start, box end) for the ISO BMFF boxes in a buffer."""
+    end = len(data) if end is None else min(end, len(data))
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[position:position + 8])
+        header = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            size = struct.unpack('>Q', data[position + 8:position + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return
+        yield box_type, position + header, position + size
+        position += size
+
+
+def _parse_bmff(head: bytes, read_at: ReadAt) -> Optional[float]:
+    """Read the capture date of an ISO BMFF file: HEIC/HEIF Exif, or MP4/MOV 'mvhd'."""
+    position = 0
+    for _ in range(MAX_TOP_LEVEL_BOXES):
+        header = head[position:position + 16]
+        if len(header) < 16 and position + 16 > len(head):
+            # Top-level box headers past the first block are fetched one by one
+            header = read_at(16, position)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        if size and size < header_size:
+            return None
+
+        if box_type in (b'moov', b'meta'):
+            length = METADATA_READ_SIZE if size == 0 else min(size, METADATA_READ_SIZE)
+            box = head[position:position + length]
+            if len(box) < length:
+                box = read_at(length, position)
+            if box_type == b'moov':
+                return _parse_moov(box, header_size)
+            return _parse_heif_meta(box, header_size, read_at)
+        if size == 0:
+            return None
+        position += size
+    return None
+
+
+def _parse_moov(moov: bytes, header_size: int) -> Optional[float]:
+    """Read the creation time from the 'mvhd' box of an MP4/MOV 'moov' box."""
+    for box_type, payload, _ in _iter_boxes(moov, header_size):
+        if box_type == b'mvhd':
+            version = moov[payload]
+            if version == 1:
+                created = struct.unpack('>Q', moov[payload + 4:payload + 12])[0]
+            else:
+                created = struct.unpack('>I', moov[payload + 4:payload + 8])[0]
+            if created <= QUICKTIME_EPOCH_OFFSET:
+                # Unset (zero) or nonsensical
+                return None
+            return float(created - QUICKTIME_EPOCH_OFFSET)
+    return None
+
+
+def _parse_heif_meta(meta: bytes, header_size: int, read_at: ReadAt) -> Optional[float]:
+    """Locate the Exif item of a HEIF 'meta' box through 'iinf'/'iloc' and read its date."""
+    exif_items = set()
+    locations: Dict[int, Tuple[int, int]] = {}
+    # 'meta' is a full box: skip its version and flags
+    for box_type, payload, end in _iter_boxes(meta, header_size + 4):
+        if box_type == b'iinf':
+            version = meta[payload]
+            position = payload + (6 if version == 0 else 8)
+            for entry_type, entry_payload, _ in _iter_boxes(meta, position, end):
+                if entry_type != b'infe' or meta[entry_payload] < 2:
+                    continue
+                if meta[entry_payload] == 2:
+                    item_id = struct.unpack('>H', meta[entry_payload + 4:entry_payload + 6])[0]
+                    item_type = meta[entry_payload + 8:entry_payload + 12]
+                else:
+                    item_id = struct.unpack('>I', meta[entry_payload + 4:entry_payload + 8])[0]
+                    item_type = meta[entry_payload + 10:entry_payload + 14]
+                if item_type == b'Exif':
+                    exif_items.add(item_id)
+        elif box_type == b'iloc':
+            locations = _parse_iloc(meta, payload)
+
+    for item_id in exif_items:
+        if item_id not in locations:
+            continue
+        offset, length = locations[item_id]
+        payload = read_at(min(length, METADATA_READ_SIZE), offset)
+        # The item starts with the offset of the TIFF header after a 4-byte field
+        tiff_start = 4 + struct.unpack('>I', payload[:4])[0]
+        timestamp = _parse_tiff(payload[tiff_start:])
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def _parse_iloc(data: bytes, payload: int) -> Dict[int, Tuple[int, int]]:
+    """Parse an 'iloc' box into {item id: (file offset, length)} of each item's first extent."""
+    def read_uint(position: int, size: int) -> Tuple[int, int]:
+        return (int.from_bytes(data[position:position + size], 'big') if size else 0), position + size
+
+    version = data[payload]
+    offset_size, length_size = data[payload + 4] >> 4, data[payload + 4] & 0x0F
+    base_offset_size = data[payload + 5] >> 4
+    index_size = data[payload + 5] & 0x0F if version in (1, 2) else 0
+    position = payload + 6
+    item_count, position = read_uint(position, 2 if version < 2 else 4)
+
+    locations = {}
+    for _ in range(item_count):
+        item_id, position = read_uint(position, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            method, position = read_uint(position, 2)
+            construction_method = method & 0x0F
+        position += 2  # data_reference_index
+        base_offset, position = read_uint(position, base_offset_size)
+        extent_count, position = read_uint(position, 2)
+        for extent in range(extent_count):
+            position += index_size
+            extent_offset, position = read_uint(position, offset_size)
+            extent_length, position = read_uint(position, length_size)
+            # Only items stored directly in the file (construction method 0) are supported
+            if extent == 0 and construction_method == 0:
+                locations[item_id] = (base_offset + extent_offset, extent_length)
+    return locations
+
+
+class CaptureDates:
+    """
+    Capture times of photos and videos, cached per file version.
+
+    Cache entries are keyed on (device, inode, mtime), so a file is read
+    again only after it changed, and renaming or moving it within the
+    filesystem (as organizing does) keeps its entry valid.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = db_path or Path.home() / '.onlyfiles' / 'capture_dates.db'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS capture_dates ("
+                " dev INTEGER NOT NULL,"
+                " ino INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " taken REAL,"
+                " PRIMARY KEY (dev, ino, mtime_ns))"
+            )
+
+    def lookup(self, entries: Iterable[os.DirEntry], workers: Optional[int] = None) -> Dict[str, float]:
+        """
+        Get the date of each file: its capture time, falling back to its mtime.
+
+        Files are stat'ed in parallel batches, and those not in the cache
+        are read on a thread pool; only photo and video formats are opened
+        at all.
+
+        Args:
+            entries: Files to date
+            workers: Reader threads, defaults to a deep queue for the device
+
+        Returns:
+            Dict[str, float]: Unix timestamp per file path
+        """
+        dates: Dict[str, float] = {}
+        candidates: List[Tuple[str, FileStat]] = []
+        for path, st in StatCollector.collect((entry.path for entry in entries), follow_symlinks=True).items():
+            if os.path.splitext(path)[1].lower() in CAPTURE_EXTENSIONS:
+                candidates.append((path, st))
+            else:
+                dates[path] = st.mtime
+        if not candidates:
+            return dates
+
+        cached = self._load(st for _, st in candidates)
+        to_read = []
+        for path, st in candidates:
+            key = (st.dev, st.ino, st.mtime_ns)
+            if key in cached:
+                taken = cached[key]
+                dates[path] = taken if taken is not None else st.mtime
+            else:
+                to_read.append((path, st))
+
+        if to_read:
+            if workers is None:
+                # Small random reads benefit from a deeper queue than bulk copies
+                workers = IOScheduler.shared().limit_for(os.path.dirname(to_read[0][0])) * 4
+            new_rows = []
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-exif") as executor:
+                for (path, st), taken in zip(to_read, executor.map(CaptureDates._read, (p for p, _ in to_read))):
+                    dates[path] = taken if taken is not None else st.mtime
+                    if taken is not False:
+                        new_rows.append((st.dev, st.ino, st.mtime_ns, taken))
+            with closing(self._connect()) as conn, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO capture_dates (dev, ino, mtime_ns, taken) VALUES (?, ?, ?, ?)",
+                    new_rows
+                )
+        return dates
+
+    @staticmethod
+    def _read(path: str):
+        """read_capture_time, returning False instead of raising when the file cannot be read."""
+        try:
+            return read_capture_time(path)
+        except OSError:
+            return False
+
+    def _load(self, stats: Iterable[FileStat]) -> Dict[Tuple[int, int, int], Optional[float]]:
+        """Fetch the cached capture times of the given files."""
+        by_device: Dict[int, List[int]] = {}
+        for st in stats:
+            by_device.setdefault(st.dev, []).append(st.ino)
+
+        cached = {}
+        with closing(self._connect()) as conn:
+            for dev, inodes in by_device.items():
+                # Stay well below SQLite's limit on bound parameters
+                for start in range(0, len(inodes), 500):
+                    batch = inodes[start:start + 500]
+                    rows = conn.execute(
+                        "SELECT dev, ino, mtime_ns, taken FROM capture_dates"
+                        f" WHERE dev = ? AND ino IN ({','.join('?' * len(batch))})",
+                        [dev, *batch]
+                    )
+                    for row_dev, ino, mtime_ns, taken in rows:
+                        cached[(row_dev, ino, mtime_ns)] = taken
+        return cached
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; each call gets its own so threads never share one."""
+        return sqlite3.connect(str(self.db_path), timeout=30)
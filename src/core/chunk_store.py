@@ -0,0 +1,528 @@
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.core.backup_index import MANIFEST_SUFFIX
+from src.core.backup_verifier import VerifyMismatch
+from src.core.dir_lock import DirectoryLock, LockManager
+from src.core.io_scheduler import IOScheduler, IOTask, OperationCancelled, ProgressCallback
+from src.core.throttle import Throttle
+from src.utils.metrics import Metrics
+
+MANIFEST_FORMAT = "onlyfiles-chunked"
+MANIFEST_VERSION = 1
+STORE_DIRNAME = ".onlyfiles-chunks"
+# Chunks written or reused this recently are never collected, even when no
+# manifest references them yet, e.g. while another user's backup is running
+GC_GRACE_SECONDS = 6 * 3600
+
+# Chunk boundaries: at least MIN, at most MAX bytes, and in between wherever
+# the one-bit signatures of the last 16 bytes spell BOUNDARY_PATTERN. On
+# random data that happens once every 2**16 bytes, giving ~80 KiB chunks.
+CHUNK_MIN_SIZE = 16 * 1024
+CHUNK_MAX_SIZE = 512 * 1024
+BOUNDARY_PATTERN = b"0101100110000110"
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Maps every byte value to b'0' or b'1'; exactly half of the values map to b'1'
+_ONE_BITS = set(sorted(range(256), key=lambda b: hashlib.blake2b(bytes([b]), key=b"onlyfiles-cdc-v1").digest())[:128])
+SIGNATURE_TABLE = bytes(0x31 if b in _ONE_BITS else 0x30 for b in range(256))
+
+
+def iter_chunks(f: BinaryIO, throttle: Optional[Throttle] = None) -> Iterator[bytes]:
+    """
+    Split a stream into content-defined chunks.
+
+    Each byte is reduced to one pseudo-random bit with bytes.translate and
+    boundaries are found with bytes.find, so the boundary search runs in C
+    over whole read blocks instead of a per-byte Python rolling hash. Because
+    a boundary depends only on the 16 bytes before it, inserting or removing
+    data only moves the boundaries next to the edit; every other chunk keeps
+    its content and hash.
+
+    Args:
+        f: Binary stream to read
+        throttle: Optional bandwidth limit applied to the bytes read
+
+    Returns:
+        Iterator[bytes]: Consecutive chunks covering the whole stream
+    """
+    pattern_length = len(BOUNDARY_PATTERN)
+    buffer = bytearray()
+    eof = False
+    while not eof:
+        block = f.read(READ_BLOCK_SIZE)
+        eof = not block
+        if block:
+            buffer += block
+            if throttle is not None:
+                throttle.data(len(block))
+
+        signatures = buffer.translate(SIGNATURE_TABLE)
+        position = 0
+        # Only cut where a full CHUNK_MAX_SIZE of lookahead is available, or at EOF
+        while len(buffer) - position >= CHUNK_MAX_SIZE or (eof and position < len(buffer)):
+            limit = min(position + CHUNK_MAX_SIZE, len(buffer))
+            found = signatures.find(BOUNDARY_PATTERN, position + CHUNK_MIN_SIZE - pattern_length, limit)
+            cut = found + pattern_length if found >= 0 else limit
+            yield bytes(buffer[position:cut])
+            position = cut
+        del buffer[:position]
+
+
+class ChunkStore:
+    """Content-addressed store holding each unique chunk exactly once."""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Directory holding the store
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+
+    @staticmethod
+    def for_path(path: str) -> "ChunkStore":
+        """Return the store shared by all chunked backups in a path's parent directory."""
+        return ChunkStore(os.path.join(os.path.dirname(os.path.abspath(path)), STORE_DIRNAME))
+
+    def object_path(self, digest: str) -> str:
+        """Return the file holding a chunk."""
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def lock(self, exclusive: bool = False) -> DirectoryLock:
+        """
+        Lock the store: shared while backups add chunks, exclusive while garbage is collected.
+
+        Raises:
+            LockTimeout: If a conflicting lock is still held when the lock timeout runs out
+        """
+        return LockManager.shared().acquire(self.root, exclusive=exclusive,
+                                            purpose='chunk collection' if exclusive else 'chunked backup')
+
+    def has(self, digest: str) -> bool:
+        """Check whether a chunk is stored."""
+        return os.path.exists(self.object_path(digest))
+
+    def put(self, data: bytes) -> Tuple[str, bool]:
+        """
+        Store a chunk unless an identical one is already present.
+
+        Args:
+            data: Chunk contents
+
+        Returns:
+            Tuple[str, bool]: Hex digest identifying the chunk, and whether it was newly stored
+        """
+        digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+        path = self.object_path(digest)
+        try:
+            # Refresh the mtime of a reused chunk, so it gets the full grace period again
+            os.utime(path)
+            return digest, False
+        except FileNotFoundError:
+            pass
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # Concurrent writers of the same chunk all rename identical data
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        Metrics.shared().inc('bytes_copied_total', len(data))
+        return digest, True
+
+    def copy_to(self, digest: str, out: BinaryIO) -> int:
+        """
+        Stream a chunk into a file, checking its integrity on the way.
+
+        Args:
+            digest: Chunk to copy
+            out: Writable binary stream
+
+        Returns:
+            int: Number of bytes written
+
+        Raises:
+            OSError: If the chunk is missing or its contents do not match its digest
+        """
+        hasher = hashlib.blake2b(digest_size=32)
+        written = 0
+        with open(self.object_path(digest), 'rb') as f:
+            while True:
+                data = f.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+                out.write(data)
+                written += len(data)
+        if hasher.hexdigest() != digest:
+            raise OSError(f"Chunk {digest} is corrupt")
+        return written
+
+    def manifests(self) -> List[str]:
+        """Return the manifests on disk next to the store, whatever the backup index knows about."""
+        directory = os.path.dirname(self.root)
+        with os.scandir(directory) as it:
+            return sorted(entry.path for entry in it if entry.name.endswith(MANIFEST_SUFFIX) and entry.is_file())
+
+    def collect_garbage(self, grace: float = GC_GRACE_SECONDS) -> int:
+        """
+        Delete every stored chunk that no manifest references.
+
+        The live chunks are read from every manifest on disk that uses the
+        store, with the store locked exclusively, so backups that are still
+        adding chunks (which hold it shared) finish first and their chunks
+        are never collected. Chunks younger than the grace period are kept
+        as well, for writers this process's locks cannot see.
+
+        Args:
+            grace: Seconds since a chunk was last written or reused during which it is kept
+
+        Returns:
+            int: Number of chunks removed
+
+        Raises:
+            LockTimeout: If a backup keeps the store locked for longer than the lock timeout
+            OSError, ValueError: If a manifest cannot be read; nothing is removed then
+        """
+        removed = 0
+        if not os.path.isdir(self.objects_dir):
+            return 0
+        with self.lock(exclusive=True):
+            live = ChunkedBackup.referenced_chunks(self.manifests(), os.path.basename(self.root))
+            cutoff = time.time() - grace
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                with os.scandir(prefix_dir) as it:
+                    for entry in it:
+                        if entry.name in live:
+                            continue
+                        try:
+                            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                                continue
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            continue
+                        removed += 1
+        return removed
+
+
+class ChunkedBackup:
+    """Creates and restores deduplicated, content-defined chunked backups."""
+
+    @staticmethod
+    def create(source: str, manifest_path: str, previous_manifest: Optional[str] = None,
+               throttle: Optional[Throttle] = None, progress: Optional[ProgressCallback] = None,
+               cancel: Optional[threading.Event] = None) -> Dict[str, int]:
+        """
+        Back up a file or directory into the chunk store and write its manifest.
+
+        Files whose size and mtime match the previous manifest reuse its
+        chunk list without being read; other files are chunked in parallel
+        through the IOScheduler and only chunks not yet stored are written.
+
+        Args:
+            source: File or directory to back up
+            manifest_path: Where to write the manifest
+            previous_manifest: Manifest of an earlier backup of the same source
+            throttle: Optional bandwidth/file-rate limits
+            progress: Called with (completed, total, path) as changed files are chunked
+            cancel: Event that stops the backup when set
+
+        Returns:
+            Dict[str, int]: Statistics: files, bytes, reused_files, stored_chunks
+
+        Raises:
+            OSError: If a file could not be backed up or the backup was cancelled
+            LockTimeout: If garbage collection keeps the store locked for longer than the lock timeout
+        """
+        store = ChunkStore.for_path(manifest_path)
+        # Held until the manifest references every chunk written, so garbage collection waits
+        with store.lock():
+            previous = {}
+            if previous_manifest and os.path.exists(previous_manifest):
+                previous_data = ChunkedBackup.load_manifest(previous_manifest)
+                if ChunkedBackup.store_for(previous_manifest, previous_data).root == store.root:
+                    previous = {entry['path']: entry for entry in previous_data['entries'] if entry['type'] == 'file'}
+
+            entries = list(ChunkedBackup._scan(source))
+            stats = {'files': 0, 'bytes': 0, 'reused_files': 0, 'stored_chunks': 0}
+            tasks = []
+            pending = []
+            for entry in entries:
+                if entry['type'] != 'file':
+                    continue
+                stats['files'] += 1
+                stats['bytes'] += entry['size']
+                old = previous.get(entry['path'])
+                if (old and old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns']
+                        and all(store.has(digest) for digest, _ in old['chunks'])):
+                    entry['chunks'] = old['chunks']
+                    stats['reused_files'] += 1
+                    continue
+                file_path = os.path.join(source, entry['path']) if entry['path'] != '.' else source
+                action = partial(ChunkedBackup._store_file, store, file_path, throttle)
+                tasks.append(IOTask(file_path, store.objects_dir, action, entry['size']))
+                pending.append(entry)
+
+            os.makedirs(store.objects_dir, exist_ok=True)
+            for entry, result in zip(pending, IOScheduler.shared().run(tasks, progress, cancel)):
+                if not result.ok:
+                    raise OSError(f"Could not back up {entry['path']}: {result.error}")
+                entry['chunks'], new_chunks = result.result
+                stats['stored_chunks'] += new_chunks
+
+            manifest = {
+                'format': MANIFEST_FORMAT,
+                'version': MANIFEST_VERSION,
+                'source': os.path.abspath(source),
+                'created': datetime.now().timestamp(),
+                'store': STORE_DIRNAME,
+                'store_path': store.root,
+                'chunker': {
+                    'min': CHUNK_MIN_SIZE,
+                    'max': CHUNK_MAX_SIZE,
+                    'pattern': BOUNDARY_PATTERN.decode('ascii'),
+                },
+                'entries': entries,
+            }
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, separators=(',', ':'))
+            os.replace(tmp_path, manifest_path)
+        return stats
+
+    @staticmethod
+    def restore(manifest_path: str, destination: str, members: Optional[Iterable[str]] = None,
+                progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None) -> int:
+        """
+        Recreate a backed-up file or directory from its manifest.
+
+        Chunks are streamed one at a time, so memory use does not depend on
+        file sizes.
+
+        Args:
+            manifest_path: Manifest of the backup to restore
+            destination: Path to restore the backed-up file or directory to
+            members: Optional relative paths (files or subtrees) to restore instead of everything
+            progress: Called with (completed, total, path) as entries are restored
+            cancel: Event that stops the restore when set
+
+        Returns:
+            int: Number of files restored
+
+        Raises:
+            KeyError: If a requested member is not in the backup
+            OperationCancelled: If the restore was cancelled
+        """
+        manifest = ChunkedBackup.load_manifest(manifest_path)
+        store = ChunkedBackup.store_for(manifest_path, manifest)
+        wanted = [os.path.normpath(m) for m in members] if members else None
+
+        restored = 0
+        directories = []
+        entries = [entry for entry in manifest['entries']
+                   if not wanted or any(entry['path'] == m or entry['path'].startswith(m + os.sep) for m in wanted)]
+        for member in wanted or []:
+            if not any(entry['path'] == member or entry['path'].startswith(member + os.sep) for entry in entries):
+                raise KeyError(f"{member} is not in the backup")
+        for number, entry in enumerate(entries, 1):
+            if cancel is not None and cancel.is_set():
+                raise OperationCancelled()
+            relative = entry['path']
+            target = destination if relative == '.' else os.path.join(destination, relative)
+            if entry['type'] == 'dir':
+                os.makedirs(target, exist_ok=True)
+                directories.append((target, entry))
+            elif entry['type'] == 'symlink':
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.symlink(entry['target'], target)
+            else:
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                with open(target, 'wb') as out:
+                    for digest, _ in entry['chunks']:
+                        store.copy_to(digest, out)
+                os.chmod(target, entry['mode'])
+                os.utime(target, ns=(entry['mtime_ns'], entry['mtime_ns']))
+                restored += 1
+            if progress is not None:
+                progress(number, len(entries), target)
+
+        # Set directory metadata last, as creating their contents changed it
+        for target, entry in reversed(directories):
+            os.chmod(target, entry['mode'])
+            os.utime(target, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        return restored
+
+    @staticmethod
+    def verify(source: str, manifest_path: str, workers: int = 1) -> Iterator[VerifyMismatch]:
+        """
+        Compare a file or directory with a chunked backup of it.
+
+        Source files are re-chunked and their chunk digests compared with
+        the manifest, so the check also covers chunks whose stored copy is
+        missing from the store.
+
+        Args:
+            source: Original file or directory
+            manifest_path: Manifest of the backup
+            workers: Number of files chunked concurrently
+
+        Returns:
+            Iterator[VerifyMismatch]: Every missing, extra, modified or unreadable file
+        """
+        manifest = ChunkedBackup.load_manifest(manifest_path)
+        store = ChunkedBackup.store_for(manifest_path, manifest)
+        backed_up = {entry['path']: entry for entry in manifest['entries'] if entry['type'] == 'file'}
+        current = {entry['path']: entry for entry in ChunkedBackup._scan(source) if entry['type'] == 'file'}
+
+        for relative in sorted(backed_up.keys() - current.keys()):
+            yield VerifyMismatch(relative, 'extra', 'only in backup')
+
+        candidates = []
+        for relative in sorted(current):
+            entry = backed_up.get(relative)
+            if entry is None:
+                yield VerifyMismatch(relative, 'missing', 'not in backup')
+            elif entry['size'] != current[relative]['size']:
+                yield VerifyMismatch(relative, 'modified', f"size {current[relative]['size']} != {entry['size']}")
+            else:
+                candidates.append(relative)
+
+        def check(relative: str) -> Optional[VerifyMismatch]:
+            path = source if relative == '.' else os.path.join(source, relative)
+            expected = backed_up[relative]['chunks']
+            try:
+                with open(path, 'rb') as f:
+                    actual = [[hashlib.blake2b(data, digest_size=32).hexdigest(), len(data)]
+                              for data in iter_chunks(f)]
+            except OSError as e:
+                return VerifyMismatch(relative, 'error', str(e))
+            if actual != expected:
+                return VerifyMismatch(relative, 'modified', 'content differs')
+            missing = sum(1 for digest, _ in expected if not store.has(digest))
+            if missing:
+                return VerifyMismatch(relative, 'error', f"{missing} chunk(s) missing from the store")
+            return None
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="onlyfiles-verify") as executor:
+            for mismatch in executor.map(check, candidates):
+                if mismatch is not None:
+                    yield mismatch
+
+    @staticmethod
+    def load_manifest(manifest_path: str) -> dict:
+        """
+        Read a chunked backup manifest.
+
+        Raises:
+            ValueError: If the file is not a chunked backup manifest
+        """
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != MANIFEST_FORMAT:
+            raise ValueError(f"{manifest_path} is not a chunked backup manifest")
+        return manifest
+
+    @staticmethod
+    def store_for(manifest_path: str, manifest: dict) -> ChunkStore:
+        """
+        Return the store holding a manifest's chunks.
+
+        The store's absolute path is recorded when the backup is created, so
+        a manifest that was moved still finds it; manifests written before
+        that, or whose store moved along with them, use the store next to
+        the manifest.
+        """
+        recorded = manifest.get('store_path')
+        if recorded and os.path.isdir(recorded):
+            return ChunkStore(recorded)
+        return ChunkStore(os.path.join(os.path.dirname(os.path.abspath(manifest_path)), manifest['store']))
+
+    @staticmethod
+    def referenced_chunks(manifest_paths: Iterable[str], store: str = STORE_DIRNAME) -> Set[str]:
+        """
+        Return every chunk digest referenced by the given manifests.
+
+        Args:
+            manifest_paths: Manifests to read
+            store: Only count manifests whose chunks live in this store directory
+
+        Raises:
+            OSError, ValueError: If a manifest cannot be read, as its chunks would otherwise look unused
+        """
+        live = set()
+        for manifest_path in manifest_paths:
+            try:
+                manifest = ChunkedBackup.load_manifest(manifest_path)
+            except FileNotFoundError:
+                # Deleted since it was listed, so none of its chunks are needed
+                continue
+            if manifest.get('store') != store:
+                continue
+            for entry in manifest['entries']:
+                live.update(digest for digest, _ in entry.get('chunks', []))
+        return live
+
+    @staticmethod
+    def _store_file(store: ChunkStore, path: str, throttle: Optional[Throttle]) -> Tuple[List[list], int]:
+        """Chunk one file into the store, returning its chunk list and the number of new chunks."""
+        if throttle is not None:
+            throttle.file()
+        chunks: List[list] = []
+        new_chunks = 0
+        with open(path, 'rb') as f:
+            for data in iter_chunks(f, throttle):
+                digest, stored = store.put(data)
+                chunks.append([digest, len(data)])
+                new_chunks += stored
+        return chunks, new_chunks
+
+    @staticmethod
+    def _scan(source: str) -> Iterator[dict]:
+        """Yield manifest entries (without chunk lists) for a file or directory tree."""
+        def describe(path: str, relative: str) -> Optional[dict]:
+            st = os.lstat(path)
+            entry = {'path': relative, 'mode': stat.S_IMODE(st.st_mode), 'mtime_ns': st.st_mtime_ns}
+            if stat.S_ISLNK(st.st_mode):
+                entry.update(type='symlink', target=os.readlink(path))
+            elif stat.S_ISDIR(st.st_mode):
+                entry['type'] = 'dir'
+            elif stat.S_ISREG(st.st_mode):
+                entry.update(type='file', size=st.st_size)
+            else:
+                # Sockets, FIFOs and device nodes are not backed up
+                return None
+            return entry
+
+        root_entry = describe(source, '.')
+        if root_entry is not None:
+            yield root_entry
+        if not os.path.isdir(source) or os.path.islink(source):
+            return
+
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in dirs + sorted(files):
+                path = os.path.join(root, name)
+                entry = describe(path, os.path.relpath(path, source))
+                if entry is not None:
+                    yield entry
@@ -0,0 +1,254 @@
+import errno
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+# Seconds to wait for a busy directory unless the caller says otherwise
+DEFAULT_LOCK_TIMEOUT = 60.0
+# Bounds of the backoff between attempts while waiting
+_POLL_MIN = 0.01
+_POLL_MAX = 0.5
+
+
+def paths_overlap(first: Sequence[str], second: Sequence[str]) -> bool:
+    """
+    Check whether two sets of paths share a subtree.
+
+    Args:
+        first: Absolute paths
+        second: Absolute paths
+
+    Returns:
+        bool: True if any path of one equals, contains or lies inside any path of the other
+    """
+    for a in first:
+        for b in second:
+            if a == b or a.startswith(os.path.join(b, '')) or b.startswith(os.path.join(a, '')):
+                return True
+    return False
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a directory stays locked by someone else for longer than the wait timeout."""
+
+
+class DirectoryLock:
+    """
+    A held lock on one or more directory subtrees; release it or use it as a context manager.
+    """
+
+    def __init__(self, manager: "LockManager", paths: List[str], exclusive: bool,
+                 holder_path: Optional[Path], fd: Optional[int]):
+        self.manager = manager
+        self.paths = paths
+        self.exclusive = exclusive
+        self._holder_path = holder_path
+        self._fd = fd
+        self._released = False
+
+    def release(self):
+        """Release the lock; calling it again does nothing."""
+        if self._released:
+            return
+        self._released = True
+        self.manager._forget(self)
+        if self._fd is not None:
+            try:
+                os.unlink(self._holder_path)
+            except FileNotFoundError:
+                pass
+            # Closing drops the flock that tells others this holder is alive
+            os.close(self._fd)
+
+    def __enter__(self) -> "DirectoryLock":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class LockManager:
+    """
+    Advisory locks on directory subtrees, shared by every OnlyFiles process of a user.
+
+    A lock covers a directory and everything below it. Shared locks (for
+    read-only scans and backups) can be held together; an exclusive lock
+    (for anything that moves, renames or deletes) excludes every other lock
+    on an overlapping subtree, whether it is the same directory, one of its
+    ancestors or one of its descendants. Locks on unrelated subtrees never
+    wait for each other.
+
+    Each held lock is a small file in ~/.onlyfiles/locks that its process
+    keeps flock()ed; the set of holders is only read or changed while
+    holding the flock on the registry file there, which makes checking for
+    conflicts and registering a new holder one atomic step. A process that
+    dies loses its flocks, so its holder files are recognized as stale and
+    removed by the next process that looks.
+
+    Locks are reentrant per thread: a thread that already holds a lock
+    covering a path gets a no-op lock for it instead of waiting on itself.
+    """
+
+    _shared: Optional["LockManager"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, lock_dir: Optional[Path] = None, default_timeout: Optional[float] = DEFAULT_LOCK_TIMEOUT):
+        """
+        Args:
+            lock_dir: Directory holding the lock files, defaults to ~/.onlyfiles/locks
+            default_timeout: Seconds acquire() waits when no timeout is given, None to wait forever
+        """
+        self.lock_dir = lock_dir or Path.home() / '.onlyfiles' / 'locks'
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.default_timeout = default_timeout
+        self._local = threading.local()
+
+    @classmethod
+    def shared(cls) -> "LockManager":
+        """Return the process-wide lock manager."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def acquire(self, paths: Union[str, Sequence[str]], exclusive: bool = True,
+                timeout: Optional[float] = -1, purpose: str = '') -> DirectoryLock:
+        """
+        Lock one or more directory subtrees, waiting while someone else holds a conflicting lock.
+
+        Several paths are locked all at once, so two callers locking the same
+        pair of directories in a different order cannot deadlock.
+
+        Args:
+            paths: Directory, or directories, to lock with everything below them
+            exclusive: Exclusive (write) lock instead of a shared (read) lock
+            timeout: Seconds to wait; 0 fails at once, None waits forever, -1 uses default_timeout
+            purpose: Short description shown to whoever has to wait for this lock, e.g. 'organize'
+
+        Returns:
+            DirectoryLock: The held lock
+
+        Raises:
+            LockTimeout: If a conflicting lock is still held when the timeout runs out
+        """
+        paths = [os.path.realpath(path) for path in ([paths] if isinstance(paths, str) else paths)]
+        if self._covered(paths, exclusive):
+            return DirectoryLock(self, paths, exclusive, None, None)
+        if timeout is not None and timeout < 0:
+            timeout = self.default_timeout
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = _POLL_MIN
+        while True:
+            lock, blocker = self._try_acquire(paths, exclusive, purpose)
+            if lock is not None:
+                self._held().append(lock)
+                return lock
+            if deadline is not None and time.monotonic() >= deadline:
+                what = f" ({blocker['purpose']})" if blocker.get('purpose') else ''
+                raise LockTimeout(
+                    f"{', '.join(paths)} is locked by process {blocker.get('pid')}{what}; "
+                    f"gave up after {timeout:g}s"
+                )
+            pause = delay if deadline is None else min(delay, max(0.0, deadline - time.monotonic()))
+            time.sleep(pause)
+            delay = min(_POLL_MAX, delay * 2)
+
+    def holders(self) -> List[Dict[str, Any]]:
+        """
+        List the locks currently held by live processes.
+
+        Returns:
+            List[Dict[str, Any]]: One dict per lock with 'paths', 'exclusive', 'pid', 'purpose' and 'acquired'
+        """
+        with self._registry():
+            return self._live_holders()
+
+    def _try_acquire(self, paths: List[str], exclusive: bool, purpose: str):
+        """Register a new holder unless a live one conflicts; returns (lock, None) or (None, blocker)."""
+        with self._registry():
+            for holder in self._live_holders():
+                if (exclusive or holder['exclusive']) and paths_overlap(paths, holder['paths']):
+                    return None, holder
+
+            holder_path = self.lock_dir / f"{uuid.uuid4().hex}.lock"
+            fd = os.open(str(holder_path), os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, json.dumps({
+                'paths': paths, 'exclusive': exclusive, 'pid': os.getpid(),
+                'purpose': purpose, 'acquired': time.time(),
+            }).encode('utf-8'))
+            return DirectoryLock(self, paths, exclusive, holder_path, fd), None
+
+    def _live_holders(self) -> List[Dict[str, Any]]:
+        """Read every holder file, removing those whose process has gone; caller holds the registry."""
+        holders = []
+        for holder_path in self.lock_dir.glob('*.lock'):
+            try:
+                fd = os.open(str(holder_path), os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            with closing(os.fdopen(fd, 'rb')) as holder_file:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except OSError as e:
+                    if e.errno not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                        raise
+                    # Still flocked by its owner: the lock is held
+                    try:
+                        holders.append(json.loads(holder_file.read().decode('utf-8')))
+                    except ValueError:
+                        continue
+                else:
+                    # Nobody holds it any more: left behind by a process that died
+                    try:
+                        holder_path.unlink()
+                    except FileNotFoundError:
+                        pass
+        return holders
+
+    def _registry(self):
+        """Open and flock the registry file; use as a context manager."""
+        return _Registry(self.lock_dir / 'registry')
+
+    def _held(self) -> List[DirectoryLock]:
+        if not hasattr(self._local, 'held'):
+            self._local.held = []
+        return self._local.held
+
+    def _covered(self, paths: List[str], exclusive: bool) -> bool:
+        """Check whether this thread already holds locks covering all the paths in a strong enough mode."""
+        for path in paths:
+            if not any((held.exclusive or not exclusive) and
+                       any(path == root or path.startswith(os.path.join(root, '')) for root in held.paths)
+                       for held in self._held()):
+                return False
+        return True
+
+    def _forget(self, lock: DirectoryLock):
+        held = self._held()
+        if lock in held:
+            held.remove(lock)
+
+
+class _Registry:
+    """Exclusive flock on the registry file for the duration of a with block."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.close(self._fd)
+        self._fd = None
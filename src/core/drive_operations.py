@@ -1,33 +1,301 @@
+import os
 import platform
-from typing import List
+import re
+import select
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+
+# Kernel and API filesystems that never hold user files
+PSEUDO_FS_TYPES = {
+    'proc', 'sysfs', 'devtmpfs', 'devpts', 'cgroup', 'cgroup2', 'mqueue',
+    'debugfs', 'tracefs', 'securityfs', 'pstore', 'bpf', 'configfs',
+    'fusectl', 'hugetlbfs', 'autofs', 'binfmt_misc', 'rpc_pipefs', 'nsfs',
+    'efivarfs', 'selinuxfs', 'ramfs',
+}
+PSEUDO_MOUNT_ROOTS = ('/proc', '/sys', '/dev')
+# Runtime tmpfs mounts; only these exact mount points, as removable media is mounted below /run/media
+PSEUDO_MOUNT_POINTS = {'/run', '/run/lock', '/run/shm'}
+# Directories whose direct children are runtime mounts, e.g. /run/user/1000
+PSEUDO_MOUNT_PARENTS = {'/run/user'}
+
+NETWORK_FS_TYPES = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', '9p', 'ceph',
+    'glusterfs', 'lustre', 'fuse.sshfs', 'fuse.rclone', 'afs',
+}
+MEMORY_FS_TYPES = {'tmpfs', 'ramfs'}
+
+# Suggested number of concurrent I/O workers per kind of device
+DEVICE_PARALLELISM = {
+    'nvme': 32,
+    'ssd': 8,
+    'hdd': 2,
+    'network': 8,
+    'memory': 16,
+    'unknown': 4,
+}
+
+
+@dataclass
+class DriveInfo:
+    """Describes a mounted filesystem and the device behind it."""
+
+    mount_point: str
+    device: str
+    fs_type: str
+    dev_id: str
+    media: str = 'unknown'
+    read_only: bool = False
+    total_bytes: int = 0
+    free_bytes: int = 0
+
+    @property
+    def parallelism(self) -> int:
+        """Suggested number of concurrent I/O workers for this device."""
+        return DEVICE_PARALLELISM.get(self.media, DEVICE_PARALLELISM['unknown'])
+
 
 class DriveOperations:
     """Handles drive-related operations in a clean and organized way."""
-    
+
+    # Parsed mount table, reused until the kernel reports that it changed
+    _mounts: Optional[List[DriveInfo]] = None
+    _mountinfo_fd: Optional[int] = None
+    _mountinfo_poll = None
+    _mountinfo_raw: Optional[bytes] = None
+    _lock = threading.Lock()
+
     @staticmethod
     def get_available_drives() -> List[str]:
         """
         Get list of available drives on the system.
-        
+
         Returns:
             List[str]: List of available drive paths
         """
         if platform.system() == "Windows":
             return DriveOperations._get_windows_drives()
-        return ["/"]  # For Unix-like systems
-    
+        mounts = DriveOperations.get_mounts()
+        return [mount.mount_point for mount in mounts] or ["/"]
+
+    @staticmethod
+    def get_drive_details() -> List[DriveInfo]:
+        """
+        Get available drives together with their capacity and device type.
+
+        Returns:
+            List[DriveInfo]: One entry per drive, with current free space
+        """
+        if platform.system() == "Windows":
+            drives = [DriveInfo(drive, drive, '', drive) for drive in DriveOperations._get_windows_drives()]
+        else:
+            drives = [DriveInfo(**vars(mount)) for mount in DriveOperations.get_mounts()]
+
+        for drive in drives:
+            try:
+                usage = shutil.disk_usage(drive.mount_point)
+                drive.total_bytes, drive.free_bytes = usage.total, usage.free
+            except OSError:
+                continue
+        return drives
+
+    @staticmethod
+    def get_mounts() -> List[DriveInfo]:
+        """
+        Get the user-visible mounts of a Linux system, without capacity figures.
+
+        The parsed table is cached and only re-read after the kernel signals a
+        mount table change on /proc/self/mountinfo.
+
+        Returns:
+            List[DriveInfo]: Mounted filesystems, or an empty list where
+            /proc/self/mountinfo is not available
+        """
+        with DriveOperations._lock:
+            raw = DriveOperations._read_mountinfo_if_changed()
+            if raw is not None:
+                DriveOperations._mounts = DriveOperations._parse_mountinfo(raw)
+            return list(DriveOperations._mounts or [])
+
+    @staticmethod
+    def get_device_info(path: str) -> Optional[DriveInfo]:
+        """
+        Get the mount and device characteristics for the filesystem holding a path.
+
+        Args:
+            path: Any existing file or directory
+
+        Returns:
+            Optional[DriveInfo]: Information about the containing mount, or None
+            if it cannot be determined
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        dev_id = f"{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+        real_path = os.path.realpath(path)
+
+        best = None
+        for mount in DriveOperations.get_mounts():
+            if mount.dev_id != dev_id:
+                continue
+            if DriveOperations._is_within(real_path, mount.mount_point):
+                if best is None or len(mount.mount_point) > len(best.mount_point):
+                    best = mount
+        return best
+
+    @staticmethod
+    def suggest_parallelism(path: str) -> int:
+        """
+        Suggest how many concurrent I/O workers suit the device holding a path.
+
+        Args:
+            path: Any existing file or directory
+
+        Returns:
+            int: Suggested number of workers
+        """
+        info = DriveOperations.get_device_info(path)
+        if info is None:
+            return DEVICE_PARALLELISM['unknown']
+        return info.parallelism
+
+    @staticmethod
+    def _read_mountinfo_if_changed() -> Optional[bytes]:
+        """
+        Return the mount table contents if it changed since the last call.
+
+        The kernel raises POLLPRI on an open mountinfo file whenever a mount
+        is added or removed, so an unchanged table costs one poll() call.
+        """
+        cls = DriveOperations
+        if cls._mountinfo_fd is None:
+            try:
+                cls._mountinfo_fd = os.open(MOUNTINFO_PATH, os.O_RDONLY)
+            except OSError:
+                return None
+            if hasattr(select, 'poll'):
+                cls._mountinfo_poll = select.poll()
+                cls._mountinfo_poll.register(cls._mountinfo_fd, select.POLLPRI | select.POLLERR)
+        elif cls._mountinfo_poll is not None and not cls._mountinfo_poll.poll(0):
+            return None
+
+        # Reading the file from the start also re-arms the change notification
+        chunks = []
+        os.lseek(cls._mountinfo_fd, 0, os.SEEK_SET)
+        while True:
+            chunk = os.read(cls._mountinfo_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        raw = b"".join(chunks)
+        if raw == cls._mountinfo_raw:
+            return None
+        cls._mountinfo_raw = raw
+        return raw
+
+    @staticmethod
+    def _parse_mountinfo(raw: bytes) -> List[DriveInfo]:
+        """Parse /proc/self/mountinfo contents into DriveInfo entries."""
+        media_cache: Dict[str, str] = {}
+        mounts = []
+        for line in raw.decode('utf-8', 'surrogateescape').splitlines():
+            fields = line.split()
+            try:
+                separator = fields.index('-')
+                dev_id, mount_point, options = fields[2], fields[4], fields[5]
+                fs_type, source = fields[separator + 1], fields[separator + 2]
+            except (ValueError, IndexError):
+                continue
+
+            mount_point = DriveOperations._unescape(mount_point)
+            if fs_type in PSEUDO_FS_TYPES:
+                continue
+            if any(DriveOperations._is_within(mount_point, root) for root in PSEUDO_MOUNT_ROOTS):
+                continue
+            if mount_point in PSEUDO_MOUNT_POINTS or os.path.dirname(mount_point) in PSEUDO_MOUNT_PARENTS:
+                continue
+
+            if dev_id not in media_cache:
+                media_cache[dev_id] = DriveOperations._detect_media(dev_id, fs_type)
+            mounts.append(DriveInfo(
+                mount_point=mount_point,
+                device=DriveOperations._unescape(source),
+                fs_type=fs_type,
+                dev_id=dev_id,
+                media=media_cache[dev_id],
+                read_only='ro' in options.split(','),
+            ))
+        return mounts
+
+    @staticmethod
+    def _detect_media(dev_id: str, fs_type: str) -> str:
+        """Classify a device as nvme, ssd, hdd, network, memory or unknown."""
+        if fs_type in NETWORK_FS_TYPES or fs_type.split('.')[0] in NETWORK_FS_TYPES:
+            return 'network'
+        if fs_type in MEMORY_FS_TYPES:
+            return 'memory'
+
+        sys_path = f"/sys/dev/block/{dev_id}"
+        if not os.path.exists(sys_path):
+            return 'unknown'
+        return DriveOperations._block_device_media(os.path.realpath(sys_path))
+
+    @staticmethod
+    def _block_device_media(device_dir: str) -> str:
+        """Classify a /sys/devices block device directory, following stacked devices."""
+        # Partitions have no queue directory of their own; their disk is the parent
+        if not os.path.isdir(os.path.join(device_dir, 'queue')):
+            device_dir = os.path.dirname(device_dir)
+
+        # Device-mapper, md and similar devices inherit from their slowest member
+        slaves_dir = os.path.join(device_dir, 'slaves')
+        try:
+            slaves = os.listdir(slaves_dir)
+        except OSError:
+            slaves = []
+        if slaves:
+            ranking = ['hdd', 'unknown', 'ssd', 'nvme']
+            kinds = [DriveOperations._block_device_media(os.path.realpath(os.path.join(slaves_dir, s)))
+                     for s in slaves]
+            return min(kinds, key=ranking.index)
+
+        if os.path.basename(device_dir).startswith('nvme'):
+            return 'nvme'
+        try:
+            with open(os.path.join(device_dir, 'queue', 'rotational'), 'r') as f:
+                return 'hdd' if f.read().strip() == '1' else 'ssd'
+        except OSError:
+            return 'unknown'
+
+    @staticmethod
+    def _unescape(value: str) -> str:
+        """Decode the octal escapes (e.g. \\040 for space) used in mountinfo."""
+        if '\\' not in value:
+            return value
+        return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), value)
+
+    @staticmethod
+    def _is_within(path: str, root: str) -> bool:
+        """Check whether path equals root or lies below it."""
+        return path == root or path.startswith(root.rstrip('/') + '/')
+
     @staticmethod
     def _get_windows_drives() -> List[str]:
         """Get available drives on Windows system."""
         # Import windll only when on Windows
         from ctypes import windll
-        
+
         drives = []
         bitmask = windll.kernel32.GetLogicalDrives()
-        
+
         for letter in range(65, 91):  # A-Z
             if bitmask & (1 << (letter - 65)):
                 drive = chr(letter) + ":\\"
                 drives.append(drive)
-        
-        return drives 
\ No newline at end of file
+
+        return drives
@@ -1,70 +1,263 @@
 import os
 import shutil
+import tempfile
+import threading
+import time
 from datetime import datetime
-from typing import Tuple, List, Optional
+from functools import partial
+from typing import Iterable, Tuple, List, Optional
+
+from src.core.io_scheduler import IOScheduler, IOTask, ProgressCallback
+from src.core.throttle import Throttle, copy_file_throttled
+from src.core.backup_verifier import BackupVerifier
+from src.core.backup_index import ARCHIVE_INDEX_SUFFIX, MANIFEST_SUFFIX, BackupIndex
+from src.core.backup_retention import BackupRetention, RetentionPolicy
+from src.core.chunk_store import ChunkedBackup
+from src.core.archive_backup import ARCHIVE_EXTENSIONS, ArchiveBackup, default_codec
+from src.core.dir_lock import LockManager
+from src.core.filesystem import FileSystem
+from src.core.rename_engine import NameAllocator
+from src.utils.metrics import Metrics
+from src.utils.profiling import traced
 
 class FileOperations:
     """Handles all file-related operations in a clean and organized way."""
     
     @staticmethod
-    def create_backup(path: str) -> bool:
+    @traced('backup')
+    def create_backup(path: str, throttle: Optional[Throttle] = None, verify: bool = False,
+                      retention: Optional[RetentionPolicy] = None, chunked: bool = False,
+                      archive: bool = False, compression: Optional[str] = None,
+                      progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None) -> bool:
         """
         Create a backup of the specified file or directory with timestamp.
         
+        Chunked backups store file contents as deduplicated, content-defined
+        chunks shared with earlier chunked backups in the same directory, so
+        backing up a large file again only stores the regions that changed.
+        Archive backups stream everything into one compressed tar file, which
+        suits copies kept on another volume.
+        
         Args:
             path: Path to the file or directory to backup
+            throttle: Optional bandwidth/file-rate limits for the copy
+            verify: Check each copied file against its source right after copying it
+            retention: Optional policy applied to the path's backups after this one is made
+            chunked: Write a chunked, incremental backup instead of a full copy
+            archive: Write a compressed tar archive instead of a full copy
+            compression: Archive codec ('gzip', 'xz' or 'zstd'), defaults to zstd when installed
+            progress: Called with (completed, total, path) as files are backed up
+            cancel: Event that stops the backup when set; the partial backup is removed
             
         Returns:
             bool: True if backup was successful, False otherwise
+            
+        Raises:
+            LockTimeout: If another run keeps the path locked for longer than the lock timeout
         """
         if not os.path.exists(path):
             return False
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
         backup_path = f"{path}.backup_{timestamp}"
-        
-        try:
-            if os.path.isfile(path):
-                shutil.copy2(path, backup_path)
-            else:
-                shutil.copytree(path, backup_path)
-            return True
-        except Exception:
+        index = BackupIndex()
+        metrics = Metrics.shared()
+        if any(os.path.lexists(backup_path + suffix) for suffix in ('', MANIFEST_SUFFIX, *ARCHIVE_EXTENSIONS.values())):
+            # Another backup was made in the same second
             return False
+        
+        kind = 'chunked' if chunked else 'archive' if archive else 'copy'
+        # Other readers are fine, but nothing may change the path while it is being copied
+        with LockManager.shared().acquire(path, exclusive=False, purpose='backup'):
+            try:
+                with metrics.phase(f'backup.{kind}'):
+                    if chunked:
+                        backup_path += MANIFEST_SUFFIX
+                        previous = index.latest(path, kind='chunked')
+                        stats = ChunkedBackup.create(path, backup_path, previous.path if previous else None, throttle,
+                                                     progress, cancel)
+                        files = stats['files']
+                    elif archive:
+                        codec = compression or default_codec()
+                        backup_path += ARCHIVE_EXTENSIONS[codec]
+                        stats = ArchiveBackup.create(path, backup_path, codec, throttle, progress=progress, cancel=cancel)
+                        files = stats['members']
+                        metrics.inc('bytes_copied_total', stats['bytes'])
+                    elif os.path.isfile(path):
+                        FileOperations._copy_file(path, backup_path, throttle, verify)
+                        files = 1
+                        if progress is not None:
+                            progress(1, 1, path)
+                    else:
+                        files = FileOperations._copy_tree(path, backup_path, throttle, verify, progress, cancel)
+                metrics.inc('files_scanned_total', files, operation='backup')
+            
+                # Copies are verified file by file as they are made; other formats are checked as a whole
+                if kind != 'copy' and verify and any(True for _ in BackupVerifier.verify(path, backup_path)):
+                    os.remove(backup_path)
+                    if kind == 'archive':
+                        os.remove(backup_path + ARCHIVE_INDEX_SUFFIX)
+                    return False
+            except Exception as e:
+                metrics.count_error('backup', e)
+                # Never leave a partial backup behind that could later be mistaken for a complete one
+                if os.path.isdir(backup_path) and not os.path.islink(backup_path):
+                    shutil.rmtree(backup_path, ignore_errors=True)
+                elif os.path.lexists(backup_path):
+                    os.remove(backup_path)
+                return False
+        
+        index.record(path, backup_path, now.timestamp(), kind=kind)
+        if retention is not None:
+            BackupRetention.prune(path, retention, index=index)
+        return True
     
     @staticmethod
-    def revert_to_backup(path: str) -> bool:
+    @traced('revert')
+    def revert_to_backup(path: str, members: Optional[List[str]] = None,
+                         progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None) -> bool:
         """
         Revert file or directory to its most recent backup.
         
+        The backup is restored into a staging directory next to the path
+        and then renamed into place, so a restore that fails or is
+        cancelled leaves the path as it was.
+        
         Args:
             path: Path to the file or directory to revert
+            members: Optional files or subtrees, relative to the path, to revert instead of everything
+            progress: Called with (completed, total, path) as files are restored
+            cancel: Event that stops the revert when set, leaving the path as it was
             
         Returns:
             bool: True if revert was successful, False otherwise
+            
+        Raises:
+            LockTimeout: If another run keeps the path locked for longer than the lock timeout
         """
         if not os.path.exists(path):
             return False
         
-        backups = FileOperations._get_backup_files(path)
-        if not backups:
+        latest = BackupIndex().latest(path)
+        if latest is None:
             return False
+        latest_backup = latest.path
+        metrics = Metrics.shared()
+        
+        with LockManager.shared().acquire(path, purpose='restore'):
+            staging = None
+            try:
+                start = time.perf_counter()
+                members = FileOperations._restore_members(members)
+                # Restore next to the path first, so a failed restore leaves the live tree untouched
+                staging = tempfile.mkdtemp(prefix='.onlyfiles-restore-', dir=os.path.dirname(os.path.abspath(path)))
+                restored = os.path.join(staging, 'restored')
+                if latest.kind == 'chunked':
+                    ChunkedBackup.restore(latest_backup, restored, members, progress, cancel)
+                elif latest.kind == 'archive':
+                    ArchiveBackup.extract(latest_backup, restored, members, progress, cancel)
+                elif members:
+                    for member in members:
+                        source, target = os.path.join(latest_backup, member), os.path.join(restored, member)
+                        if not os.path.lexists(source):
+                            raise KeyError(f"{member} is not in the backup")
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        if os.path.isdir(source) and not os.path.islink(source):
+                            FileOperations._copy_tree(source, target, progress=progress, cancel=cancel)
+                        else:
+                            shutil.copy2(source, target, follow_symlinks=False)
+                elif os.path.isfile(latest_backup):
+                    shutil.copy2(latest_backup, restored)
+                else:
+                    FileOperations._copy_tree(latest_backup, restored, progress=progress, cancel=cancel)
+                
+                # Reverted subtrees are replaced, not merged with what is there now
+                FileOperations._swap_in(restored, path, members or ['.'], os.path.join(staging, 'replaced'))
+                metrics.observe('phase_duration_seconds', time.perf_counter() - start, phase=f'revert.{latest.kind}')
+                return True
+            except Exception as e:
+                metrics.count_error('revert', e)
+                return False
+            finally:
+                if staging is not None:
+                    shutil.rmtree(staging, ignore_errors=True)
+    
+    @staticmethod
+    def _restore_members(members: Optional[Iterable[str]]) -> Optional[List[str]]:
+        """
+        Normalize the members of a restore, or return None to restore everything.
         
-        latest_backup = max(backups, key=lambda x: os.path.getctime(x))
+        Raises:
+            KeyError: If a member is absolute or leaves the restored path through '..'
+        """
+        if not members:
+            return None
+        if isinstance(members, str):
+            # e.g. a single member sent over RPC
+            members = [members]
+        normalized = []
+        for member in members:
+            relative = os.path.normpath(member)
+            if os.path.isabs(relative) or relative == os.pardir or relative.startswith(os.pardir + os.sep):
+                raise KeyError(f"{member} is not in the backup")
+            if relative == os.curdir:
+                return None
+            normalized.append(relative)
+        # A member inside another one is restored along with it
+        return [member for member in normalized
+                if not any(member.startswith(other + os.sep) for other in normalized)]
+    
+    @staticmethod
+    def _swap_in(restored: str, path: str, members: List[str], replaced: str):
+        """
+        Put restored files and subtrees in place of the live ones, by renaming both.
+        
+        Live paths are moved aside into the staging directory first; if
+        any replacement cannot be put in place, every swap made so far is
+        undone.
         
+        Args:
+            restored: Staging copy of the restored path
+            path: Path being restored
+            members: Relative paths to swap, '.' for the whole path
+            replaced: Directory in the staging area that receives the live paths
+            
+        Raises:
+            OSError: If a restored path could not be put in place
+        """
+        root = os.path.realpath(path)
+        os.makedirs(replaced)
+        # (source, target, where the live target was moved, or None) per swap made
+        swapped: List[Tuple[str, str, Optional[str]]] = []
         try:
-            if os.path.isfile(path):
-                shutil.copy2(latest_backup, path)
-            else:
-                # Remove existing directory and replace with backup
-                shutil.rmtree(path)
-                shutil.copytree(latest_backup, path)
-            return True
-        except Exception:
-            return False
+            for number, member in enumerate(members):
+                source = os.path.normpath(os.path.join(restored, member))
+                target = os.path.normpath(os.path.join(path, member))
+                parent = os.path.realpath(os.path.dirname(target))
+                if member != os.curdir and parent != root and not parent.startswith(os.path.join(root, '')):
+                    # A symlinked directory in the live tree would send the restore elsewhere
+                    raise OSError(f"{target} is outside {path}")
+                aside = os.path.join(replaced, str(number)) if os.path.lexists(target) else None
+                if aside is not None:
+                    os.rename(target, aside)
+                swapped.append((source, target, aside))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(source, target)
+        except OSError:
+            for source, target, aside in reversed(swapped):
+                if os.path.lexists(target) and not os.path.lexists(source):
+                    os.rename(target, source)
+                if aside is not None:
+                    os.rename(aside, target)
+            raise
     
     @staticmethod
-    def move_files(source_path: str, destination_path: str, file_pattern: Optional[str] = None) -> List[str]:
+    @traced('move')
+    def move_files(source_path: str, destination_path: str, file_pattern: Optional[str] = None,
+                   throttle: Optional[Throttle] = None, verify: bool = False,
+                   progress: Optional[ProgressCallback] = None,
+                   cancel: Optional[threading.Event] = None) -> List[str]:
         """
         Move files from source to destination, optionally filtering by pattern.
         
@@ -72,47 +265,255 @@ class FileOperations:
             source_path: Source directory path
             destination_path: Destination directory path
             file_pattern: Optional pattern to filter files (e.g., "*.txt")
+            throttle: Optional bandwidth/file-rate limits for the moves
+            verify: Check data copied across filesystems before removing the source
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
             
         Returns:
             List[str]: List of successfully moved files
+            
+        Raises:
+            LockTimeout: If another run keeps the path locked for longer than the lock timeout
         """
-        if not os.path.exists(source_path) or not os.path.exists(destination_path):
+        fs = FileSystem.current()
+        if not fs.exists(source_path) or not fs.exists(destination_path):
             return []
         
-        moved_files = []
-        files = os.listdir(source_path)
-        
-        for file in files:
-            if file_pattern and not file.endswith(file_pattern):
-                continue
+        with LockManager.shared().acquire([source_path, destination_path], purpose='move'):
+            metrics = Metrics.shared()
+            tasks = []
+            scanned = 0
+            with metrics.phase('move.scan'), fs.scandir(source_path) as it:
+                for entry in it:
+                    if file_pattern and not entry.name.endswith(file_pattern):
+                        continue
+                    if not entry.is_file():
+                        continue
+                    scanned += 1
                 
-            source = os.path.join(source_path, file)
-            destination = os.path.join(destination_path, file)
+                    source = entry.path
+                    destination = os.path.join(destination_path, entry.name)
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        continue
+                    action = partial(FileOperations._move_file, source, destination, throttle, verify)
+                    tasks.append(IOTask(source, destination, action, size))
+        
+            metrics.inc('files_scanned_total', scanned, operation='move')
+        
+            with metrics.phase('move.transfer'):
+                results = IOScheduler.shared().run(tasks, progress, cancel)
+            moved = []
+            for result in results:
+                if result.ok:
+                    moved.append(os.path.basename(result.task.source))
+                else:
+                    metrics.count_error('move', result.error)
+            metrics.inc('files_moved_total', len(moved), operation='move')
+            return moved
+    
+    @staticmethod
+    @traced('move')
+    def move_paths(paths: Iterable[str], destination_path: str, throttle: Optional[Throttle] = None,
+                   verify: bool = False, progress: Optional[ProgressCallback] = None,
+                   cancel: Optional[threading.Event] = None) -> List[str]:
+        """
+        Move the given files, which may come from many directories, into one directory.
+        
+        Files that would overwrite one already there, or each other, get a
+        numbered name instead.
+        
+        Args:
+            paths: Files to move
+            destination_path: Destination directory path
+            throttle: Optional bandwidth/file-rate limits for the moves
+            verify: Check data copied across filesystems before removing the source
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
+            
+        Returns:
+            List[str]: Paths of the files moved
             
-            if os.path.isfile(source):
+        Raises:
+            LockTimeout: If another run keeps a path locked for longer than the lock timeout
+        """
+        fs = FileSystem.current()
+        if not fs.isdir(destination_path):
+            return []
+        paths = [os.path.abspath(path) for path in paths]
+        directories = sorted({os.path.dirname(path) for path in paths} | {os.path.abspath(destination_path)})
+        
+        with LockManager.shared().acquire(directories, purpose='move'):
+            metrics = Metrics.shared()
+            allocator = NameAllocator.for_directory(destination_path)
+            tasks = []
+            for source in paths:
                 try:
-                    shutil.move(source, destination)
-                    moved_files.append(file)
-                except Exception:
+                    size = fs.stat(source).st_size
+                except OSError as e:
+                    metrics.count_error('move', e)
                     continue
-        
-        return moved_files
+                destination = os.path.join(destination_path, allocator.claim(os.path.basename(source), source))
+                action = partial(FileOperations._move_file, source, destination, throttle, verify)
+                tasks.append(IOTask(source, destination, action, size))
+            metrics.inc('files_scanned_total', len(paths), operation='move')
+            
+            with metrics.phase('move.transfer'):
+                results = IOScheduler.shared().run(tasks, progress, cancel)
+            moved = []
+            for result in results:
+                if result.ok:
+                    moved.append(result.task.source)
+                else:
+                    metrics.count_error('move', result.error)
+            metrics.inc('files_moved_total', len(moved), operation='move')
+            return moved
     
     @staticmethod
-    def _get_backup_files(path: str) -> List[str]:
+    def get_latest_backup(path: str) -> Optional[str]:
         """
-        Get list of backup files for a given file or directory path.
+        Get the most recent backup of a file or directory.
         
         Args:
             path: Path to the file or directory
             
         Returns:
-            List[str]: List of backup file/directory paths
-        """
-        directory = os.path.dirname(path)
-        name = os.path.basename(path)
-        return [
-            os.path.join(directory, f) 
-            for f in os.listdir(directory) 
-            if f.startswith(name + ".backup_")
-        ] 
\ No newline at end of file
+            Optional[str]: Path of the newest backup, or None if there is none
+        """
+        latest = BackupIndex().latest(path)
+        return latest.path if latest else None
+    
+    @staticmethod
+    def _copy_file(source: str, destination: str, throttle: Optional[Throttle] = None,
+                   verify: bool = False) -> str:
+        """
+        Copy a file with its metadata, honouring an optional throttle.
+        
+        Args:
+            source: File to copy
+            destination: Destination file path
+            throttle: Optional bandwidth/file-rate limits
+            verify: Compare the copy with the source right after copying
+            
+        Returns:
+            str: Path of the copy
+        """
+        if throttle is not None:
+            throttle.file()
+        return FileOperations._copy_data(source, destination, throttle, verify)
+    
+    @staticmethod
+    @traced('copy')
+    def _copy_data(source: str, destination: str, throttle: Optional[Throttle] = None,
+                   verify: bool = False) -> str:
+        """
+        Copy a file's data and metadata, optionally throttled and verified.
+        
+        Without a bandwidth limit this is plain shutil.copy2, so unthrottled
+        copies keep the kernel's fast copy path. Verification hashes both
+        files immediately, while their pages are still cached, and removes
+        the copy if it does not match.
+        
+        Args:
+            source: File to copy
+            destination: Destination file path
+            throttle: Optional bandwidth limit
+            verify: Compare the copy with the source right after copying
+            
+        Returns:
+            str: Path of the copy
+            
+        Raises:
+            OSError: If copying fails or the copy does not match the source
+        """
+        if throttle is None or not throttle.limits_bytes:
+            copied = shutil.copy2(source, destination)
+        else:
+            copied = copy_file_throttled(source, destination, throttle)
+        
+        metrics = Metrics.shared()
+        metrics.inc('syscalls_total', call='copy')
+        metrics.inc('bytes_copied_total', os.path.getsize(copied))
+        
+        if verify and not BackupVerifier.files_match(source, copied):
+            os.remove(copied)
+            raise OSError(f"Verification failed: {copied} does not match {source}")
+        return copied
+    
+    @staticmethod
+    def _move_file(source: str, destination: str, throttle: Optional[Throttle] = None,
+                   verify: bool = False) -> str:
+        """
+        Move a file like shutil.move, honouring an optional throttle.
+        
+        Renames within a filesystem only count against the file rate; moves
+        across filesystems copy the data at the throttled byte rate and, if
+        requested, verify it before the source is removed.
+        
+        Args:
+            source: File to move
+            destination: Destination file path
+            throttle: Optional bandwidth/file-rate limits
+            verify: Verify data copied across filesystems
+            
+        Returns:
+            str: Path of the moved file
+        """
+        if throttle is not None:
+            throttle.file()
+        # shutil.move always tries a rename first; copies across filesystems are counted by _copy_data
+        Metrics.shared().inc('syscalls_total', call='rename')
+        copy_function = partial(FileOperations._copy_data, throttle=throttle, verify=verify)
+        return FileSystem.current().move(source, destination, copy_function=copy_function)
+    
+    @staticmethod
+    def _copy_tree(source: str, destination: str, throttle: Optional[Throttle] = None,
+                   verify: bool = False, progress: Optional[ProgressCallback] = None,
+                   cancel: Optional[threading.Event] = None) -> int:
+        """
+        Copy a directory tree like shutil.copytree, with file copies run by the IOScheduler.
+        
+        copytree is used to recreate the directory structure and symlinks,
+        while the file copies it asks for are collected and then submitted
+        to the scheduler in one go.
+        
+        Args:
+            source: Directory to copy
+            destination: Path of the new copy, which must not exist
+            throttle: Optional bandwidth/file-rate limits for the file copies
+            verify: Compare each copy with its source right after copying
+            progress: Called with (completed, total, path) as files are copied
+            cancel: Event that skips the remaining copies when set
+            
+        Returns:
+            int: Number of files copied
+            
+        Raises:
+            shutil.Error: If any file could not be copied
+        """
+        tasks = []
+        
+        def collect(src: str, dst: str) -> str:
+            action = partial(FileOperations._copy_file, src, dst, throttle, verify)
+            tasks.append(IOTask(src, dst, action, os.path.getsize(src)))
+            return dst
+        
+        shutil.copytree(source, destination, copy_function=collect)
+        results = IOScheduler.shared().run(tasks, progress, cancel)
+        
+        # Creating files updated the directories' mtimes after copytree set them
+        for root, dirs, _ in os.walk(destination, topdown=False):
+            for name in dirs:
+                relative = os.path.relpath(os.path.join(root, name), destination)
+                try:
+                    shutil.copystat(os.path.join(source, relative), os.path.join(root, name), follow_symlinks=False)
+                except OSError:
+                    continue
+        shutil.copystat(source, destination)
+        
+        errors = [(r.task.source, r.task.destination, str(r.error)) for r in results if not r.ok]
+        if errors:
+            raise shutil.Error(errors)
+        return len(results)
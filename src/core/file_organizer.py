@@ -1,221 +1,669 @@
+import errno
 import os
-import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from functools import partial
+from typing import Callable, Iterable, List, Dict, Optional, Set, Tuple
 from pathlib import Path
 
+from src.core.archive_backup import ARCHIVE_EXTENSIONS, ArchiveBackup, available_codecs, default_codec
+from src.core.backup_index import ARCHIVE_INDEX_SUFFIX, MANIFEST_SUFFIX, BackupIndex
+from src.core.chunk_store import STORE_DIRNAME
+from src.core.io_scheduler import IOScheduler, IOTask, OperationCancelled, ProgressCallback
+from src.core.capture_date import CaptureDates
+from src.core.dir_lock import LockManager
+from src.core.file_stat import FileStat, StatCollector
+from src.core.filesystem import FileSystem
+from src.core.rename_engine import DEFAULT_CONFLICT_TEMPLATE, NameAllocator
+from src.core.scan_cache import ScanCache
+from src.utils.metrics import Metrics
+from src.utils.profiling import Profiler, traced
+
+# Dates organize_by_date can sort by
+DATE_SOURCES = ('birth', 'ctime', 'mtime', 'capture')
+# Ways a directory can be organized
+ORGANIZE_METHODS = ('type', 'extension', 'date', 'size')
+# Files per shard when organizing a huge directory in shards
+DEFAULT_SHARD_SIZE = 4096
+# Archives a directory can be organized into
+ARCHIVE_FORMATS = ('tar', 'zip')
+# Comment of the zip archives organize_to_archives() writes, so later runs leave them alone
+ORGANIZED_ZIP_COMMENT = b"onlyfiles-organize"
+
 class FileOrganizer:
     """Handles file organization operations in a clean and organized way."""
     
+    # File type categories and their extensions
+    TYPE_CATEGORIES = {
+        'images': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'],
+        'documents': ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt', '.xls', '.xlsx'],
+        'audio': ['.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg'],
+        'video': ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
+        'archives': ['.zip', '.rar', '.7z', '.tar', '.gz'],
+        'code': ['.py', '.js', '.html', '.css', '.java', '.cpp', '.h', '.php'],
+        'others': []
+    }
+    
+    # Reverse lookup from extension to category
+    EXTENSION_CATEGORIES = {
+        extension: category
+        for category, extensions in TYPE_CATEGORIES.items()
+        for extension in extensions
+    }
+    
     @staticmethod
-    def organize_by_extension(directory: str) -> Dict[str, List[str]]:
+    def organize_by_extension(directory: str, progress: Optional[ProgressCallback] = None,
+                              cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
         """
         Organize files by their extensions into separate folders.
         
         Args:
             directory: Directory to organize
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
             
         Returns:
             Dict[str, List[str]]: Dictionary with extension as key and list of moved files as value
         """
-        if not os.path.exists(directory):
-            return {}
-            
-        organized_files = {}
-        files = os.listdir(directory)
+        categorize, initial_keys, prepare = FileOrganizer._strategy('extension')
+        return FileOrganizer._organize(directory, categorize, initial_keys, prepare, progress, cancel)
+    
+    @staticmethod
+    def organize_by_date(directory: str, date_source: str = 'birth', progress: Optional[ProgressCallback] = None,
+                         cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
+        """
+        Organize files by their creation date into year/month folders.
         
-        for file in files:
-            file_path = os.path.join(directory, file)
-            if not os.path.isfile(file_path):
-                continue
-                
-            # Get file extension without the dot
-            extension = os.path.splitext(file)[1][1:].lower() or 'no_extension'
+        Args:
+            directory: Directory to organize
+            date_source: Which date to use: 'birth' (creation time where the filesystem
+                records it, otherwise the earlier of ctime and mtime), 'ctime' (inode
+                change time), 'mtime', or 'capture' (photo/video metadata, falling back to mtime)
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
             
-            # Create extension directory if it doesn't exist
-            extension_dir = os.path.join(directory, extension)
-            os.makedirs(extension_dir, exist_ok=True)
+        Returns:
+            Dict[str, List[str]]: Dictionary with date as key and list of moved files as value
+        """
+        categorize, initial_keys, prepare = FileOrganizer._strategy('date', date_source)
+        return FileOrganizer._organize(directory, categorize, initial_keys, prepare, progress, cancel)
+    
+    @staticmethod
+    def organize_by_size(directory: str, progress: Optional[ProgressCallback] = None,
+                         cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
+        """
+        Organize files by their size into categories (small, medium, large).
+        
+        Args:
+            directory: Directory to organize
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
             
-            # Move file to extension directory
-            try:
-                shutil.move(file_path, os.path.join(extension_dir, file))
-                if extension not in organized_files:
-                    organized_files[extension] = []
-                organized_files[extension].append(file)
-            except Exception:
-                continue
-                
-        return organized_files
+        Returns:
+            Dict[str, List[str]]: Dictionary with size category as key and list of moved files as value
+        """
+        categorize, initial_keys, prepare = FileOrganizer._strategy('size')
+        return FileOrganizer._organize(directory, categorize, initial_keys, prepare, progress, cancel)
     
     @staticmethod
-    def organize_by_date(directory: str) -> Dict[str, List[str]]:
+    def organize_by_type(directory: str, progress: Optional[ProgressCallback] = None,
+                         cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
         """
-        Organize files by their creation date into year/month folders.
+        Organize files by their type (images, documents, audio, video, etc.).
         
         Args:
             directory: Directory to organize
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
             
         Returns:
-            Dict[str, List[str]]: Dictionary with date as key and list of moved files as value
+            Dict[str, List[str]]: Dictionary with file type as key and list of moved files as value
         """
-        if not os.path.exists(directory):
-            return {}
+        categorize, initial_keys, prepare = FileOrganizer._strategy('type')
+        return FileOrganizer._organize(directory, categorize, initial_keys, prepare, progress, cancel)
+    
+    @staticmethod
+    def _strategy(by: str, date_source: str = 'birth') -> Tuple[Callable[[os.DirEntry], Tuple[str, str]],
+                                                              List[str],
+                                                              Optional[Callable[[List[os.DirEntry]], None]]]:
+        """
+        Build the functions that decide where each file goes for one way of organizing.
+        
+        Args:
+            by: 'type', 'extension', 'date' or 'size'
+            date_source: Date used when organizing by date
+            
+        Returns:
+            Tuple: (categorize, initial result keys, prepare or None); categorize
+            returns (result key, destination subdirectory) for a file and prepare is
+            called with each batch of files before any of them is categorized
+            
+        Raises:
+            ValueError: If the way of organizing or the date source is unknown
+        """
+        if by == 'extension':
+            def categorize(entry: os.DirEntry) -> Tuple[str, str]:
+                # Get file extension without the dot
+                extension = os.path.splitext(entry.name)[1][1:].lower() or 'no_extension'
+                return extension, extension
             
-        organized_files = {}
-        files = os.listdir(directory)
+            return categorize, [], None
         
-        for file in files:
-            file_path = os.path.join(directory, file)
-            if not os.path.isfile(file_path):
-                continue
-                
-            # Get file creation time
-            creation_time = os.path.getctime(file_path)
-            date = datetime.fromtimestamp(creation_time)
+        if by == 'date':
+            if date_source not in DATE_SOURCES:
+                raise ValueError(f"Unknown date source '{date_source}'")
+            dates: Dict[str, float] = {}
             
-            # Create year/month directory structure
-            year_dir = os.path.join(directory, str(date.year))
-            month_dir = os.path.join(year_dir, str(date.month).zfill(2))
-            os.makedirs(month_dir, exist_ok=True)
+            def date_of(st: FileStat) -> float:
+                if date_source == 'birth':
+                    return st.created
+                # Also dates the files 'capture' found no capture time for
+                return st.ctime if date_source == 'ctime' else st.mtime
             
-            # Move file to date directory
-            try:
-                shutil.move(file_path, os.path.join(month_dir, file))
+            def prepare(entries: List[os.DirEntry]):
+                if date_source == 'capture':
+                    # Read all headers up front, in parallel, instead of one file at a time
+                    dates.update(CaptureDates().lookup(entries))
+                else:
+                    # Stat every file up front, in parallel batches, with one call per file
+                    for path, st in StatCollector.collect((entry.path for entry in entries), follow_symlinks=True).items():
+                        dates[path] = date_of(st)
+            
+            def categorize(entry: os.DirEntry) -> Tuple[str, str]:
+                timestamp = dates.pop(entry.path, None)
+                if timestamp is None:
+                    timestamp = date_of(StatCollector.stat(entry.path, follow_symlinks=True))
+                date = datetime.fromtimestamp(timestamp)
+                
+                # Year/month directory structure
                 date_key = f"{date.year}/{date.month:02d}"
-                if date_key not in organized_files:
-                    organized_files[date_key] = []
-                organized_files[date_key].append(file)
-            except Exception:
-                continue
+                return date_key, os.path.join(str(date.year), str(date.month).zfill(2))
+            
+            return categorize, [], prepare
+        
+        if by == 'size':
+            def categorize(entry: os.DirEntry) -> Tuple[str, str]:
+                # Get file size in MB
+                size_mb = entry.stat().st_size / (1024 * 1024)
                 
-        return organized_files
+                # Determine size category
+                if size_mb < 1:
+                    category = 'small'      # < 1MB
+                elif size_mb < 10:
+                    category = 'medium'     # 1MB - 10MB
+                else:
+                    category = 'large'      # > 10MB
+                return category, category
+            
+            return categorize, ['small', 'medium', 'large'], None
+        
+        if by == 'type':
+            def categorize(entry: os.DirEntry) -> Tuple[str, str]:
+                category = FileOrganizer.get_file_category(entry.name)
+                return category, category
+            
+            return categorize, list(FileOrganizer.TYPE_CATEGORIES), None
+        
+        raise ValueError(f"Unknown organization '{by}', expected one of {', '.join(ORGANIZE_METHODS)}")
     
     @staticmethod
-    def organize_by_size(directory: str) -> Dict[str, List[str]]:
+    def get_file_category(filename: str) -> str:
         """
-        Organize files by their size into categories (small, medium, large).
+        Get the type category (images, documents, ...) of a file name.
+        
+        Args:
+            filename: Name of the file
+            
+        Returns:
+            str: Category name, 'others' for unknown extensions
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        return FileOrganizer.EXTENSION_CATEGORIES.get(extension, 'others')
+    
+    @staticmethod
+    @traced('analyze')
+    def analyze_directory(directory: str, recursive: bool = False,
+                          cache: Optional[ScanCache] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Count the files and bytes of each type category, without moving anything.
+        
+        Args:
+            directory: Directory to analyze
+            recursive: Include subdirectories
+            cache: Listing cache to reuse, for long-running processes
+            
+        Returns:
+            Dict[str, Dict[str, int]]: Category to {'files': count, 'bytes': total size}
+        """
+        cache = cache or ScanCache(ttl=0)
+        analysis = {category: {'files': 0, 'bytes': 0} for category in FileOrganizer.TYPE_CATEGORIES}
+        pending = [directory]
+        # Other scans may run alongside, but nothing may be moving files around in the directory
+        with LockManager.shared().acquire(directory, exclusive=False, purpose='analyze'):
+            while pending:
+                current = pending.pop()
+                try:
+                    files, subdirectories = cache.list(current)
+                except OSError:
+                    continue
+                for scanned in files:
+                    totals = analysis[FileOrganizer.get_file_category(scanned.name)]
+                    totals['files'] += 1
+                    totals['bytes'] += scanned.size
+                if recursive:
+                    pending.extend(os.path.join(current, name) for name in subdirectories)
+        Metrics.shared().inc('files_scanned_total', sum(t['files'] for t in analysis.values()), operation='analyze')
+        return analysis
+    
+    @staticmethod
+    @traced('organize')
+    def _organize(directory: str, categorize: Callable[[os.DirEntry], Tuple[str, str]],
+                  initial_keys: Optional[List[str]] = None,
+                  prepare: Optional[Callable[[List[os.DirEntry]], None]] = None,
+                  progress: Optional[ProgressCallback] = None,
+                  cancel: Optional[threading.Event] = None,
+                  only: Optional[Set[str]] = None) -> Dict[str, List[str]]:
+        """
+        Move every file of a directory into the subdirectory chosen for it.
+        
+        The directory is scanned once and all destinations are planned up
+        front, so each category directory is created and listed only once
+        and name collisions are resolved in memory. The moves themselves are
+        submitted to the shared IOScheduler.
         
         Args:
             directory: Directory to organize
+            categorize: Returns (result key, destination subdirectory) for a file
+            initial_keys: Keys to include in the result even if no file matches
+            prepare: Called once with all files before any is categorized
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
+            only: Names of the files to organize, by default all of them
             
         Returns:
-            Dict[str, List[str]]: Dictionary with size category as key and list of moved files as value
+            Dict[str, List[str]]: Dictionary with result key and list of moved files as value
+            
+        Raises:
+            LockTimeout: If another run keeps the directory locked for longer than the lock timeout
         """
-        if not os.path.exists(directory):
+        fs = FileSystem.current()
+        if not fs.exists(directory):
             return {}
             
-        organized_files = {
-            'small': [],    # < 1MB
-            'medium': [],   # 1MB - 10MB
-            'large': []     # > 10MB
-        }
+        # Nothing else may move, rename or delete anything in the directory meanwhile
+        with LockManager.shared().acquire(directory, purpose='organize'):
+            metrics = Metrics.shared()
+            profiler = Profiler.shared()
+            organized_files = {key: [] for key in initial_keys or []}
+            with metrics.phase('organize.scan'):
+                with fs.scandir(directory) as it:
+                    listed = list(it)
+                names = {entry.name for entry in listed}
+                entries = [entry for entry in listed if entry.is_file() and (only is None or entry.name in only)
+                           and not FileOrganizer._is_backup_artifact(entry.name)
+                           and not FileOrganizer._is_indexed_archive(entry, names)]
+                metrics.inc('files_scanned_total', len(entries), operation='organize')
+            if prepare is not None:
+                with metrics.phase('organize.prepare'):
+                    prepare(entries)
         
-        files = os.listdir(directory)
+            tasks = []
+            keys = []
+            allocators: Dict[str, NameAllocator] = {}
+            with metrics.phase('organize.plan'):
+                for entry in entries:
+                    try:
+                        key, subdir = categorize(entry)
+                        size = entry.stat().st_size
+                    except OSError as e:
+                        metrics.count_error('organize', e)
+                        continue
+                
+                    # Create destination directory if it doesn't exist, and load its names once
+                    destination_dir = os.path.join(directory, subdir)
+                    if destination_dir not in allocators:
+                        with profiler.span('organize.mkdir', path=destination_dir):
+                            allocators[destination_dir] = NameAllocator.for_directory(destination_dir)
+                            fs.makedirs(destination_dir, exist_ok=True)
+                        metrics.inc('syscalls_total', call='mkdir')
+                
+                    # Files already in the destination are never overwritten
+                    destination = os.path.join(destination_dir, allocators[destination_dir].claim(entry.name, entry.path))
+                    tasks.append(IOTask(entry.path, destination, partial(fs.move, entry.path, destination), size))
+                    keys.append(key)
+                metrics.inc('syscalls_total', len(entries), call='stat')
         
-        for file in files:
-            file_path = os.path.join(directory, file)
-            if not os.path.isfile(file_path):
-                continue
+            with metrics.phase('organize.move'):
+                results = IOScheduler.shared().run(tasks, progress, cancel)
+            for key, result in zip(keys, results):
+                if result.ok:
+                    organized_files.setdefault(key, []).append(os.path.basename(result.task.source))
+                else:
+                    metrics.count_error('organize', result.error)
+            moved = sum(1 for result in results if result.ok)
+            metrics.inc('files_moved_total', moved, operation='organize')
+            metrics.inc('syscalls_total', moved, call='rename')
                 
-            # Get file size in bytes
-            size_bytes = os.path.getsize(file_path)
-            size_mb = size_bytes / (1024 * 1024)  # Convert to MB
-            
-            # Determine size category
-            if size_mb < 1:
-                category = 'small'
-            elif size_mb < 10:
-                category = 'medium'
-            else:
-                category = 'large'
-            
-            # Create category directory
-            category_dir = os.path.join(directory, category)
-            os.makedirs(category_dir, exist_ok=True)
-            
-            # Move file to category directory
-            try:
-                shutil.move(file_path, os.path.join(category_dir, file))
-                organized_files[category].append(file)
-            except Exception:
-                continue
+            return organized_files
+        
+    @staticmethod
+    @traced('organize.sharded')
+    def organize_sharded(directory: str, by: str = 'type', date_source: str = 'birth',
+                         shard_size: int = DEFAULT_SHARD_SIZE, workers: Optional[int] = None,
+                         progress: Optional[ProgressCallback] = None,
+                         cancel: Optional[threading.Event] = None) -> Dict[str, int]:
+        """
+        Organize a huge flat directory with memory that does not grow with the number of files.
+        
+        The listing is streamed from scandir in shards of shard_size
+        files, and each shard is classified and moved by one of a pool of
+        workers, so listing, classifying and moving overlap and the moves
+        keep the device's queue full. At most two shards per worker are in
+        memory at a time. Unlike the other organize methods, names already
+        taken in a destination are found by checking the filesystem rather
+        than from a listing held in memory, and only counts are returned.
+        
+        Args:
+            directory: Directory to organize
+            by: 'type', 'extension', 'date' or 'size'
+            date_source: Date used when organizing by date
+            shard_size: Files handed to a worker at a time
+            workers: Shards processed at the same time, defaults to the I/O scheduler's limit for the device
+            progress: Called with (completed, files seen so far, path) as files are moved; the
+                total grows while the directory is still being listed
+            cancel: Event that stops the listing and the moves at the next file when set
+            
+        Returns:
+            Dict[str, int]: Number of files moved for each result key
+            
+        Raises:
+            ValueError: If the way of organizing or the date source is unknown
+            LockTimeout: If another run keeps the directory locked for longer than the lock timeout
+        """
+        categorize, initial_keys, prepare = FileOrganizer._strategy(by, date_source)
+        fs = FileSystem.current()
+        if not fs.exists(directory):
+            return {}
+        workers = max(1, workers or IOScheduler.shared().limit_for(directory))
+        pipeline = _ShardPipeline(fs, directory, categorize, prepare, progress, cancel)
+        
+        with LockManager.shared().acquire(directory, purpose='organize'):
+            # Bounds the shards listed but not yet moved
+            slots = threading.BoundedSemaphore(workers * 2)
+            errors: List[BaseException] = []
+            
+            def finished(future):
+                slots.release()
+                if future.exception() is not None:
+                    errors.append(future.exception())
+            
+            with Metrics.shared().phase('organize.sharded'), \
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-shard") as executor:
+                def submit(shard: List[os.DirEntry]):
+                    pipeline.seen(len(shard))
+                    slots.acquire()
+                    executor.submit(pipeline.run, shard).add_done_callback(finished)
                 
+                shard: List[os.DirEntry] = []
+                # Entries moved into subdirectories while the listing is read are simply not returned again
+                with fs.scandir(directory) as it:
+                    for entry in it:
+                        if errors or (cancel is not None and cancel.is_set()):
+                            break
+                        try:
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                        except OSError:
+                            continue
+                        if FileOrganizer._is_backup_artifact(entry.name) or FileOrganizer._is_indexed_archive(entry):
+                            continue
+                        shard.append(entry)
+                        if len(shard) >= shard_size:
+                            submit(shard)
+                            shard = []
+                if shard and not errors:
+                    submit(shard)
+            if errors:
+                raise errors[0]
+        
+        counts = {key: 0 for key in initial_keys}
+        counts.update(pipeline.moved)
+        metrics = Metrics.shared()
+        metrics.inc('files_scanned_total', pipeline.total, operation='organize')
+        metrics.inc('files_moved_total', pipeline.completed, operation='organize')
+        metrics.inc('syscalls_total', pipeline.completed, call='rename')
+        return counts
+    
+    @staticmethod
+    @traced('organize.paths')
+    def organize_paths(paths: Iterable[str], by: str = 'type', date_source: str = 'birth',
+                       progress: Optional[ProgressCallback] = None,
+                       cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
+        """
+        Organize only the given files, each into a subdirectory of the directory it is in.
+        
+        Used to act on the result of a query without scanning for it again.
+        The files of each directory are organized together, as a normal
+        organize run would, and other files there are left alone.
+        
+        Args:
+            paths: Files to organize
+            by: 'type', 'extension', 'date' or 'size'
+            date_source: Date used when organizing by date
+            progress: Called with (completed, total, path) as the files of each directory are moved
+            cancel: Event that stops the remaining moves when set
+            
+        Returns:
+            Dict[str, List[str]]: Result key and the files moved for it
+            
+        Raises:
+            ValueError: If the way of organizing or the date source is unknown
+            LockTimeout: If another run keeps a directory locked for longer than the lock timeout
+        """
+        categorize, initial_keys, prepare = FileOrganizer._strategy(by, date_source)
+        by_directory: Dict[str, Set[str]] = {}
+        for path in paths:
+            path = os.path.abspath(path)
+            by_directory.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+        
+        organized_files = {key: [] for key in initial_keys}
+        for directory, names in by_directory.items():
+            if cancel is not None and cancel.is_set():
+                break
+            moved = FileOrganizer._organize(directory, categorize, None, prepare, progress, cancel, only=names)
+            for key, files in moved.items():
+                organized_files.setdefault(key, []).extend(files)
         return organized_files
     
     @staticmethod
-    def organize_by_type(directory: str) -> Dict[str, List[str]]:
+    @traced('organize.archive')
+    def organize_to_archives(directory: str, by: str = 'type', date_source: str = 'birth',
+                             archive_format: str = 'tar', codec: Optional[str] = None, workers: int = 1,
+                             progress: Optional[ProgressCallback] = None,
+                             cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
         """
-        Organize files by their type (images, documents, audio, video, etc.).
+        Organize a directory straight into one archive per category or date bucket.
+        
+        Instead of moving files into subdirectories and archiving those
+        afterwards, every file is read once and streamed into its bucket's
+        archive, e.g. images.tar.zst or 2024/03.zip next to the files. A
+        bucket's files are deleted only once its archive is complete and on
+        disk; a bucket that fails or is cancelled leaves its files in place.
+        Tar archives get the block index archive backups use, so single
+        files can be extracted with ArchiveBackup.extract() without
+        decompressing the rest; zip archives carry their own central
+        directory. Archives written by an earlier run are recognized by
+        their index (tar) or their comment (zip) and left alone.
         
         Args:
             directory: Directory to organize
+            by: 'type', 'extension', 'date' or 'size'
+            date_source: Date used when organizing by date
+            archive_format: 'tar' or 'zip'
+            codec: Tar compression, 'gzip', 'xz' or 'zstd' (default zstd when installed); zip always uses deflate
+            workers: Buckets archived at the same time; the CPUs are shared among them for block compression
+            progress: Called with (completed, total, path) as files are archived
+            cancel: Event that stops archiving when set
             
         Returns:
-            Dict[str, List[str]]: Dictionary with file type as key and list of moved files as value
+            Dict[str, List[str]]: Result key and the files archived for it
+            
+        Raises:
+            ValueError: If the way of organizing, the date source, the format or the codec is unknown
+            LockTimeout: If another run keeps the directory locked for longer than the lock timeout
         """
+        categorize, initial_keys, prepare = FileOrganizer._strategy(by, date_source)
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format '{archive_format}', expected one of {', '.join(ARCHIVE_FORMATS)}")
+        if archive_format == 'tar':
+            codec = codec or default_codec()
+            if codec not in available_codecs():
+                raise ValueError(f"Compression codec '{codec}' is not available")
+            extension = ARCHIVE_EXTENSIONS[codec]
+        else:
+            extension = '.zip'
         if not os.path.exists(directory):
             return {}
-            
-        # Define file type categories and their extensions
-        type_categories = {
-            'images': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'],
-            'documents': ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt', '.xls', '.xlsx'],
-            'audio': ['.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg'],
-            'video': ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
-            'archives': ['.zip', '.rar', '.7z', '.tar', '.gz'],
-            'code': ['.py', '.js', '.html', '.css', '.java', '.cpp', '.h', '.php'],
-            'others': []
-        }
-        
-        organized_files = {category: [] for category in type_categories.keys()}
-        files = os.listdir(directory)
+        workers = max(1, workers)
         
-        for file in files:
-            file_path = os.path.join(directory, file)
-            if not os.path.isfile(file_path):
-                continue
-                
-            # Get file extension
-            extension = os.path.splitext(file)[1].lower()
+        with LockManager.shared().acquire(directory, purpose='organize'):
+            metrics = Metrics.shared()
+            with metrics.phase('organize.scan'):
+                with os.scandir(directory) as it:
+                    names = set()
+                    entries = []
+                    for entry in it:
+                        names.add(entry.name)
+                        if entry.is_file(follow_symlinks=False) and not FileOrganizer._is_backup_artifact(entry.name):
+                            entries.append(entry)
+                # An index marks a tar archive written by an earlier run or a backup
+                entries = [entry for entry in entries if not FileOrganizer._is_indexed_archive(entry, names)
+                           and not FileOrganizer._is_organized_zip(entry)]
+                metrics.inc('files_scanned_total', len(entries), operation='organize')
+            if prepare is not None:
+                with metrics.phase('organize.prepare'):
+                    prepare(entries)
             
-            # Determine file category
-            category = 'others'
-            for cat, extensions in type_categories.items():
-                if extension in extensions:
-                    category = cat
-                    break
+            buckets: Dict[str, Tuple[str, List[os.DirEntry]]] = {}
+            with metrics.phase('organize.plan'):
+                for entry in entries:
+                    try:
+                        key, subdir = categorize(entry)
+                    except OSError as e:
+                        metrics.count_error('organize', e)
+                        continue
+                    buckets.setdefault(subdir, (key, []))[1].append(entry)
             
-            # Create category directory
-            category_dir = os.path.join(directory, category)
-            os.makedirs(category_dir, exist_ok=True)
+            total = sum(len(files) for _, files in buckets.values())
+            completed = [0]
+            progress_lock = threading.Lock()
             
-            # Move file to category directory
-            try:
-                shutil.move(file_path, os.path.join(category_dir, file))
-                organized_files[category].append(file)
-            except Exception:
-                continue
-                
-        return organized_files
+            def archived(_number: int, _count: int, path: str):
+                with progress_lock:
+                    completed[0] += 1
+                    done = completed[0]
+                if progress is not None:
+                    progress(done, total, path)
+            
+            def archive_bucket(subdir: str, files: List[os.DirEntry]) -> List[str]:
+                # Members are named like the organized layout, e.g. images/photo.jpg
+                root = subdir.replace(os.sep, '/')
+                archive_path = FileOrganizer._archive_path(os.path.join(directory, subdir), extension)
+                os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+                paths = [(entry.path, f"{root}/{entry.name}") for entry in files]
+                with Profiler.shared().span('organize.archive.bucket', path=archive_path, files=len(files)):
+                    if archive_format == 'tar':
+                        ArchiveBackup.write_tar(paths, archive_path, root, os.path.join(directory, subdir), codec,
+                                                workers=max(1, (os.cpu_count() or 1) // workers),
+                                                progress=archived, cancel=cancel, sync=True)
+                    else:
+                        ArchiveBackup.write_zip(paths, archive_path, archived, cancel, sync=True,
+                                                comment=ORGANIZED_ZIP_COMMENT)
+                for entry in files:
+                    os.remove(entry.path)
+                return [entry.name for entry in files]
+            
+            organized_files = {key: [] for key in initial_keys}
+            with metrics.phase('organize.archive'), \
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-archive") as executor:
+                futures = {executor.submit(archive_bucket, subdir, files): key
+                           for subdir, (key, files) in buckets.items()}
+                for future, key in futures.items():
+                    try:
+                        organized_files.setdefault(key, []).extend(future.result())
+                    except OperationCancelled:
+                        continue
+                    except OSError as e:
+                        metrics.count_error('organize', e)
+            moved = sum(len(files) for files in organized_files.values())
+            metrics.inc('files_moved_total', moved, operation='organize')
+            return organized_files
+    
+    @staticmethod
+    def _is_backup_artifact(name: str) -> bool:
+        """Check whether a name is a backup, a chunked backup manifest or the chunk store, which stay where they are."""
+        return name == STORE_DIRNAME or name.endswith(MANIFEST_SUFFIX) or BackupIndex.parse_backup_time(name) is not None
+    
+    @staticmethod
+    def _is_indexed_archive(entry: os.DirEntry, names: Optional[Set[str]] = None) -> bool:
+        """
+        Check whether a file is a block index or the tar archive it indexes.
         
+        Such pairs are written by organize_to_archives() and archive backups
+        and are only usable together, so neither is organized. Without the
+        names in the directory, the index of a tar archive is looked up on disk.
+        """
+        if entry.name.endswith(ARCHIVE_INDEX_SUFFIX):
+            return True
+        if names is not None:
+            return entry.name + ARCHIVE_INDEX_SUFFIX in names
+        return entry.name.endswith(tuple(ARCHIVE_EXTENSIONS.values())) and FileSystem.current().exists(
+            entry.path + ARCHIVE_INDEX_SUFFIX)
+    
+    @staticmethod
+    def _is_organized_zip(entry: os.DirEntry) -> bool:
+        """Check whether a file is a zip archive written by organize_to_archives()."""
+        if not entry.name.lower().endswith('.zip'):
+            return False
+        try:
+            with zipfile.ZipFile(entry.path) as archive:
+                return archive.comment == ORGANIZED_ZIP_COMMENT
+        except (OSError, zipfile.BadZipFile):
+            return False
+    
+    @staticmethod
+    def _archive_path(base: str, extension: str) -> str:
+        """Return base + extension, numbered if that archive already exists, e.g. images_1.tar.zst."""
+        candidate, n = base + extension, 1
+        while os.path.lexists(candidate) or os.path.lexists(candidate + ARCHIVE_INDEX_SUFFIX):
+            candidate = f"{base}_{n}{extension}"
+            n += 1
+        return candidate
+    
     @staticmethod
-    def organize_directory(directory: str) -> Dict[str, List[str]]:
+    def organize_directory(directory: str, progress: Optional[ProgressCallback] = None,
+                           cancel: Optional[threading.Event] = None) -> Dict[str, List[str]]:
         """
         Organize files in a directory using multiple criteria.
         
         Args:
             directory: Directory to organize
+            progress: Called with (completed, total, path) as files are moved
+            cancel: Event that stops the remaining moves when set
             
         Returns:
             Dict[str, List[str]]: Dictionary with organization criteria as key and list of moved files as value
         """
-        if not os.path.exists(directory):
+        if not FileSystem.current().exists(directory):
             return {}
             
         # Organize by type (this is the default organization method)
-        return FileOrganizer.organize_by_type(directory)
+        return FileOrganizer.organize_by_type(directory, progress, cancel)
         
     @staticmethod
+    @traced('organize.revert')
     def revert_last_organization(directory: Optional[str] = None) -> bool:
         """
         Revert the last organization operation by moving files back to their original locations.
@@ -225,42 +673,119 @@ class FileOrganizer:
             
         Returns:
             bool: True if reverted successfully, False otherwise
+            
+        Raises:
+            LockTimeout: If another run keeps the directory locked for longer than the lock timeout
         """
+        # Get the target directory
+        target_dir = directory if directory and FileSystem.current().exists(directory) else os.getcwd()
+        
+        # An organize still filling the subdirectories must finish before they are emptied and removed
+        with LockManager.shared().acquire(target_dir, purpose='revert organization'):
+            return FileOrganizer._revert_organization(target_dir)
+    
+    @staticmethod
+    def _revert_organization(target_dir: str) -> bool:
+        """Move the files of every subdirectory back into target_dir; the caller holds its lock."""
+        fs = FileSystem.current()
         try:
-            # Get the target directory
-            target_dir = directory if directory and os.path.exists(directory) else os.getcwd()
-            
-            # Get all subdirectories in the target directory
-            subdirs = [d for d in os.listdir(target_dir) if os.path.isdir(os.path.join(target_dir, d))]
+            # Get all subdirectories in the target directory, leaving directory backups and the chunk store alone
+            subdirs = [d for d in fs.listdir(target_dir)
+                       if fs.isdir(os.path.join(target_dir, d)) and not FileOrganizer._is_backup_artifact(d)]
             
             # Skip if no subdirectories (nothing to revert)
             if not subdirs:
                 return False
             
+            # Names in the parent directory, loaded once; collisions are resolved in memory
+            allocator = NameAllocator.for_directory(target_dir)
+            
             # Move files from each subdirectory back to the parent directory
             for subdir in subdirs:
                 subdir_path = os.path.join(target_dir, subdir)
-                files = os.listdir(subdir_path)
+                files = fs.listdir(subdir_path)
                 
                 for file in files:
                     source = os.path.join(subdir_path, file)
-                    destination = os.path.join(target_dir, file)
-                    
-                    # Check if destination file already exists
-                    if os.path.exists(destination):
-                        # Append a unique identifier to avoid overwriting
-                        base, ext = os.path.splitext(file)
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        new_filename = f"{base}_{timestamp}{ext}"
-                        destination = os.path.join(target_dir, new_filename)
+                    # Files that would overwrite an existing one get a numbered name
+                    destination = os.path.join(target_dir, allocator.claim(file, source))
                     
                     # Move file back to parent directory
-                    shutil.move(source, destination)
+                    fs.move(source, destination)
                 
                 # Remove empty subdirectory
-                os.rmdir(subdir_path)
+                fs.rmdir(subdir_path)
             
             return True
             
         except Exception:
-            return False 
\ No newline at end of file
+            return False
+
+
+class _ShardPipeline:
+    """Classifies and moves the shards of one sharded organize run; shared by its workers."""
+    
+    def __init__(self, fs: FileSystem, directory: str, categorize: Callable[[os.DirEntry], Tuple[str, str]],
+                 prepare: Optional[Callable[[List[os.DirEntry]], None]],
+                 progress: Optional[ProgressCallback], cancel: Optional[threading.Event]):
+        self.fs = fs
+        self.directory = directory
+        self.categorize = categorize
+        self.prepare = prepare
+        self.progress = progress
+        self.cancel = cancel
+        self.moved: Dict[str, int] = {}
+        self.total = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+        # One lock per destination directory, held while a free name is found and taken
+        self._destinations: Dict[str, threading.Lock] = {}
+    
+    def seen(self, count: int):
+        with self._lock:
+            self.total += count
+    
+    def run(self, shard: List[os.DirEntry]):
+        """Classify and move one shard of files."""
+        metrics = Metrics.shared()
+        with Profiler.shared().span('organize.shard', files=len(shard)):
+            if self.prepare is not None:
+                self.prepare(shard)
+            for entry in shard:
+                if self.cancel is not None and self.cancel.is_set():
+                    return
+                try:
+                    key, subdir = self.categorize(entry)
+                    self._move(entry, os.path.join(self.directory, subdir))
+                except OSError as e:
+                    metrics.count_error('organize', e)
+                    continue
+                with self._lock:
+                    self.moved[key] = self.moved.get(key, 0) + 1
+                    self.completed += 1
+                    completed, total = self.completed, self.total
+                if self.progress is not None:
+                    self.progress(completed, total, entry.path)
+    
+    def _move(self, entry: os.DirEntry, destination_dir: str):
+        """Move a file into a directory without overwriting anything there."""
+        with self._lock:
+            lock = self._destinations.get(destination_dir)
+            if lock is None:
+                self.fs.makedirs(destination_dir, exist_ok=True)
+                lock = self._destinations[destination_dir] = threading.Lock()
+        # The kernel serializes changes to one directory anyway, so this costs little
+        with lock:
+            stem, ext = os.path.splitext(entry.name)
+            name, n = entry.name, 1
+            while self.fs.lexists(os.path.join(destination_dir, name)):
+                name = DEFAULT_CONFLICT_TEMPLATE.format(stem=stem, ext=ext, name=entry.name, n=n)
+                n += 1
+            destination = os.path.join(destination_dir, name)
+            try:
+                self.fs.rename(entry.path, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # A destination on another filesystem (a mount point) needs a copy
+                self.fs.move(entry.path, destination)
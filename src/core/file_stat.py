@@ -0,0 +1,262 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from errno import ENOSYS, EPERM
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from src.core.filesystem import FileSystem, LocalFileSystem
+from src.core.io_scheduler import IOScheduler, OperationCancelled
+from src.utils.metrics import Metrics
+
+# Paths stat'ed per worker task by StatCollector.collect()
+STAT_BATCH_SIZE = 256
+
+# statx syscall numbers per architecture, for C libraries without a statx() wrapper
+STATX_SYSCALLS = {
+    'x86_64': 332,
+    'amd64': 332,
+    'i386': 383,
+    'i686': 383,
+    'aarch64': 291,
+    'arm64': 291,
+    'armv7l': 397,
+    'ppc64le': 383,
+    's390x': 379,
+}
+AT_FDCWD = -100
+AT_SYMLINK_NOFOLLOW = 0x100
+STATX_BASIC_STATS = 0x7ff
+STATX_BTIME = 0x800
+
+
+class _StatxTimestamp(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_int64), ('tv_nsec', ctypes.c_uint32), ('_reserved', ctypes.c_int32)]
+
+
+class _Statx(ctypes.Structure):
+    """struct statx from linux/stat.h (256 bytes)."""
+
+    _fields_ = [
+        ('stx_mask', ctypes.c_uint32),
+        ('stx_blksize', ctypes.c_uint32),
+        ('stx_attributes', ctypes.c_uint64),
+        ('stx_nlink', ctypes.c_uint32),
+        ('stx_uid', ctypes.c_uint32),
+        ('stx_gid', ctypes.c_uint32),
+        ('stx_mode', ctypes.c_uint16),
+        ('_spare0', ctypes.c_uint16),
+        ('stx_ino', ctypes.c_uint64),
+        ('stx_size', ctypes.c_uint64),
+        ('stx_blocks', ctypes.c_uint64),
+        ('stx_attributes_mask', ctypes.c_uint64),
+        ('stx_atime', _StatxTimestamp),
+        ('stx_btime', _StatxTimestamp),
+        ('stx_ctime', _StatxTimestamp),
+        ('stx_mtime', _StatxTimestamp),
+        ('stx_rdev_major', ctypes.c_uint32),
+        ('stx_rdev_minor', ctypes.c_uint32),
+        ('stx_dev_major', ctypes.c_uint32),
+        ('stx_dev_minor', ctypes.c_uint32),
+        ('_spare2', ctypes.c_uint64 * 14),
+    ]
+
+
+class FileStat(NamedTuple):
+    """What organizing and backup ordering need to know about a file, from one system call."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    ctime_ns: int
+    # None where the filesystem or platform does not record birth times
+    birthtime_ns: Optional[int]
+    ino: int
+    dev: int
+    mode: int
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+    @property
+    def ctime(self) -> float:
+        return self.ctime_ns / 1e9
+
+    @property
+    def birthtime(self) -> Optional[float]:
+        return self.birthtime_ns / 1e9 if self.birthtime_ns is not None else None
+
+    @property
+    def created(self) -> float:
+        """Birth time, or the earlier of mtime and ctime where it is not recorded."""
+        if self.birthtime_ns is not None:
+            return self.birthtime_ns / 1e9
+        return min(self.mtime_ns, self.ctime_ns) / 1e9
+
+
+class StatCollector:
+    """
+    Collects file metadata, including birth times, with one system call per file.
+
+    On Linux this calls statx(2) through ctypes, which returns size, inode,
+    mtime, ctime and (where the filesystem keeps it) birth time together.
+    Elsewhere, or where statx is unavailable or blocked, it falls back to
+    os.stat, which carries st_birthtime on macOS and the BSDs and the
+    creation time as st_ctime on Windows. Files on a non-local filesystem
+    backend are stat'ed through the backend and have no birth time.
+    """
+
+    _statx = None
+    _statx_loaded = False
+    _statx_lock = threading.Lock()
+
+    @staticmethod
+    def supports_statx() -> bool:
+        """Return whether statx is available to this process."""
+        return StatCollector._load_statx() is not None
+
+    @staticmethod
+    def stat(path: str, follow_symlinks: bool = False) -> FileStat:
+        """
+        Get the metadata of one file.
+
+        Args:
+            path: File to stat
+            follow_symlinks: Describe the target of a symlink rather than the link
+
+        Returns:
+            FileStat: The file's metadata
+
+        Raises:
+            OSError: If the file cannot be stat'ed
+        """
+        fs = FileSystem.current()
+        if not isinstance(fs, LocalFileSystem):
+            return StatCollector._from_stat_result(path, fs.stat(path, follow_symlinks=follow_symlinks), False)
+        statx = StatCollector._load_statx()
+        if statx is not None:
+            buffer = _Statx()
+            flags = 0 if follow_symlinks else AT_SYMLINK_NOFOLLOW
+            if statx(AT_FDCWD, os.fsencode(path), flags, STATX_BASIC_STATS | STATX_BTIME, ctypes.byref(buffer)) == 0:
+                return StatCollector._from_statx(path, buffer)
+            error = ctypes.get_errno()
+            if error not in (ENOSYS, EPERM):
+                raise OSError(error, os.strerror(error), path)
+            # Kernel too old, or statx filtered out (e.g. by a container's seccomp profile)
+            StatCollector._statx = None
+        return StatCollector._from_stat_result(path, os.stat(path, follow_symlinks=follow_symlinks), True)
+
+    @staticmethod
+    def collect(paths: Iterable[str], workers: Optional[int] = None, follow_symlinks: bool = False,
+                cancel: Optional[threading.Event] = None) -> Dict[str, FileStat]:
+        """
+        Stat many files, in batches on a thread pool when there are enough of them.
+
+        The calls release the GIL, so on network or otherwise high-latency
+        filesystems many of them are in flight at once. Files that cannot
+        be stat'ed (e.g. removed in the meantime) are left out.
+
+        Args:
+            paths: Files to stat
+            workers: Threads, defaults to the I/O scheduler's limit for the device of the first path
+            follow_symlinks: Describe the targets of symlinks rather than the links
+            cancel: Event that stops the remaining batches when set
+
+        Returns:
+            Dict[str, FileStat]: Metadata per path
+
+        Raises:
+            OperationCancelled: If cancel was set before every batch ran
+        """
+        paths = list(paths)
+        if not paths:
+            return {}
+        batches = [paths[start:start + STAT_BATCH_SIZE] for start in range(0, len(paths), STAT_BATCH_SIZE)]
+
+        def stat_batch(batch: List[str]) -> List[FileStat]:
+            if cancel is not None and cancel.is_set():
+                raise OperationCancelled()
+            stats = []
+            for path in batch:
+                try:
+                    stats.append(StatCollector.stat(path, follow_symlinks))
+                except OSError:
+                    continue
+            return stats
+
+        if workers is None:
+            workers = IOScheduler.shared().limit_for(os.path.dirname(paths[0]))
+        workers = max(1, min(workers, len(batches)))
+        collected: Dict[str, FileStat] = {}
+        if workers == 1:
+            for batch in batches:
+                collected.update((st.path, st) for st in stat_batch(batch))
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-stat") as executor:
+                for stats in executor.map(stat_batch, batches):
+                    collected.update((st.path, st) for st in stats)
+        call = 'statx' if StatCollector._statx is not None else 'stat'
+        Metrics.shared().inc('syscalls_total', len(paths), call=call)
+        return collected
+
+    @staticmethod
+    def _load_statx():
+        """Find statx() in the C library, or a raw syscall for it, once per process."""
+        if StatCollector._statx_loaded:
+            return StatCollector._statx
+        with StatCollector._statx_lock:
+            if not StatCollector._statx_loaded:
+                StatCollector._statx = StatCollector._find_statx()
+                StatCollector._statx_loaded = True
+        return StatCollector._statx
+
+    @staticmethod
+    def _find_statx():
+        if platform.system() != "Linux":
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        except OSError:
+            return None
+        argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_uint, ctypes.POINTER(_Statx)]
+        function = getattr(libc, 'statx', None)
+        if function is not None:
+            function.argtypes = argtypes
+            function.restype = ctypes.c_int
+            return function
+        # glibc before 2.28 has no wrapper
+        syscall_number = STATX_SYSCALLS.get(platform.machine().lower())
+        syscall = getattr(libc, 'syscall', None)
+        if syscall_number is None or syscall is None:
+            return None
+        syscall.restype = ctypes.c_long
+        return lambda *args: syscall(ctypes.c_long(syscall_number), *args)
+
+    @staticmethod
+    def _from_statx(path: str, buffer: _Statx) -> FileStat:
+        birthtime_ns = None
+        if buffer.stx_mask & STATX_BTIME and buffer.stx_btime.tv_sec:
+            birthtime_ns = buffer.stx_btime.tv_sec * 1_000_000_000 + buffer.stx_btime.tv_nsec
+        return FileStat(
+            path,
+            buffer.stx_size,
+            buffer.stx_mtime.tv_sec * 1_000_000_000 + buffer.stx_mtime.tv_nsec,
+            buffer.stx_ctime.tv_sec * 1_000_000_000 + buffer.stx_ctime.tv_nsec,
+            birthtime_ns,
+            buffer.stx_ino,
+            os.makedev(buffer.stx_dev_major, buffer.stx_dev_minor),
+            buffer.stx_mode,
+        )
+
+    @staticmethod
+    def _from_stat_result(path: str, st, local: bool) -> FileStat:
+        birthtime = getattr(st, 'st_birthtime', None) if local else None
+        birthtime_ns = int(birthtime * 1e9) if birthtime else None
+        if local and birthtime_ns is None and os.name == 'nt':
+            # Windows reports the creation time as st_ctime
+            birthtime_ns = st.st_ctime_ns
+        return FileStat(path, st.st_size, st.st_mtime_ns, st.st_ctime_ns, birthtime_ns, st.st_ino, st.st_dev,
+                        st.st_mode)
@@ -0,0 +1,583 @@
+import errno
+import io
+import os
+import shutil
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class FileSystem:
+    """
+    The filesystem calls the organizer and the move path are made of.
+
+    LocalFileSystem, the default, is a thin layer over os and shutil.
+    MemoryFileSystem keeps a tree in memory, so organizing a million files
+    can be timed without disk latency, and RecordingFileSystem counts the
+    calls made through any other backend so tests can hold them to a
+    budget. The backend in use is process-wide, because moves run on the
+    I/O scheduler's worker threads; switch it with FileSystem.use().
+
+    Only what the organize, revert, analyze and move paths need is
+    covered; backups, restores and photo metadata still read and write
+    the local disk directly.
+    """
+
+    _current: Optional["FileSystem"] = None
+    _current_lock = threading.Lock()
+
+    @classmethod
+    def current(cls) -> "FileSystem":
+        """Return the backend in use, the local filesystem unless another was installed."""
+        if cls._current is None:
+            with cls._current_lock:
+                if cls._current is None:
+                    FileSystem._current = LocalFileSystem()
+        return cls._current
+
+    @classmethod
+    @contextmanager
+    def use(cls, filesystem: "FileSystem") -> Iterator["FileSystem"]:
+        """
+        Make a backend the current one for the duration of a with block.
+
+        Args:
+            filesystem: Backend to install
+
+        Returns:
+            Iterator[FileSystem]: The installed backend
+        """
+        with cls._current_lock:
+            previous, FileSystem._current = cls._current, filesystem
+        try:
+            yield filesystem
+        finally:
+            with cls._current_lock:
+                FileSystem._current = previous
+
+    def scandir(self, path: str):
+        """Iterate over a directory's entries like os.scandir (usable as a context manager)."""
+        raise NotImplementedError
+
+    def listdir(self, path: str) -> List[str]:
+        """Return the names in a directory."""
+        raise NotImplementedError
+
+    def stat(self, path: str, follow_symlinks: bool = True):
+        """Return a path's stat result."""
+        raise NotImplementedError
+
+    def exists(self, path: str) -> bool:
+        """Check whether a path exists, following symlinks."""
+        raise NotImplementedError
+
+    def lexists(self, path: str) -> bool:
+        """Check whether a path exists, including broken symlinks."""
+        raise NotImplementedError
+
+    def isdir(self, path: str) -> bool:
+        """Check whether a path is a directory."""
+        raise NotImplementedError
+
+    def isfile(self, path: str) -> bool:
+        """Check whether a path is a regular file."""
+        raise NotImplementedError
+
+    def makedirs(self, path: str, exist_ok: bool = False):
+        """Create a directory and any missing parents."""
+        raise NotImplementedError
+
+    def rename(self, source: str, destination: str):
+        """Rename a path, replacing an existing destination file, like os.rename."""
+        raise NotImplementedError
+
+    def move(self, source: str, destination: str, copy_function: Optional[Callable] = None) -> str:
+        """Move a path like shutil.move, into the destination if it is a directory; returns the new path."""
+        raise NotImplementedError
+
+    def rmdir(self, path: str):
+        """Remove an empty directory."""
+        raise NotImplementedError
+
+    def remove(self, path: str):
+        """Remove a file."""
+        raise NotImplementedError
+
+    def open(self, path: str, mode: str = 'rb'):
+        """Open a file; binary modes only for backends other than the local one."""
+        raise NotImplementedError
+
+
+class LocalFileSystem(FileSystem):
+    """The real filesystem, through os and shutil."""
+
+    def scandir(self, path: str):
+        return os.scandir(path)
+
+    def listdir(self, path: str) -> List[str]:
+        return os.listdir(path)
+
+    def stat(self, path: str, follow_symlinks: bool = True):
+        return os.stat(path, follow_symlinks=follow_symlinks)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def lexists(self, path: str) -> bool:
+        return os.path.lexists(path)
+
+    def isdir(self, path: str) -> bool:
+        return os.path.isdir(path)
+
+    def isfile(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def makedirs(self, path: str, exist_ok: bool = False):
+        os.makedirs(path, exist_ok=exist_ok)
+
+    def rename(self, source: str, destination: str):
+        os.rename(source, destination)
+
+    def move(self, source: str, destination: str, copy_function: Optional[Callable] = None) -> str:
+        return shutil.move(source, destination, copy_function=copy_function or shutil.copy2)
+
+    def rmdir(self, path: str):
+        os.rmdir(path)
+
+    def remove(self, path: str):
+        os.remove(path)
+
+    def open(self, path: str, mode: str = 'rb'):
+        return open(path, mode)
+
+
+@dataclass
+class MemoryStat:
+    """Stat result of a MemoryFileSystem node, with the fields the organizer reads."""
+
+    st_mode: int
+    st_ino: int
+    st_dev: int
+    st_nlink: int
+    st_size: int
+    st_atime: float
+    st_mtime: float
+    st_ctime: float
+
+    @property
+    def st_mtime_ns(self) -> int:
+        return int(self.st_mtime * 1e9)
+
+    @property
+    def st_ctime_ns(self) -> int:
+        return int(self.st_ctime * 1e9)
+
+
+@dataclass
+class _Node:
+    ino: int
+    mtime: float
+    ctime: float
+    data: Optional[bytearray] = None
+    children: Optional[Dict[str, "_Node"]] = None
+
+    @property
+    def is_dir(self) -> bool:
+        return self.children is not None
+
+    def stat(self) -> MemoryStat:
+        mode = (stat.S_IFDIR | 0o755) if self.is_dir else (stat.S_IFREG | 0o644)
+        size = 0 if self.is_dir else len(self.data)
+        return MemoryStat(mode, self.ino, MemoryFileSystem.DEVICE, 1, size, self.mtime, self.mtime, self.ctime)
+
+
+class MemoryDirEntry:
+    """What MemoryFileSystem.scandir yields; behaves like os.DirEntry."""
+
+    def __init__(self, name: str, path: str, node: _Node):
+        self.name = name
+        self.path = path
+        self._node = node
+
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return not self._node.is_dir
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return self._node.is_dir
+
+    def is_symlink(self) -> bool:
+        return False
+
+    def stat(self, follow_symlinks: bool = True) -> MemoryStat:
+        return self._node.stat()
+
+    def inode(self) -> int:
+        return self._node.ino
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    def __repr__(self) -> str:
+        return f"<MemoryDirEntry '{self.name}'>"
+
+
+class _EntryIterator:
+    """Context-manager iterator returned by scandir, like the one os.scandir returns."""
+
+    def __init__(self, entries: list):
+        self._entries = iter(entries)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._entries = iter(())
+
+
+class _MemoryFile(io.BytesIO):
+    """A file opened for writing; its contents replace the node's data when it is closed."""
+
+    def __init__(self, node: _Node, initial: bytes):
+        super().__init__(initial)
+        self._node = node
+
+    def close(self):
+        if not self.closed:
+            self._node.data = bytearray(self.getvalue())
+            self._node.mtime = self._node.ctime = time.time()
+        super().close()
+
+
+class MemoryFileSystem(FileSystem):
+    """
+    A filesystem tree held in memory, for tests and for benchmarks free of disk latency.
+
+    Paths are absolute POSIX-style paths. Every operation takes one lock,
+    so the backend is safe to share with the I/O scheduler's workers.
+    """
+
+    DEVICE = 0x6d656d
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._next_ino = 1
+        self._root = self._new_node(directory=True)
+
+    def create_file(self, path: str, data: bytes = b'', mtime: Optional[float] = None):
+        """
+        Create (or replace) a file, creating missing parent directories.
+
+        Args:
+            path: Absolute path of the file
+            data: File contents
+            mtime: Modification and change time, defaults to now
+        """
+        with self._lock:
+            parent, name = self._parent(path, create=True)
+            node = self._new_node(data=data)
+            if mtime is not None:
+                node.mtime = node.ctime = mtime
+            parent.children[name] = node
+
+    def scandir(self, path: str):
+        with self._lock:
+            node = self._directory(path)
+            entries = [MemoryDirEntry(name, os.path.join(path, name), child) for name, child in node.children.items()]
+        return _EntryIterator(entries)
+
+    def listdir(self, path: str) -> List[str]:
+        with self._lock:
+            return list(self._directory(path).children)
+
+    def stat(self, path: str, follow_symlinks: bool = True) -> MemoryStat:
+        with self._lock:
+            return self._node(path).stat()
+
+    def exists(self, path: str) -> bool:
+        with self._lock:
+            return self._find(path) is not None
+
+    def lexists(self, path: str) -> bool:
+        return self.exists(path)
+
+    def isdir(self, path: str) -> bool:
+        with self._lock:
+            node = self._find(path)
+            return node is not None and node.is_dir
+
+    def isfile(self, path: str) -> bool:
+        with self._lock:
+            node = self._find(path)
+            return node is not None and not node.is_dir
+
+    def makedirs(self, path: str, exist_ok: bool = False):
+        with self._lock:
+            existing = self._find(path)
+            if existing is not None:
+                if existing.is_dir and exist_ok:
+                    return
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+            parent, name = self._parent(path, create=True)
+            parent.children[name] = self._new_node(directory=True)
+
+    def rename(self, source: str, destination: str):
+        with self._lock:
+            source_parent, source_name = self._parent(source)
+            node = source_parent.children.get(source_name)
+            if node is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), source)
+            target_parent, target_name = self._parent(destination)
+            target = target_parent.children.get(target_name)
+            if target is not None and target.is_dir and (not node.is_dir or target.children):
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), destination)
+            if node.is_dir and self._normalize(destination).startswith(self._normalize(source) + '/'):
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), destination)
+            del source_parent.children[source_name]
+            target_parent.children[target_name] = node
+            node.ctime = time.time()
+
+    def move(self, source: str, destination: str, copy_function: Optional[Callable] = None) -> str:
+        with self._lock:
+            if self.isdir(destination):
+                destination = os.path.join(destination, os.path.basename(source.rstrip('/')))
+                if self.exists(destination):
+                    raise shutil.Error(f"Destination path '{destination}' already exists")
+            self.rename(source, destination)
+            return destination
+
+    def rmdir(self, path: str):
+        with self._lock:
+            parent, name = self._parent(path)
+            node = parent.children.get(name)
+            if node is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            if not node.is_dir:
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            if node.children:
+                raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY), path)
+            del parent.children[name]
+
+    def remove(self, path: str):
+        with self._lock:
+            parent, name = self._parent(path)
+            node = parent.children.get(name)
+            if node is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            if node.is_dir:
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+            del parent.children[name]
+
+    def open(self, path: str, mode: str = 'rb'):
+        if 'b' not in mode:
+            raise ValueError("MemoryFileSystem only opens files in binary mode")
+        with self._lock:
+            if mode.startswith('r'):
+                node = self._node(path)
+                if node.is_dir:
+                    raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+                return io.BytesIO(bytes(node.data))
+            node = self._find(path)
+            if node is None:
+                self.create_file(path)
+                node = self._find(path)
+            return _MemoryFile(node, bytes(node.data) if mode.startswith('a') else b'')
+
+    def _new_node(self, directory: bool = False, data: bytes = b'') -> _Node:
+        now = time.time()
+        node = _Node(self._next_ino, now, now,
+                     data=None if directory else bytearray(data), children={} if directory else None)
+        self._next_ino += 1
+        return node
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        path = os.fspath(path)
+        if not path.startswith('/'):
+            raise ValueError(f"MemoryFileSystem needs absolute paths, got '{path}'")
+        return os.path.normpath(path).replace('//', '/')
+
+    def _find(self, path: str) -> Optional[_Node]:
+        node = self._root
+        for part in self._normalize(path).split('/'):
+            if not part:
+                continue
+            if not node.is_dir or part not in node.children:
+                return None
+            node = node.children[part]
+        return node
+
+    def _node(self, path: str) -> _Node:
+        node = self._find(path)
+        if node is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return node
+
+    def _directory(self, path: str) -> _Node:
+        node = self._node(path)
+        if not node.is_dir:
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        return node
+
+    def _parent(self, path: str, create: bool = False):
+        """Return (parent directory node, name) for a path, optionally creating missing parents."""
+        normalized = self._normalize(path)
+        parent_path, name = os.path.split(normalized)
+        if not name:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), path)
+        node = self._root
+        for part in parent_path.split('/'):
+            if not part:
+                continue
+            child = node.children.get(part)
+            if child is None:
+                if not create:
+                    raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+                child = node.children[part] = self._new_node(directory=True)
+            if not child.is_dir:
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            node = child
+        return node, name
+
+
+class _RecordingDirEntry:
+    """Directory entry whose first stat() is counted, as the kernel is only asked once."""
+
+    def __init__(self, entry, recorder: "RecordingFileSystem"):
+        self._entry = entry
+        self._recorder = recorder
+        self._stat_counted = False
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self) -> bool:
+        return self._entry.is_symlink()
+
+    def stat(self, follow_symlinks: bool = True):
+        if not self._stat_counted:
+            self._stat_counted = True
+            self._recorder._count('stat')
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+    def inode(self) -> int:
+        return self._entry.inode()
+
+    def __fspath__(self) -> str:
+        return self.path
+
+
+class RecordingFileSystem(FileSystem):
+    """
+    Counts the calls made through another backend, to profile or budget them.
+
+    Counts are keyed by method name ('scandir', 'stat', 'rename', ...);
+    the first stat() of each directory entry counts as a 'stat'.
+    """
+
+    def __init__(self, inner: Optional[FileSystem] = None):
+        """
+        Args:
+            inner: Backend that does the work, defaults to the local filesystem
+        """
+        self.inner = inner or LocalFileSystem()
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the calls counted so far."""
+        with self._lock:
+            self.counts.clear()
+
+    @property
+    def total(self) -> int:
+        """Number of calls counted."""
+        with self._lock:
+            return sum(self.counts.values())
+
+    def assert_within(self, **limits: int):
+        """
+        Check the counted calls against a budget, e.g. assert_within(stat=1000, scandir=1).
+
+        Raises:
+            AssertionError: Naming every call that went over its limit
+        """
+        with self._lock:
+            over = {name: count for name, count in self.counts.items() if name in limits and count > limits[name]}
+        if over:
+            details = ', '.join(f"{name}={count} (budget {limits[name]})" for name, count in sorted(over.items()))
+            raise AssertionError(f"Filesystem call budget exceeded: {details}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def scandir(self, path: str):
+        self._count('scandir')
+        with self.inner.scandir(path) as it:
+            entries = [_RecordingDirEntry(entry, self) for entry in it]
+        return _EntryIterator(entries)
+
+    def listdir(self, path: str) -> List[str]:
+        self._count('listdir')
+        return self.inner.listdir(path)
+
+    def stat(self, path: str, follow_symlinks: bool = True):
+        self._count('stat')
+        return self.inner.stat(path, follow_symlinks=follow_symlinks)
+
+    def exists(self, path: str) -> bool:
+        self._count('stat')
+        return self.inner.exists(path)
+
+    def lexists(self, path: str) -> bool:
+        self._count('stat')
+        return self.inner.lexists(path)
+
+    def isdir(self, path: str) -> bool:
+        self._count('stat')
+        return self.inner.isdir(path)
+
+    def isfile(self, path: str) -> bool:
+        self._count('stat')
+        return self.inner.isfile(path)
+
+    def makedirs(self, path: str, exist_ok: bool = False):
+        self._count('mkdir')
+        self.inner.makedirs(path, exist_ok=exist_ok)
+
+    def rename(self, source: str, destination: str):
+        self._count('rename')
+        self.inner.rename(source, destination)
+
+    def move(self, source: str, destination: str, copy_function: Optional[Callable] = None) -> str:
+        self._count('rename')
+        return self.inner.move(source, destination, copy_function)
+
+    def rmdir(self, path: str):
+        self._count('rmdir')
+        self.inner.rmdir(path)
+
+    def remove(self, path: str):
+        self._count('unlink')
+        self.inner.remove(path)
+
+    def open(self, path: str, mode: str = 'rb'):
+        self._count('open')
+        return self.inner.open(path, mode)
@@ -0,0 +1,299 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.core.drive_operations import DriveOperations
+from src.utils.metrics import Metrics
+
+# Files at least this big are streamed one at a time per device queue
+LARGE_FILE_THRESHOLD = 8 * 1024 * 1024
+
+# Number of small files handed to a worker in one go
+SMALL_FILE_BATCH = 64
+
+# Called with (completed, total, path) as an operation makes progress
+ProgressCallback = Callable[[int, int, str], None]
+
+
+class OperationCancelled(Exception):
+    """Recorded for tasks that were skipped because their operation was cancelled."""
+
+    def __init__(self, message: str = "Operation cancelled"):
+        super().__init__(message)
+
+
+@dataclass
+class IOTask:
+    """A unit of file I/O to run on the scheduler."""
+
+    source: str
+    destination: str
+    action: Callable[[], Any]
+    size: int = 0
+
+
+@dataclass
+class IOResult:
+    """Outcome of an IOTask: the action's return value or the error it raised."""
+
+    task: IOTask
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class _DeviceQueue:
+    """Worker pool shared by every task between the same pair of devices."""
+
+    limit: int
+    executor: ThreadPoolExecutor = field(repr=False)
+
+
+class IOScheduler:
+    """
+    Runs file operations concurrently with a separate limit per device.
+
+    Tasks are queued by the ``st_dev`` of their source and destination. Each
+    queue gets as many workers as the slower of the two devices suits (see
+    ``DriveOperations.suggest_parallelism``) unless a limit was configured.
+    A worker also holds a slot of both its source and its destination device
+    while it runs, so a device shared by several queues (e.g. the source of
+    one copy and the destination of another) is never given more concurrent
+    work than its own limit.
+    Within a queue, large files are streamed sequentially by a single worker
+    while the remaining workers process small files in batches, so a spinning
+    disk is never thrashed by many large random reads and an NVMe drive is
+    not left idle behind a single copy.
+
+    Actions must not submit and wait on further work through the same
+    scheduler, as that could exhaust a device queue's workers.
+    """
+
+    _shared: Optional["IOScheduler"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, default_limit: Optional[int] = None):
+        """
+        Args:
+            default_limit: Worker limit for every device, overriding auto-tuning
+        """
+        self.default_limit = default_limit
+        self._device_limits: Dict[int, int] = {}
+        self._tuned_limits: Dict[int, int] = {}
+        self._queues: Dict[Tuple[int, int], _DeviceQueue] = {}
+        self._slots: Dict[int, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "IOScheduler":
+        """Return the process-wide scheduler used by the core engines."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def set_default_limit(self, limit: Optional[int]):
+        """
+        Configure the worker limit for every device without an explicit limit.
+
+        Args:
+            limit: Maximum number of concurrent workers, or None to auto-tune
+        """
+        with self._lock:
+            self.default_limit = max(1, limit) if limit else None
+            self._reset_queues(lambda key: True)
+            self._slots.clear()
+
+    def set_device_limit(self, path: str, limit: int):
+        """
+        Configure the worker limit for the device holding a path.
+
+        Args:
+            path: Any existing path on the device
+            limit: Maximum number of concurrent workers for that device
+        """
+        device = self._device_of(path)
+        with self._lock:
+            self._device_limits[device] = max(1, limit)
+            self._reset_queues(lambda key: device in key)
+            self._slots.pop(device, None)
+
+    def run(self, tasks: Iterable[IOTask], progress: Optional[ProgressCallback] = None,
+            cancel: Optional[threading.Event] = None) -> List[IOResult]:
+        """
+        Run tasks and wait for all of them to finish.
+
+        Args:
+            tasks: Tasks to run
+            progress: Called from worker threads after each task with (completed, total, source)
+            cancel: When set, tasks that have not started yet are skipped and
+                fail with OperationCancelled
+
+        Returns:
+            List[IOResult]: One result per task, in submission order
+        """
+        tasks = list(tasks)
+        results = [IOResult(task) for task in tasks]
+        if not tasks:
+            return results
+        tracker = _Progress(len(tasks), progress, cancel)
+
+        groups: Dict[Tuple[int, int], List[int]] = {}
+        device_paths: Dict[int, str] = {}
+        # Files share their parent directory's device, so one stat per directory suffices
+        directory_devices: Dict[str, int] = {}
+
+        def device_of(path: str) -> int:
+            directory = os.path.dirname(os.path.abspath(path))
+            if directory not in directory_devices:
+                directory_devices[directory] = self._device_of(directory)
+            return directory_devices[directory]
+
+        for position, task in enumerate(tasks):
+            source_dev = device_of(task.source)
+            destination_dev = device_of(task.destination)
+            device_paths.setdefault(source_dev, task.source)
+            device_paths.setdefault(destination_dev, task.destination)
+            groups.setdefault((source_dev, destination_dev), []).append(position)
+
+        futures: List[Future] = []
+        for key, positions in groups.items():
+            queue = self._queue_for(key, device_paths)
+            slots = self._slots_for(key, device_paths)
+            large = [p for p in positions if tasks[p].size >= LARGE_FILE_THRESHOLD]
+            small = [p for p in positions if tasks[p].size < LARGE_FILE_THRESHOLD]
+            # Keep neighbouring files together so each worker reads sequentially
+            large.sort(key=lambda p: tasks[p].source)
+            small.sort(key=lambda p: tasks[p].source)
+
+            if large:
+                futures.append(queue.executor.submit(self._run_batch, tasks, results, large, tracker, slots))
+            for start in range(0, len(small), SMALL_FILE_BATCH):
+                batch = small[start:start + SMALL_FILE_BATCH]
+                futures.append(queue.executor.submit(self._run_batch, tasks, results, batch, tracker, slots))
+
+        for future in futures:
+            future.result()
+        return results
+
+    def limit_for(self, path: str) -> int:
+        """
+        Return the worker limit that applies to the device holding a path.
+
+        Args:
+            path: Any path on the device (need not exist yet)
+
+        Returns:
+            int: Maximum number of concurrent workers
+        """
+        return self._device_limit(self._device_of(path), path)
+
+    @staticmethod
+    def _run_batch(tasks: List[IOTask], results: List[IOResult], positions: List[int], tracker: "_Progress",
+                   slots: List[threading.BoundedSemaphore]):
+        """Run a batch of tasks one after another, recording each outcome, holding a slot of each device."""
+        metrics = Metrics.shared()
+        # Always taken in device order, so workers waiting for each other's devices cannot deadlock
+        for slot in slots:
+            slot.acquire()
+        try:
+            for position in positions:
+                if tracker.cancelled:
+                    results[position].error = OperationCancelled()
+                    continue
+                start = time.perf_counter()
+                try:
+                    results[position].result = tasks[position].action()
+                except Exception as e:
+                    results[position].error = e
+                metrics.observe('io_task_duration_seconds', time.perf_counter() - start)
+                tracker.advance(tasks[position].source)
+        finally:
+            for slot in reversed(slots):
+                slot.release()
+
+    def _reset_queues(self, predicate: Callable[[Tuple[int, int]], bool]):
+        """Drop matching queues so that they pick up new limits on next use."""
+        for key in [k for k in self._queues if predicate(k)]:
+            self._queues.pop(key).executor.shutdown(wait=False)
+
+    def _queue_for(self, key: Tuple[int, int], device_paths: Dict[int, str]) -> _DeviceQueue:
+        """Return the worker pool for a (source, destination) device pair."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                limit = min(self._device_limit(device, device_paths[device]) for device in key)
+                queue = _DeviceQueue(limit, ThreadPoolExecutor(
+                    max_workers=limit, thread_name_prefix=f"onlyfiles-io-{key[0]}-{key[1]}"))
+                self._queues[key] = queue
+            return queue
+
+    def _slots_for(self, key: Tuple[int, int], device_paths: Dict[int, str]) -> List[threading.BoundedSemaphore]:
+        """Return the slot semaphores of the devices of a (source, destination) pair, in device order."""
+        with self._lock:
+            slots = []
+            for device in sorted(set(key)):
+                if device not in self._slots:
+                    self._slots[device] = threading.BoundedSemaphore(
+                        self._device_limit(device, device_paths[device]))
+                slots.append(self._slots[device])
+            return slots
+
+    def _device_limit(self, device: int, path: str) -> int:
+        """Return the configured or auto-tuned worker limit for a device."""
+        if device in self._device_limits:
+            return self._device_limits[device]
+        if self.default_limit:
+            return self.default_limit
+        if device not in self._tuned_limits:
+            self._tuned_limits[device] = DriveOperations.suggest_parallelism(self._existing_ancestor(path))
+        return self._tuned_limits[device]
+
+    @staticmethod
+    def _device_of(path: str) -> int:
+        """Return the st_dev of a path, or of its closest existing ancestor."""
+        try:
+            return os.stat(IOScheduler._existing_ancestor(path)).st_dev
+        except OSError:
+            return -1
+
+    @staticmethod
+    def _existing_ancestor(path: str) -> str:
+        """Return the path itself or its nearest parent that exists."""
+        path = os.path.abspath(path)
+        while not os.path.exists(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return path
+
+
+class _Progress:
+    """Counts finished tasks of one run and reports them to its callback."""
+
+    def __init__(self, total: int, callback: Optional[ProgressCallback], cancel: Optional[threading.Event]):
+        self.total = total
+        self.completed = 0
+        self._callback = callback
+        self._cancel = cancel
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel is not None and self._cancel.is_set()
+
+    def advance(self, path: str):
+        if self._callback is None:
+            return
+        with self._lock:
+            self.completed += 1
+            completed = self.completed
+        self._callback(completed, self.total, path)
@@ -0,0 +1,175 @@
+import fcntl
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from src.core.job_queue import Job, JobQueue, worker_name
+from src.core.operations import run_operation
+
+DEFAULT_WORKERS = 4
+# Seconds between looks at the queue when it is idle
+POLL_INTERVAL = 1.0
+# Minimum seconds between progress updates written for one job
+PROGRESS_INTERVAL = 1.0
+
+# Called with (job, event) where event is 'started', 'done', 'retry', 'failed' or 'cancelled'
+JobCallback = Callable[[Job, str], None]
+
+
+class DaemonAlreadyRunning(Exception):
+    """Raised when another daemon already serves the job queue."""
+
+
+class JobDaemon:
+    """
+    Long-running worker pool serving the job queue.
+
+    The daemon keeps one process, and with it the I/O scheduler's device
+    queues, tuned device limits and open caches, warm across jobs, so a
+    queue of many small jobs is bound by the disks rather than by starting
+    Python for each job. Only one daemon runs per queue, enforced with a
+    lock file next to it.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, workers: int = DEFAULT_WORKERS,
+                 on_event: Optional[JobCallback] = None):
+        """
+        Args:
+            queue: Queue to serve, defaults to ~/.onlyfiles/jobs.db
+            workers: Jobs run at the same time
+            on_event: Called from worker threads as jobs start and finish
+        """
+        self.queue = queue or JobQueue()
+        self.workers = max(1, workers)
+        self.on_event = on_event
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+        self._running: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._lock_file = None
+
+    def run(self, drain: bool = False):
+        """
+        Serve the queue until stopped (SIGTERM/SIGINT or stop()).
+
+        Args:
+            drain: Return as soon as the queue has nothing left to run, instead of waiting for new jobs
+
+        Raises:
+            DaemonAlreadyRunning: If another daemon holds the queue's lock
+        """
+        self._acquire_lock()
+        try:
+            # Jobs left running by a daemon that died are ours to retry
+            self.queue.requeue_abandoned(f"{socket.gethostname()}:")
+            if threading.current_thread() is threading.main_thread():
+                for signum in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(signum, lambda *_: self.stop())
+
+            threads = [threading.Thread(target=self._work, args=(number, drain), name=f"onlyfiles-job-{number}")
+                       for number in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            while any(thread.is_alive() for thread in threads):
+                self._watch_cancellations()
+                for thread in threads:
+                    thread.join(POLL_INTERVAL / len(threads))
+        finally:
+            self._release_lock()
+
+    def stop(self):
+        """Stop claiming jobs; jobs already running are finished first."""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _work(self, number: int, drain: bool):
+        """Worker loop: claim a job, run it, record the outcome."""
+        name = worker_name(number)
+        while not self._stop.is_set():
+            job = self.queue.claim(name)
+            if job is None:
+                if drain and not self._busy():
+                    next_retry = self.queue.next_retry()
+                    if next_retry is None:
+                        return
+                    # Wait for delayed retries before calling the queue drained
+                    self._sleep(min(POLL_INTERVAL, max(0.0, next_retry - time.time())))
+                    continue
+                self._sleep(POLL_INTERVAL)
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: Job):
+        """Run one claimed job and record how it ended."""
+        cancel = threading.Event()
+        with self._lock:
+            self._running[job.id] = cancel
+        self._notify(job, 'started')
+
+        last_report = [0.0]
+
+        def progress(completed: int, total: int, path: str):
+            now = time.monotonic()
+            if now - last_report[0] >= PROGRESS_INTERVAL or completed == total:
+                last_report[0] = now
+                self.queue.report_progress(job.id, completed, total)
+
+        try:
+            result = run_operation(job.operation, job.params, progress, cancel)
+        except Exception as e:
+            retried = self.queue.fail(job.id, f"{type(e).__name__}: {e}")
+            self._notify(self.queue.get(job.id), 'retry' if retried else 'failed')
+        else:
+            self.queue.complete(job.id, result, cancelled=cancel.is_set())
+            self._notify(self.queue.get(job.id), 'cancelled' if cancel.is_set() else 'done')
+        finally:
+            with self._lock:
+                del self._running[job.id]
+            # A finished job may unblock queued jobs on the same directory
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+    def _watch_cancellations(self):
+        """Pass cancellation requests from the queue on to the jobs running here."""
+        with self._lock:
+            running = dict(self._running)
+        for job_id in self.queue.cancel_requested(list(running)):
+            running[job_id].set()
+
+    def _busy(self) -> bool:
+        with self._lock:
+            return bool(self._running)
+
+    def _sleep(self, seconds: float):
+        with self._wakeup:
+            self._wakeup.wait(seconds)
+
+    def _notify(self, job: Optional[Job], event: str):
+        if self.on_event is not None and job is not None:
+            self.on_event(job, event)
+
+    def _acquire_lock(self):
+        """Take the exclusive lock that marks this process as the queue's daemon."""
+        lock_path = Path(str(self.queue.db_path) + '.lock')
+        self._lock_file = open(lock_path, 'a+')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise DaemonAlreadyRunning(f"Another daemon is already serving {self.queue.db_path}")
+        self._lock_file.seek(0)
+        self._lock_file.truncate()
+        self._lock_file.write(f"{os.getpid()}\n")
+        self._lock_file.flush()
+
+    def _release_lock(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
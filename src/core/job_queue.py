@@ -0,0 +1,319 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.core.dir_lock import paths_overlap
+from src.core.operations import operation_targets
+
+# Job states
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+JOB_STATES = (QUEUED, RUNNING, DONE, FAILED, CANCELLED)
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds before the first retry; doubled for every further attempt
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 600.0
+
+
+@dataclass
+class Job:
+    """A queued, running or finished job."""
+
+    id: int
+    operation: str
+    params: Dict[str, Any]
+    targets: List[str]
+    priority: int
+    status: str
+    attempts: int
+    max_attempts: int
+    submitted: float
+    started: Optional[float]
+    finished: Optional[float]
+    completed: int
+    total: int
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    worker: Optional[str]
+    cancel_requested: bool
+
+
+class JobQueue:
+    """
+    Persistent SQLite queue of operations for the job daemon.
+
+    Jobs are claimed highest priority first, oldest first within a
+    priority. A job is never claimed while another running job writes to
+    an overlapping path, so jobs on the same directory run one after
+    another while jobs on different directories run in parallel. Failed
+    jobs are retried with exponential backoff up to their attempt limit.
+
+    Every method opens its own connection, so a queue can be shared by
+    threads and by several processes (the daemon and `onlyfiles submit`).
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = db_path or Path.home() / '.onlyfiles' / 'jobs.db'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " operation TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " targets TEXT NOT NULL,"
+                " priority INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL,"
+                " submitted REAL NOT NULL,"
+                " not_before REAL NOT NULL,"
+                " started REAL,"
+                " finished REAL,"
+                " completed INTEGER NOT NULL DEFAULT 0,"
+                " total INTEGER NOT NULL DEFAULT 0,"
+                " result TEXT,"
+                " error TEXT,"
+                " worker TEXT,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id)")
+
+    def submit(self, operation: str, params: Dict[str, Any], priority: int = 0,
+               max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """
+        Add a job to the queue.
+
+        Args:
+            operation: Operation name (see src.core.operations.OPERATIONS)
+            params: Operation parameters; relative paths are made absolute
+            priority: Higher priorities are claimed first
+            max_attempts: Times the job is tried before it is marked failed
+
+        Returns:
+            int: Id of the new job
+
+        Raises:
+            ValueError: If the operation or its parameters are invalid
+        """
+        params = {key: os.path.abspath(value) if key in ('directory', 'path', 'source', 'destination') else value
+                  for key, value in params.items()}
+        targets = operation_targets(operation, params)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (operation, params, targets, priority, status, max_attempts, submitted, not_before)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (operation, json.dumps(params), json.dumps(targets), priority, QUEUED, max(1, max_attempts), now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Take the next runnable job and mark it running.
+
+        Args:
+            worker: Name of the claiming worker, recorded with the job
+
+        Returns:
+            Optional[Job]: The claimed job, or None if nothing can run right now
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            # Take the write lock first so two workers never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = [json.loads(row[0]) for row in
+                           conn.execute("SELECT targets FROM jobs WHERE status = ?", (RUNNING,))]
+                candidates = conn.execute(
+                    "SELECT id, targets FROM jobs WHERE status = ? AND not_before <= ?"
+                    " ORDER BY priority DESC, id",
+                    (QUEUED, now)
+                )
+                claimed = None
+                for job_id, targets in candidates:
+                    if not any(paths_overlap(json.loads(targets), other) for other in running):
+                        claimed = job_id
+                        break
+                if claimed is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started = ?, worker = ?, attempts = attempts + 1,"
+                        " completed = 0, total = 0 WHERE id = ?",
+                        (RUNNING, now, worker, claimed)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(claimed) if claimed is not None else None
+
+    def report_progress(self, job_id: int, completed: int, total: int):
+        """Record how far a running job has got."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET completed = ?, total = ? WHERE id = ?", (completed, total, job_id))
+
+    def complete(self, job_id: int, result: Dict[str, Any], cancelled: bool = False):
+        """
+        Mark a running job as finished.
+
+        Args:
+            job_id: Job id
+            result: Summary returned by the operation
+            cancelled: The operation stopped early because the job was cancelled
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, error = NULL WHERE id = ?",
+                (CANCELLED if cancelled else DONE, time.time(), json.dumps(result), job_id)
+            )
+
+    def fail(self, job_id: int, error: str) -> bool:
+        """
+        Record a failed attempt, queueing the job again unless it is out of attempts.
+
+        Args:
+            job_id: Job id
+            error: Description of the failure
+
+        Returns:
+            bool: True if the job will be retried
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            attempts, max_attempts, cancel_requested = conn.execute(
+                "SELECT attempts, max_attempts, cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if attempts < max_attempts and not cancel_requested:
+                delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempts - 1))
+                conn.execute(
+                    "UPDATE jobs SET status = ?, not_before = ?, error = ?, worker = NULL WHERE id = ?",
+                    (QUEUED, now + delay, error, job_id)
+                )
+                return True
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                (CANCELLED if cancel_requested else FAILED, now, error, job_id)
+            )
+            return False
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a job: queued jobs are dropped, running jobs are asked to stop at the next file.
+
+        Args:
+            job_id: Job id
+
+        Returns:
+            bool: False if the job does not exist or has already finished
+        """
+        with closing(self._connect()) as conn, conn:
+            dropped = conn.execute(
+                "UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            ).rowcount
+            flagged = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+            ).rowcount
+        return bool(dropped or flagged)
+
+    def cancel_requested(self, job_ids: List[int]) -> List[int]:
+        """Return which of the given running jobs have been asked to stop."""
+        if not job_ids:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({','.join('?' * len(job_ids))})",
+                job_ids
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def requeue_abandoned(self, worker_prefix: str) -> int:
+        """
+        Put jobs that were running when a previous daemon died back in the queue.
+
+        Args:
+            worker_prefix: Prefix of the worker names of the dead daemon's host
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND worker LIKE ?",
+                (QUEUED, RUNNING, worker_prefix + '%')
+            ).rowcount
+
+    def get(self, job_id: int) -> Optional[Job]:
+        """
+        Look up a job.
+
+        Args:
+            job_id: Job id
+
+        Returns:
+            Optional[Job]: The job, or None if there is none with that id
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Job]:
+        """
+        List jobs, newest first.
+
+        Args:
+            status: Only jobs in this state
+            limit: Maximum number of jobs returned
+
+        Returns:
+            List[Job]: Matching jobs
+        """
+        query = f"SELECT {self._COLUMNS} FROM jobs"
+        args: list = []
+        if status:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with closing(self._connect()) as conn:
+            return [self._job(row) for row in conn.execute(query, args)]
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of jobs in each state."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def next_retry(self) -> Optional[float]:
+        """Return when the earliest delayed job becomes runnable, if any is waiting."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MIN(not_before) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+        return row[0]
+
+    _COLUMNS = ("id, operation, params, targets, priority, status, attempts, max_attempts, submitted, started,"
+                " finished, completed, total, result, error, worker, cancel_requested")
+
+    @staticmethod
+    def _job(row: tuple) -> Job:
+        """Build a Job from a row selected with _COLUMNS."""
+        values = list(row)
+        values[2], values[3] = json.loads(values[2]), json.loads(values[3])
+        values[13] = json.loads(values[13]) if values[13] else None
+        values[16] = bool(values[16])
+        return Job(*values)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; each call gets its own so threads never share one."""
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+
+def worker_name(number: int) -> str:
+    """Name a daemon worker after the host and process it runs in."""
+    return f"{socket.gethostname()}:{os.getpid()}:{number}"
@@ -0,0 +1,293 @@
+import hashlib
+import os
+import sqlite3
+import stat
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.core.backup_verifier import BackupVerifier
+from src.core.io_scheduler import IOScheduler
+
+# Node kinds
+FILE, DIRECTORY, SYMLINK = 'f', 'd', 'l'
+
+
+@dataclass
+class MerkleNode:
+    """One file, directory or symlink in the index."""
+
+    path: str
+    kind: str
+    size: int
+    mtime_ns: int
+    ino: int
+    hash: Optional[str]
+
+
+@dataclass
+class TreeChange:
+    """A difference between two trees."""
+
+    relative_path: str
+    status: str  # 'added', 'removed' or 'modified'
+    kind: str
+
+
+class MerkleIndex:
+    """
+    Persistent Merkle tree of file and directory fingerprints.
+
+    A file's hash is the hash of its contents; a directory's hash is built
+    from the (name, kind, size, mtime, hash) entries of its children. Two
+    trees, or two subtrees, with the same hash are therefore identical and
+    never need to be compared further, so diffs only descend into subtrees
+    that actually changed.
+
+    Refreshing a tree stats every entry but only re-hashes files whose
+    size, mtime or inode changed since the last refresh.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = db_path or Path.home() / '.onlyfiles' / 'merkle.db'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                " path TEXT PRIMARY KEY,"
+                " parent TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " ino INTEGER NOT NULL,"
+                " hash TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (parent)")
+
+    def refresh(self, root: str, workers: Optional[int] = None) -> MerkleNode:
+        """
+        Bring the index of a file or directory tree up to date.
+
+        Args:
+            root: File or directory to index
+            workers: Threads hashing changed files, defaults to what the device suits
+
+        Returns:
+            MerkleNode: The root node with its new hash
+
+        Raises:
+            FileNotFoundError: If the root does not exist
+        """
+        root = os.path.abspath(root)
+        root_stat = os.lstat(root)
+        cached = {node.path: node for node in self._load_subtree(root)}
+        workers = workers or IOScheduler.shared().limit_for(root)
+
+        nodes: Dict[str, MerkleNode] = {}
+        children: Dict[str, List[str]] = {}
+        pending: Dict[str, Future] = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-merkle") as executor:
+            def visit(path: str, st: os.stat_result):
+                node = MerkleIndex._describe(path, st)
+                nodes[path] = node
+                if node.kind == FILE:
+                    old = cached.get(path)
+                    if (old is not None and old.hash is not None and old.kind == FILE and old.size == node.size
+                            and old.mtime_ns == node.mtime_ns and old.ino == node.ino):
+                        node.hash = old.hash
+                    else:
+                        pending[path] = executor.submit(BackupVerifier.hash_file, path)
+                elif node.kind == SYMLINK:
+                    node.hash = hashlib.blake2b(os.fsencode(os.readlink(path))).hexdigest()
+
+            visit(root, root_stat)
+            directories = [root] if nodes[root].kind == DIRECTORY else []
+            for directory in directories:
+                # directories grows as subdirectories are found: a breadth-first walk
+                names = children[directory] = []
+                try:
+                    with os.scandir(directory) as it:
+                        entries = list(it)
+                except OSError:
+                    entries = []
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+                        continue
+                    visit(entry.path, st)
+                    names.append(entry.name)
+                    if stat.S_ISDIR(st.st_mode):
+                        directories.append(entry.path)
+
+            for path, future in pending.items():
+                try:
+                    nodes[path].hash = future.result()
+                except OSError:
+                    # Left unhashed; it differs from everything and is retried next time
+                    nodes[path].hash = None
+
+        # Children were discovered after their parents, so hash directories in reverse
+        for directory in reversed(directories):
+            nodes[directory].hash = MerkleIndex._directory_hash(
+                [(name, nodes[os.path.join(directory, name)]) for name in children[directory]]
+            )
+
+        self._store(root, nodes, cached)
+        return nodes[root]
+
+    def get(self, path: str) -> Optional[MerkleNode]:
+        """
+        Look up an indexed node without touching the filesystem.
+
+        Args:
+            path: Indexed path
+
+        Returns:
+            Optional[MerkleNode]: The node, or None if the path is not indexed
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT path, kind, size, mtime_ns, ino, hash FROM nodes WHERE path = ?",
+                (os.path.abspath(path),)
+            ).fetchone()
+        return MerkleNode(*row) if row else None
+
+    def snapshot(self, path: str, rescan: bool = True) -> MerkleNode:
+        """
+        Return the root node of an indexed tree, refreshing it unless told not to.
+
+        Args:
+            path: File or directory
+            rescan: Refresh even if the tree is already indexed; backups, which
+                never change, can skip this
+
+        Returns:
+            MerkleNode: The root node
+        """
+        node = None if rescan else self.get(path)
+        return node or self.refresh(path)
+
+    def diff(self, left: str, right: str) -> Iterator[TreeChange]:
+        """
+        Compare two indexed trees, descending only into subtrees whose hashes differ.
+
+        Both trees must have been indexed (see refresh and snapshot). Changes
+        are reported relative to the roots, from left to right: 'added' means
+        only in right. Entries that differ only in their mtime are not
+        reported.
+
+        Args:
+            left: Root of the first tree
+            right: Root of the second tree
+
+        Returns:
+            Iterator[TreeChange]: Added, removed and modified entries
+        """
+        left, right = os.path.abspath(left), os.path.abspath(right)
+        left_node, right_node = self.get(left), self.get(right)
+        if left_node is None or right_node is None:
+            raise ValueError("Both trees must be indexed before they can be compared")
+
+        with closing(self._connect()) as conn:
+            stack: List[Tuple[str, MerkleNode, MerkleNode]] = [('.', left_node, right_node)]
+            while stack:
+                relative, a, b = stack.pop()
+                if a.hash is not None and a.hash == b.hash:
+                    continue
+                if a.kind != b.kind:
+                    yield TreeChange(relative, 'removed', a.kind)
+                    yield TreeChange(relative, 'added', b.kind)
+                elif a.kind != DIRECTORY:
+                    if a.hash != b.hash or a.size != b.size or a.hash is None:
+                        yield TreeChange(relative, 'modified', a.kind)
+                else:
+                    a_children = self._children(conn, a.path)
+                    b_children = self._children(conn, b.path)
+                    for name in sorted(a_children.keys() | b_children.keys(), reverse=True):
+                        child = name if relative == '.' else os.path.join(relative, name)
+                        if name not in b_children:
+                            yield TreeChange(child, 'removed', a_children[name].kind)
+                        elif name not in a_children:
+                            yield TreeChange(child, 'added', b_children[name].kind)
+                        else:
+                            stack.append((child, a_children[name], b_children[name]))
+
+    def forget(self, root: str):
+        """
+        Drop a tree from the index, e.g. after its backup was deleted.
+
+        Args:
+            root: Root of the tree to forget
+        """
+        root = os.path.abspath(root)
+        low, high = MerkleIndex._subtree_bounds(root)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM nodes WHERE path = ? OR (path > ? AND path < ?)", (root, low, high))
+
+    @staticmethod
+    def _describe(path: str, st: os.stat_result) -> MerkleNode:
+        """Build an (unhashed) node from a stat result."""
+        if stat.S_ISDIR(st.st_mode):
+            kind = DIRECTORY
+        elif stat.S_ISLNK(st.st_mode):
+            kind = SYMLINK
+        else:
+            kind = FILE
+        size = st.st_size if kind == FILE else 0
+        return MerkleNode(path, kind, size, st.st_mtime_ns, st.st_ino, None)
+
+    @staticmethod
+    def _directory_hash(entries: List[Tuple[str, MerkleNode]]) -> str:
+        """Hash a directory from its children's (name, kind, size, mtime, hash) entries."""
+        digest = hashlib.blake2b()
+        for name, node in sorted(entries, key=lambda item: item[0]):
+            digest.update(os.fsencode(name))
+            digest.update(f"\0{node.kind}\0{node.size}\0{node.mtime_ns}\0{node.hash or '?'}\n".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _subtree_bounds(root: str) -> Tuple[str, str]:
+        """Return bounds such that low < path < high holds exactly for paths below root."""
+        prefix = os.path.join(root, '')
+        # The separator is followed by the next character in sort order
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def _load_subtree(self, root: str) -> Iterator[MerkleNode]:
+        """Yield every indexed node of a tree, the root included."""
+        low, high = MerkleIndex._subtree_bounds(root)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT path, kind, size, mtime_ns, ino, hash FROM nodes WHERE path = ? OR (path > ? AND path < ?)",
+                (root, low, high)
+            )
+            for row in rows:
+                yield MerkleNode(*row)
+
+    def _store(self, root: str, nodes: Dict[str, MerkleNode], cached: Dict[str, MerkleNode]):
+        """Write the nodes that changed and drop the ones that disappeared."""
+        changed = [node for path, node in nodes.items() if cached.get(path) != node]
+        gone = [(path,) for path in cached.keys() - nodes.keys()]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM nodes WHERE path = ?", gone)
+            conn.executemany(
+                "INSERT OR REPLACE INTO nodes (path, parent, kind, size, mtime_ns, ino, hash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((n.path, os.path.dirname(n.path), n.kind, n.size, n.mtime_ns, n.ino, n.hash) for n in changed)
+            )
+
+    @staticmethod
+    def _children(conn: sqlite3.Connection, path: str) -> Dict[str, MerkleNode]:
+        """Load the indexed children of a directory, keyed by name."""
+        rows = conn.execute(
+            "SELECT path, kind, size, mtime_ns, ino, hash FROM nodes WHERE parent = ?", (path,)
+        ).fetchall()
+        return {os.path.basename(row[0]): MerkleNode(*row) for row in rows if row[0] != path}
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; each call gets its own so threads never share one."""
+        return sqlite3.connect(str(self.db_path), timeout=30)
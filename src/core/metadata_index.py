@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import stat
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from src.core.dir_lock import paths_overlap
+from src.core.file_organizer import FileOrganizer
+from src.core.io_scheduler import OperationCancelled
+from src.core.query import FileRecord, Predicate
+
+# Rows written per statement batch while a tree is scanned
+_INSERT_BATCH = 5000
+_COLUMNS = "path, name, ext, category, size, mtime, ctime"
+
+
+class MetadataIndex:
+    """
+    Persistent index of the regular files of scanned trees, for queries without walking the disk.
+
+    Each scan of a tree replaces everything the index knew about it, in
+    one transaction, so a query never sees half of a scan. Queries are
+    answered from SQLite with the predicate turned into SQL; a live scan
+    instead evaluates the predicate while walking the tree and streams
+    matches as they are found, refreshing the index on the way.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        Args:
+            db_path: Database file, defaults to ~/.onlyfiles/metadata.db
+        """
+        self.db_path = db_path or Path.home() / '.onlyfiles' / 'metadata.db'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " ext TEXT NOT NULL,"
+                " category TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime REAL NOT NULL,"
+                " ctime REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS files_ext ON files (ext)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime)")
+            conn.execute("CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY, scanned REAL NOT NULL)")
+
+    def refresh(self, root: str, cancel: Optional[threading.Event] = None) -> int:
+        """
+        Scan a tree and replace its part of the index.
+
+        Args:
+            root: Directory to scan
+            cancel: Event that abandons the scan, leaving the index as it was, when set
+
+        Returns:
+            int: Number of files indexed
+
+        Raises:
+            FileNotFoundError: If the root is not a directory
+            OperationCancelled: If the scan was cancelled
+        """
+        return sum(1 for _ in self.scan(root, cancel=cancel))
+
+    def scan(self, root: str, predicate: Optional[Predicate] = None,
+             cancel: Optional[threading.Event] = None) -> Iterator[FileRecord]:
+        """
+        Walk a tree, yielding the files that match as they are found, and store the scan.
+
+        The scan is stored only if it runs to the end; stopping the
+        iteration early (or cancelling) leaves the index as it was.
+
+        Args:
+            root: Directory to scan
+            predicate: Query to match, by default every file
+            cancel: Event that stops the scan when set
+
+        Returns:
+            Iterator[FileRecord]: Matching files, in walk order
+
+        Raises:
+            FileNotFoundError: If the root is not a directory
+            OperationCancelled: If the scan was cancelled
+        """
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"{root} is not a directory")
+        started = time.time()
+        conn = self._connect()
+        completed = False
+        try:
+            low, high = MetadataIndex._subtree_bounds(root)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM files WHERE path > ? AND path < ?", (low, high))
+            batch: List[Tuple] = []
+            for record in MetadataIndex._walk(root, cancel):
+                batch.append((record.path, record.name, record.ext, record.category,
+                              record.size, record.mtime, record.ctime))
+                if len(batch) >= _INSERT_BATCH:
+                    conn.executemany(f"INSERT OR REPLACE INTO files ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                    batch = []
+                if predicate is None or predicate.matches(record):
+                    yield record
+            conn.executemany(f"INSERT OR REPLACE INTO files ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            # A scan of a tree supersedes earlier scans of its subtrees
+            conn.execute("DELETE FROM roots WHERE path = ? OR (path > ? AND path < ?)", (root, low, high))
+            conn.execute("INSERT INTO roots (path, scanned) VALUES (?, ?)", (root, started))
+            conn.commit()
+            completed = True
+        finally:
+            if not completed:
+                conn.rollback()
+            conn.close()
+
+    def query(self, root: str, predicate: Predicate) -> Iterator[FileRecord]:
+        """
+        Yield the indexed files under a directory that match a query, without touching the disk.
+
+        Args:
+            root: Directory whose subtree is searched
+            predicate: Parsed query
+
+        Returns:
+            Iterator[FileRecord]: Matching files, ordered by path
+        """
+        low, high = MetadataIndex._subtree_bounds(os.path.abspath(root))
+        clause, params = predicate.sql()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM files WHERE path > ? AND path < ? AND {clause} ORDER BY path",
+                [low, high, *params]
+            )
+            for row in rows:
+                yield FileRecord(*row)
+
+    def scanned_at(self, root: str) -> Optional[float]:
+        """
+        Return when the index last covered a directory, from a scan of it or of an ancestor.
+
+        Args:
+            root: Directory
+
+        Returns:
+            Optional[float]: Start time of the most recent covering scan, None if it was never scanned
+        """
+        root = os.path.abspath(root)
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT path, scanned FROM roots").fetchall()
+        times = [scanned for path, scanned in rows
+                 if path == root or root.startswith(os.path.join(path, ''))]
+        return max(times) if times else None
+
+    def roots(self) -> List[Tuple[str, float]]:
+        """List the scanned trees and when each was scanned."""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT path, scanned FROM roots ORDER BY path").fetchall()
+
+    def forget(self, root: str):
+        """
+        Drop a tree from the index.
+
+        Args:
+            root: Directory to forget, with everything below it
+        """
+        root = os.path.abspath(root)
+        low, high = MetadataIndex._subtree_bounds(root)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM files WHERE path > ? AND path < ?", (low, high))
+            for path, _ in conn.execute("SELECT path, scanned FROM roots").fetchall():
+                if paths_overlap([path], [root]):
+                    conn.execute("DELETE FROM roots WHERE path = ?", (path,))
+
+    @staticmethod
+    def record(path: str, st: os.stat_result) -> FileRecord:
+        """Build the index record of a regular file from its stat result."""
+        name = os.path.basename(path)
+        return FileRecord(path, name, os.path.splitext(name)[1][1:].lower(), FileOrganizer.get_file_category(name),
+                          st.st_size, st.st_mtime, st.st_ctime)
+
+    @staticmethod
+    def _walk(root: str, cancel: Optional[threading.Event]) -> Iterator[FileRecord]:
+        """Yield a record for every regular file below root, without following symlinks."""
+        pending = [root]
+        while pending:
+            if cancel is not None and cancel.is_set():
+                raise OperationCancelled()
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    pending.append(entry.path)
+                elif stat.S_ISREG(st.st_mode):
+                    yield MetadataIndex.record(entry.path, st)
+
+    @staticmethod
+    def _subtree_bounds(root: str) -> Tuple[str, str]:
+        """Return bounds such that low < path < high holds exactly for paths below root."""
+        prefix = os.path.join(root, '')
+        # The separator is followed by the next character in sort order
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; each call gets its own so threads never share one."""
+        return sqlite3.connect(str(self.db_path), timeout=30)
@@ -0,0 +1,202 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.core.backup_retention import RetentionPolicy
+from src.core.file_operations import FileOperations
+from src.core.file_organizer import ORGANIZE_METHODS, FileOrganizer
+from src.core.io_scheduler import ProgressCallback
+from src.core.scan_cache import ScanCache
+from src.core.throttle import Throttle
+from src.core.tree_cleanup import TreeCleanup
+
+# Directory listings shared by every analyze run in this process
+SCAN_CACHE = ScanCache()
+
+
+def _throttle(params: Dict[str, Any]) -> Optional[Throttle]:
+    """Build a Throttle from the max_bytes_per_sec / max_files_per_sec parameters."""
+    max_bytes, max_files = params.get('max_bytes_per_sec'), params.get('max_files_per_sec')
+    return Throttle(max_bytes, max_files) if max_bytes or max_files else None
+
+
+def _cleanup_after(params: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove the empty directories left in params['directory'] if params['cleanup'] asks for it."""
+    if params.get('cleanup'):
+        result['directories_removed'] = len(TreeCleanup.remove_empty(params['directory']).removed)
+    return result
+
+
+def _organize(params: Dict[str, Any], progress: Optional[ProgressCallback],
+              cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    return _cleanup_after(params, _organize_files(params, progress, cancel))
+
+
+def _organize_files(params: Dict[str, Any], progress: Optional[ProgressCallback],
+                    cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    by = params.get('by', 'type')
+    directory = params['directory']
+    if params.get('archive_to'):
+        archived = FileOrganizer.organize_to_archives(directory, by, params.get('date_source', 'birth'),
+                                                      params['archive_to'], params.get('compression'),
+                                                      params.get('archive_workers', 1), progress, cancel)
+        moved = {key: len(files) for key, files in archived.items() if files}
+        return {'moved': sum(moved.values()), 'categories': moved, 'archive': params['archive_to']}
+    if params.get('sharded'):
+        moved = FileOrganizer.organize_sharded(directory, by, params.get('date_source', 'birth'),
+                                               progress=progress, cancel=cancel)
+        moved = {key: count for key, count in moved.items() if count}
+        return {'moved': sum(moved.values()), 'categories': moved}
+    if by == 'type':
+        organized = FileOrganizer.organize_by_type(directory, progress, cancel)
+    elif by == 'extension':
+        organized = FileOrganizer.organize_by_extension(directory, progress, cancel)
+    elif by == 'date':
+        organized = FileOrganizer.organize_by_date(directory, params.get('date_source', 'birth'), progress, cancel)
+    elif by == 'size':
+        organized = FileOrganizer.organize_by_size(directory, progress, cancel)
+    else:
+        raise ValueError(f"Unknown organization '{by}', expected one of {', '.join(ORGANIZE_METHODS)}")
+    moved = {key: len(files) for key, files in organized.items() if files}
+    return {'moved': sum(moved.values()), 'categories': moved}
+
+
+def _revert_organization(params: Dict[str, Any], progress: Optional[ProgressCallback],
+                         cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    if not FileOrganizer.revert_last_organization(params['directory']):
+        raise RuntimeError(f"Failed to revert organization in {params['directory']}")
+    return _cleanup_after(params, {'reverted': params['directory']})
+
+
+def _cleanup(params: Dict[str, Any], progress: Optional[ProgressCallback],
+             cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    report = TreeCleanup.remove_empty(params['directory'], params.get('dry_run', False),
+                                      params.get('include_hidden', False), progress, cancel)
+    result = {'empty': len(report.empty), 'removed': len(report.removed), 'tops': report.tops}
+    if report.errors:
+        result['errors'] = report.errors
+    return result
+
+
+def _analyze(params: Dict[str, Any], progress: Optional[ProgressCallback],
+             cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    analysis = FileOrganizer.analyze_directory(params['directory'], params.get('recursive', False), SCAN_CACHE)
+    return {
+        'files': sum(totals['files'] for totals in analysis.values()),
+        'bytes': sum(totals['bytes'] for totals in analysis.values()),
+        'categories': {category: totals for category, totals in analysis.items() if totals['files']},
+    }
+
+
+def _backup(params: Dict[str, Any], progress: Optional[ProgressCallback],
+            cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    path = params['path']
+    keep = params.get('keep')
+    if isinstance(keep, str):
+        # Manifests and queued jobs give the policy as text; the CLI may pass a parsed one
+        keep = RetentionPolicy.parse(keep) if keep else None
+    created = FileOperations.create_backup(
+        path, throttle=_throttle(params), verify=params.get('verify', False),
+        retention=keep, chunked=params.get('chunked', False),
+        archive=params.get('archive', False), compression=params.get('compression'),
+        progress=progress, cancel=cancel
+    )
+    if not created:
+        raise RuntimeError(f"Failed to create backup for {path}")
+    return {'backup': FileOperations.get_latest_backup(path)}
+
+
+def _revert(params: Dict[str, Any], progress: Optional[ProgressCallback],
+            cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    path = params['path']
+    if not FileOperations.revert_to_backup(path, params.get('members'), progress, cancel):
+        raise RuntimeError(f"Failed to restore {path} from its latest backup")
+    return {'restored': path}
+
+
+def _move(params: Dict[str, Any], progress: Optional[ProgressCallback],
+          cancel: Optional[threading.Event]) -> Dict[str, Any]:
+    moved = FileOperations.move_files(
+        params['source'], params['destination'], params.get('pattern'), throttle=_throttle(params),
+        verify=params.get('verify', False), progress=progress, cancel=cancel
+    )
+    return {'moved': len(moved)}
+
+
+OperationFunction = Callable[[Dict[str, Any], Optional[ProgressCallback], Optional[threading.Event]], Dict[str, Any]]
+
+# Operation name -> (implementation, parameters naming the paths it writes to)
+OPERATIONS: Dict[str, Tuple[OperationFunction, Tuple[str, ...]]] = {
+    'organize': (_organize, ('directory',)),
+    'revert-organization': (_revert_organization, ('directory',)),
+    'analyze': (_analyze, ('directory',)),
+    'cleanup': (_cleanup, ('directory',)),
+    'backup': (_backup, ('path',)),
+    'revert': (_revert, ('path',)),
+    'move': (_move, ('source', 'destination')),
+}
+
+
+def validate_operation(name: str, params: Dict[str, Any]):
+    """
+    Check that an operation exists and has the paths it needs.
+
+    Args:
+        name: Operation name, see OPERATIONS
+        params: Operation parameters
+
+    Raises:
+        ValueError: If the operation is unknown or a path parameter is missing
+    """
+    if name not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+    for key in OPERATIONS[name][1]:
+        if not isinstance(params.get(key), str) or not params[key]:
+            raise ValueError(f"Operation '{name}' needs a '{key}' path")
+
+
+def operation_targets(name: str, params: Dict[str, Any]) -> List[str]:
+    """
+    Return the absolute paths an operation modifies.
+
+    Operations whose targets overlap (one is the other or inside it, see
+    src.core.dir_lock.paths_overlap) must not run at the same time.
+
+    Args:
+        name: Operation name
+        params: Operation parameters
+
+    Returns:
+        List[str]: Paths written to
+    """
+    validate_operation(name, params)
+    return [os.path.abspath(params[key]) for key in OPERATIONS[name][1]]
+
+
+def run_operation(name: str, params: Dict[str, Any], progress: Optional[ProgressCallback] = None,
+                  cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Run a named operation with JSON-style parameters.
+
+    This is the single entry point used by queued jobs and other
+    non-interactive front ends, so they all behave like the CLI.
+
+    Args:
+        name: Operation name, see OPERATIONS
+        params: Operation parameters, e.g. {'directory': '/data', 'by': 'type'}
+        progress: Called with (completed, total, path) as files are processed
+        cancel: Event that stops the operation at the next file when set
+
+    Returns:
+        Dict[str, Any]: JSON-serializable summary of what was done
+
+    Raises:
+        ValueError: If the operation or its parameters are invalid
+        FileNotFoundError: If a path the operation works on does not exist
+        RuntimeError: If the operation failed
+    """
+    validate_operation(name, params)
+    for key in OPERATIONS[name][1]:
+        if not os.path.exists(params[key]):
+            raise FileNotFoundError(f"{params[key]} does not exist")
+    return OPERATIONS[name][0](params, progress, cancel)
@@ -0,0 +1,356 @@
+import fnmatch
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+from src.core.file_organizer import FileOrganizer
+from src.utils.path_utils import PathUtils
+
+FIELDS = ('ext', 'category', 'size', 'mtime', 'ctime', 'age', 'name', 'path')
+# Accepted as another name for a field
+FIELD_ALIASES = {'type': 'category', 'modified': 'mtime', 'changed': 'ctime'}
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400, 'y': 365 * 86400}
+
+_TERM = re.compile(r'^([a-z]+)(>=|<=|!=|:|=|>|<)(.+)$')
+_TOKEN = re.compile(r'(\()|(\))|((?:"(?:[^"\\]|\\.)*"|\'[^\']*\'|[^\s()"\'])+)')
+
+
+class QueryError(ValueError):
+    """Raised for a query that cannot be parsed."""
+
+
+@dataclass
+class FileRecord:
+    """Metadata of one regular file, as stored in the metadata index."""
+
+    path: str
+    name: str
+    ext: str
+    category: str
+    size: int
+    mtime: float
+    ctime: float
+
+    def to_dict(self):
+        return {'path': self.path, 'name': self.name, 'ext': self.ext, 'category': self.category,
+                'size': self.size, 'mtime': self.mtime, 'ctime': self.ctime}
+
+
+class Predicate:
+    """
+    A parsed query, evaluated either in SQL over the metadata index or on a live scan.
+    """
+
+    def sql(self) -> Tuple[str, List[Any]]:
+        """Return a WHERE clause over the files table and its parameters."""
+        raise NotImplementedError
+
+    def matches(self, record: FileRecord) -> bool:
+        """Check whether a file satisfies the query."""
+        raise NotImplementedError
+
+
+class _All(Predicate):
+    def sql(self):
+        return '1', []
+
+    def matches(self, record):
+        return True
+
+
+class _And(Predicate):
+    def __init__(self, parts: List[Predicate]):
+        self.parts = parts
+
+    def sql(self):
+        clauses, params = zip(*(part.sql() for part in self.parts))
+        return '(' + ' AND '.join(clauses) + ')', [p for group in params for p in group]
+
+    def matches(self, record):
+        return all(part.matches(record) for part in self.parts)
+
+
+class _Or(Predicate):
+    def __init__(self, parts: List[Predicate]):
+        self.parts = parts
+
+    def sql(self):
+        clauses, params = zip(*(part.sql() for part in self.parts))
+        return '(' + ' OR '.join(clauses) + ')', [p for group in params for p in group]
+
+    def matches(self, record):
+        return any(part.matches(record) for part in self.parts)
+
+
+class _Not(Predicate):
+    def __init__(self, part: Predicate):
+        self.part = part
+
+    def sql(self):
+        clause, params = self.part.sql()
+        return f'(NOT {clause})', params
+
+    def matches(self, record):
+        return not self.part.matches(record)
+
+
+class _In(Predicate):
+    """ext or category equal to one of several values."""
+
+    def __init__(self, field: str, values: List[str]):
+        self.field = field
+        self.values = values
+
+    def sql(self):
+        return f"{self.field} IN ({', '.join('?' * len(self.values))})", list(self.values)
+
+    def matches(self, record):
+        return getattr(record, self.field) in self.values
+
+
+class _Compare(Predicate):
+    """A numeric field (size, mtime, ctime) compared with a value."""
+
+    _OPS = {
+        '>': lambda a, b: a > b, '>=': lambda a, b: a >= b, '<': lambda a, b: a < b,
+        '<=': lambda a, b: a <= b, '=': lambda a, b: a == b, '!=': lambda a, b: a != b,
+    }
+
+    def __init__(self, field: str, op: str, value: float):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def sql(self):
+        return f"{self.field} {self.op} ?", [self.value]
+
+    def matches(self, record):
+        return self._OPS[self.op](getattr(record, self.field), self.value)
+
+
+class _Glob(Predicate):
+    """name or path matching a shell pattern, where * also matches '/'."""
+
+    def __init__(self, field: str, pattern: str):
+        self.field = field
+        self.pattern = pattern
+
+    def sql(self):
+        return f"{self.field} GLOB ?", [self.pattern]
+
+    def matches(self, record):
+        return fnmatch.fnmatchcase(getattr(record, self.field), self.pattern)
+
+
+def parse_query(text: str, now: Optional[float] = None) -> Predicate:
+    """
+    Parse a query such as ``ext:pdf size>50M mtime:last-year``.
+
+    Terms are ``field:value`` or ``field<op>value`` with op one of
+    ``> >= < <= = !=``. Terms next to each other must all match; ``or``,
+    ``not`` (or a leading ``-``) and parentheses combine them otherwise.
+
+    - ``ext:pdf,docx`` - extension, without the dot; ``ext:`` alone matches files without one
+    - ``category:images`` (or ``type:``) - type category, as organize -y sorts them
+    - ``size>50M``, ``size:1M..1G`` - size, with K/M/G/T suffixes
+    - ``mtime:2024``, ``mtime>=2024-06``, ``mtime:last-year`` - modification date (``ctime``
+      likewise); ``:`` means within that year, month or day, and ``today``, ``yesterday``,
+      ``this-month``, ``last-month``, ``this-year`` and ``last-year`` name periods too
+    - ``age<30d`` - time since the last modification, in s, m, h, d, w or y
+    - ``name:*.tmp``, ``path:*/reports/*`` - shell patterns on the name or the full path
+
+    Args:
+        text: The query; empty matches every file
+        now: Time relative ages and dates are taken from, defaults to now
+
+    Returns:
+        Predicate: The parsed query
+
+    Raises:
+        QueryError: If the query is malformed
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"Cannot parse query near '{text[position:]}'")
+        tokens.append(match.group(1) or match.group(2) or match.group(3))
+        position = match.end()
+        while position < len(text) and text[position].isspace():
+            position += 1
+    parser = _Parser(tokens, time.time() if now is None else now)
+    if not tokens:
+        return _All()
+    predicate = parser.expression()
+    if parser.position != len(tokens):
+        raise QueryError(f"Unexpected '{tokens[parser.position]}' in query")
+    return predicate
+
+
+class _Parser:
+    """Recursive descent over the tokens: or-groups of and-groups of (negated) terms."""
+
+    def __init__(self, tokens: List[str], now: float):
+        self.tokens = tokens
+        self.position = 0
+        self.now = now
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise QueryError("Query ends too early")
+        self.position += 1
+        return token
+
+    def expression(self) -> Predicate:
+        parts = [self.conjunction()]
+        while (self.peek() or '').lower() == 'or':
+            self.take()
+            parts.append(self.conjunction())
+        return parts[0] if len(parts) == 1 else _Or(parts)
+
+    def conjunction(self) -> Predicate:
+        parts = [self.factor()]
+        while self.peek() not in (None, ')') and self.peek().lower() != 'or':
+            if self.peek().lower() == 'and':
+                self.take()
+            parts.append(self.factor())
+        return parts[0] if len(parts) == 1 else _And(parts)
+
+    def factor(self) -> Predicate:
+        token = self.take()
+        if token.lower() == 'not':
+            return _Not(self.factor())
+        if token == '(':
+            inner = self.expression()
+            if self.take() != ')':
+                raise QueryError("Missing ')' in query")
+            return inner
+        if token == ')':
+            raise QueryError("Unexpected ')' in query")
+        if token.startswith('-') and len(token) > 1:
+            return _Not(self.term(token[1:]))
+        return self.term(token)
+
+    def term(self, token: str) -> Predicate:
+        match = _TERM.match(token) or (re.match(r'^([a-z]+)(:)()$', token))
+        if match is None:
+            raise QueryError(f"'{token}' is not a query term such as ext:pdf or size>10M")
+        field, op, value = match.group(1).lower(), match.group(2), _unquote(match.group(3))
+        field = FIELD_ALIASES.get(field, field)
+        if field not in FIELDS:
+            raise QueryError(f"Unknown field '{field}', expected one of {', '.join(FIELDS)}")
+        if field in ('ext', 'category', 'name', 'path'):
+            if op not in (':', '=', '!='):
+                raise QueryError(f"'{field}' only supports ':', '=' and '!='")
+            predicate = self.text_term(field, value)
+            return _Not(predicate) if op == '!=' else predicate
+        if field == 'size':
+            return self.range_term(field, op, value, lambda v: (_size(v), _size(v) + 1))
+        if field == 'age':
+            if op in (':', '='):
+                raise QueryError("'age' needs a comparison, e.g. age<30d")
+            # A larger age is an older modification time
+            flipped = {'>': '<', '>=': '<=', '<': '>', '<=': '>=', '!=': '!='}[op]
+            return _Compare('mtime', flipped, self.now - _duration(value))
+        return self.range_term(field, op, value, lambda v: _period(v, self.now))
+
+    def text_term(self, field: str, value: str) -> Predicate:
+        if field == 'ext':
+            return _In('ext', [v.strip().lstrip('.').lower() for v in value.split(',')])
+        if field == 'category':
+            categories = [v.strip().lower() for v in value.split(',')]
+            for category in categories:
+                if category not in FileOrganizer.TYPE_CATEGORIES and category != 'others':
+                    raise QueryError(f"Unknown category '{category}'")
+            return _In('category', categories)
+        if not value:
+            raise QueryError(f"'{field}' needs a pattern")
+        return _Glob(field, value)
+
+    @staticmethod
+    def range_term(field: str, op: str, value: str, bounds) -> Predicate:
+        """Compare with a value standing for the interval [start, end)."""
+        if op == ':' and '..' in value:
+            low, _, high = value.partition('..')
+            parts = []
+            if low:
+                parts.append(_Compare(field, '>=', bounds(low)[0]))
+            if high:
+                parts.append(_Compare(field, '<', bounds(high)[1]))
+            if not parts:
+                raise QueryError(f"Empty range for '{field}'")
+            return parts[0] if len(parts) == 1 else _And(parts)
+        start, end = bounds(value)
+        if op in (':', '='):
+            return _And([_Compare(field, '>=', start), _Compare(field, '<', end)])
+        if op == '!=':
+            return _Or([_Compare(field, '<', start), _Compare(field, '>=', end)])
+        return {'>': _Compare(field, '>=', end), '>=': _Compare(field, '>=', start),
+                '<': _Compare(field, '<', start), '<=': _Compare(field, '<', end)}[op]
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        value = value[1:-1]
+        return value.replace('\\"', '"') if value else value
+    return value
+
+
+def _size(value: str) -> int:
+    try:
+        return PathUtils.parse_size(value)
+    except (ValueError, IndexError):
+        raise QueryError(f"'{value}' is not a size such as 512K or 50M")
+
+
+def _duration(value: str) -> float:
+    match = re.match(r'^(\d+(?:\.\d+)?)([smhdwy])$', value.lower())
+    if match is None:
+        raise QueryError(f"'{value}' is not a duration such as 12h, 30d or 2y")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def _period(value: str, now: float) -> Tuple[float, float]:
+    """Return the [start, end) timestamps of a year, month, day or named period."""
+    today = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    this_month = today.replace(day=1)
+    named = {
+        'today': (today, today + timedelta(days=1)),
+        'yesterday': (today - timedelta(days=1), today),
+        'this-month': (this_month, _add_months(this_month, 1)),
+        'last-month': (_add_months(this_month, -1), this_month),
+        'this-year': (today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)),
+        'last-year': (today.replace(year=today.year - 1, month=1, day=1), today.replace(month=1, day=1)),
+    }
+    if value.lower() in named:
+        start, end = named[value.lower()]
+        return start.timestamp(), end.timestamp()
+    for pattern, step in (('%Y', 'year'), ('%Y-%m', 'month'), ('%Y-%m-%d', 'day'),
+                          ('%Y-%m-%dT%H:%M', 'minute'), ('%Y-%m-%d %H:%M', 'minute')):
+        try:
+            start = datetime.strptime(value, pattern)
+        except ValueError:
+            continue
+        if step == 'year':
+            end = start.replace(year=start.year + 1)
+        elif step == 'month':
+            end = _add_months(start, 1)
+        elif step == 'day':
+            end = start + timedelta(days=1)
+        else:
+            end = start + timedelta(minutes=1)
+        return start.timestamp(), end.timestamp()
+    raise QueryError(f"'{value}' is not a date such as 2024, 2024-06, 2024-06-30 or last-year")
+
+
+def _add_months(date: datetime, months: int) -> datetime:
+    month = date.month - 1 + months
+    return date.replace(year=date.year + month // 12, month=month % 12 + 1)
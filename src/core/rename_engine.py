@@ -0,0 +1,245 @@
+import fnmatch
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.core.backup_verifier import BackupVerifier
+from src.core.filesystem import FileSystem
+from src.core.io_scheduler import IOScheduler, IOTask
+
+DEFAULT_CONFLICT_TEMPLATE = "{stem}_{n}{ext}"
+
+
+class NameAllocator:
+    """
+    Hands out file names that are unique within one directory.
+
+    The directory's names are loaded into a set once and every collision
+    is resolved in memory, so planning thousands of moves costs one
+    directory listing instead of an exists() call per candidate name.
+    """
+
+    def __init__(self, existing: Iterable[str] = (), conflict_template: str = DEFAULT_CONFLICT_TEMPLATE):
+        """
+        Args:
+            existing: Names already taken in the directory
+            conflict_template: Name used when a wanted name is taken; tokens are
+                {stem}, {ext}, {name}, {n} (a counter), {date} (file mtime) and {hash}
+                (content hash, e.g. {hash:.8})
+        """
+        self.taken: Set[str] = set(existing)
+        self.conflict_template = conflict_template
+        self._next: Dict[Tuple[str, str, str], int] = {}
+
+    @staticmethod
+    def for_directory(directory: str, conflict_template: str = DEFAULT_CONFLICT_TEMPLATE) -> "NameAllocator":
+        """Create an allocator for a directory, which need not exist yet."""
+        try:
+            existing = FileSystem.current().listdir(directory)
+        except OSError:
+            existing = []
+        return NameAllocator(existing, conflict_template)
+
+    def claim(self, name: str, path: Optional[str] = None) -> str:
+        """
+        Reserve a name, or the first free variation of it.
+
+        Args:
+            name: Wanted name
+            path: File the name is for, used for {date} and {hash} tokens
+
+        Returns:
+            str: The name reserved
+        """
+        if name not in self.taken:
+            self.taken.add(name)
+            return name
+
+        template = self.conflict_template
+        tokens = self._tokens(template, path)
+        stem, ext = os.path.splitext(name)
+        if '{n' not in template:
+            # Templates without a counter get one only if they collide too
+            candidate = template.format(stem=stem, ext=ext, name=name, **tokens)
+            if candidate not in self.taken:
+                self.taken.add(candidate)
+                return candidate
+            stem, ext = os.path.splitext(candidate)
+            name, template, tokens = candidate, DEFAULT_CONFLICT_TEMPLATE, {}
+
+        # Remember where counting stopped, so many duplicates of one name stay linear
+        key = (template, stem, ext)
+        n = self._next.get(key, 1)
+        while True:
+            candidate = template.format(stem=stem, ext=ext, name=name, n=n, **tokens)
+            n += 1
+            if candidate not in self.taken:
+                break
+        self._next[key] = n
+        self.taken.add(candidate)
+        return candidate
+
+    @staticmethod
+    def _tokens(template: str, path: Optional[str]) -> Dict[str, object]:
+        """Compute only the file-dependent tokens a template uses."""
+        tokens: Dict[str, object] = {}
+        if '{date' in template:
+            tokens['date'] = datetime.fromtimestamp(os.stat(path).st_mtime) if path else datetime.now()
+        if '{hash' in template:
+            tokens['hash'] = BackupVerifier.hash_file(path) if path else ''
+        return tokens
+
+
+@dataclass
+class RenameOp:
+    """One planned rename."""
+
+    source: str
+    destination: str
+
+
+class RenameEngine:
+    """Plans and applies template-based bulk renames."""
+
+    @staticmethod
+    def plan(directory: str, template: str, match: Optional[str] = None, start: int = 1,
+             conflict_template: str = DEFAULT_CONFLICT_TEMPLATE) -> List[RenameOp]:
+        """
+        Work out the new name of every file in a directory, without touching anything.
+
+        Args:
+            directory: Directory whose files are renamed
+            template: New name, e.g. '{date:%Y%m%d}_{index:05d}{ext}'; tokens are
+                {name}, {stem}, {ext}, {index}, {date} (mtime), {hash} (content
+                hash, e.g. {hash:.8}) and {parent}
+            match: Only rename files whose names match this glob
+            start: First value of {index}
+            conflict_template: Name used when a new name is already taken
+
+        Returns:
+            List[RenameOp]: Renames to apply, in name order; files keeping their name are left out
+
+        Raises:
+            ValueError: If the template is invalid or produces an invalid name
+        """
+        with os.scandir(directory) as it:
+            entries = list(it)
+        selected = sorted(
+            (entry for entry in entries
+             if entry.is_file(follow_symlinks=False) and (match is None or fnmatch.fnmatch(entry.name, match))),
+            key=lambda entry: entry.name
+        )
+
+        # Names of files being renamed become free; everything else stays taken
+        moving = {entry.name for entry in selected}
+        allocator = NameAllocator((entry.name for entry in entries if entry.name not in moving), conflict_template)
+
+        hashes: Dict[str, str] = {}
+        if '{hash' in template:
+            workers = IOScheduler.shared().limit_for(directory)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onlyfiles-rename") as executor:
+                hashes = dict(zip((e.path for e in selected),
+                                  executor.map(BackupVerifier.hash_file, (e.path for e in selected))))
+
+        parent = os.path.basename(os.path.abspath(directory))
+        operations = []
+        for index, entry in enumerate(selected, start):
+            stem, ext = os.path.splitext(entry.name)
+            tokens = {'name': entry.name, 'stem': stem, 'ext': ext, 'index': index, 'parent': parent}
+            if '{date' in template:
+                tokens['date'] = datetime.fromtimestamp(entry.stat(follow_symlinks=False).st_mtime)
+            if entry.path in hashes:
+                tokens['hash'] = hashes[entry.path]
+            try:
+                new_name = template.format(**tokens)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Invalid rename template '{template}': {e}")
+            if not new_name or new_name in ('.', '..') or os.sep in new_name or (os.altsep and os.altsep in new_name):
+                raise ValueError(f"Template gives an invalid name for {entry.name}: '{new_name}'")
+
+            try:
+                destination = allocator.claim(new_name, entry.path)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Invalid conflict template '{conflict_template}': {e}")
+            if destination != entry.name:
+                operations.append(RenameOp(entry.path, os.path.join(directory, destination)))
+        return operations
+
+    @staticmethod
+    def apply(operations: List[RenameOp]) -> Tuple[List[RenameOp], Dict[str, str]]:
+        """
+        Apply planned renames as one batch.
+
+        Files whose current name is another file's new name are first moved
+        to temporary names, so swaps and chains (a->b, b->c) never overwrite
+        anything. All other renames run in one scheduler batch. If a file
+        cannot be moved to its temporary name, the renames onto it are
+        skipped and reported as errors rather than overwriting it.
+
+        Args:
+            operations: Renames from plan(), or any renames whose destinations are free
+
+        Returns:
+            Tuple[List[RenameOp], Dict[str, str]]: Applied renames, and error messages by source
+        """
+        destinations = {op.destination for op in operations}
+        scheduler = IOScheduler.shared()
+        errors: Dict[str, str] = {}
+
+        staged: Dict[str, str] = {}
+        staging = []
+        for number, op in enumerate(operations):
+            if op.source in destinations:
+                temporary = os.path.join(os.path.dirname(op.source), f".onlyfiles-rename-{os.getpid()}-{number}")
+                staged[op.source] = temporary
+                staging.append(IOTask(op.source, temporary, partial(os.rename, op.source, temporary)))
+        for result in scheduler.run(staging):
+            if not result.ok:
+                errors[result.task.source] = str(result.error)
+                del staged[result.task.source]
+
+        # A file that could not be moved out of the way keeps its name, so nothing may be renamed onto it,
+        # which in turn keeps the source of that rename where it is, and so on along the chain
+        blocked = set(errors)
+        changed = bool(blocked)
+        while changed:
+            changed = False
+            for op in operations:
+                if op.destination in blocked and op.source not in blocked:
+                    blocked.add(op.source)
+                    errors[op.source] = f"not renamed, as {op.destination} could not be moved out of the way"
+                    changed = True
+                    if op.source in staged:
+                        temporary = staged.pop(op.source)
+                        try:
+                            os.rename(temporary, op.source)
+                        except OSError:
+                            errors[op.source] += f" (file left at {temporary})"
+
+        tasks = []
+        pending = []
+        for op in operations:
+            if op.source in errors:
+                continue
+            current = staged.get(op.source, op.source)
+            tasks.append(IOTask(current, op.destination, partial(os.rename, current, op.destination)))
+            pending.append(op)
+
+        applied = []
+        for op, result in zip(pending, scheduler.run(tasks)):
+            if result.ok:
+                applied.append(op)
+                continue
+            errors[op.source] = str(result.error)
+            if op.source in staged:
+                # Put the file back under its original name, unless another file took it meanwhile
+                try:
+                    if os.path.lexists(op.source):
+                        raise FileExistsError(op.source)
+                    os.rename(staged[op.source], op.source)
+                except OSError:
+                    errors[op.source] += f" (file left at {staged[op.source]})"
+        return applied, errors
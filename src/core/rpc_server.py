@@ -0,0 +1,304 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from src.core.io_scheduler import OperationCancelled
+from src.core.operations import OPERATIONS, run_operation
+from src.utils.logging import Logger
+
+DEFAULT_WORKERS = 8
+# Minimum seconds between progress notifications for one request
+PROGRESS_INTERVAL = 0.2
+# Requests larger than this are rejected
+MAX_REQUEST_SIZE = 1024 * 1024
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+OPERATION_FAILED = -32000
+REQUEST_CANCELLED = -32800
+
+
+def default_socket_path() -> Path:
+    """Return the socket the server listens on unless told otherwise."""
+    return Path.home() / '.onlyfiles' / 'onlyfiles.sock'
+
+
+class RPCError(Exception):
+    """An error reported to the client as a JSON-RPC error object."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class _Connection(socketserver.StreamRequestHandler):
+    """
+    One client connection: newline-delimited JSON-RPC messages in both directions.
+
+    Requests on a connection run concurrently on the server's worker pool,
+    so responses may arrive in a different order than the requests; clients
+    match them by id.
+    """
+
+    def setup(self):
+        super().setup()
+        self._write_lock = threading.Lock()
+        self._cancels: Dict[Any, threading.Event] = {}
+        self._cancels_lock = threading.Lock()
+
+    def handle(self):
+        server: "RPCServer" = self.server.rpc  # type: ignore[attr-defined]
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_SIZE + 1)
+            if not line:
+                break
+            if len(line) > MAX_REQUEST_SIZE:
+                self.send({'jsonrpc': '2.0', 'id': None,
+                           'error': {'code': INVALID_REQUEST, 'message': 'Request too large'}})
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.send({'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': str(e)}})
+                continue
+            server.dispatch(self, request)
+        # The client went away; stop whatever it was still waiting for
+        with self._cancels_lock:
+            for cancel in self._cancels.values():
+                cancel.set()
+
+    def send(self, message: Dict[str, Any]):
+        """Write one message; safe to call from any worker thread."""
+        data = (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                # The client disconnected; its requests are being cancelled
+                pass
+
+    def register(self, request_id: Any) -> threading.Event:
+        cancel = threading.Event()
+        with self._cancels_lock:
+            if request_id in self._cancels:
+                raise RPCError(INVALID_REQUEST, f"Request id {request_id!r} is already in use")
+            self._cancels[request_id] = cancel
+        return cancel
+
+    def unregister(self, request_id: Any):
+        with self._cancels_lock:
+            self._cancels.pop(request_id, None)
+
+    def cancel(self, request_id: Any) -> bool:
+        with self._cancels_lock:
+            cancel = self._cancels.get(request_id)
+        if cancel is None:
+            return False
+        cancel.set()
+        return True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class RPCServer:
+    """
+    JSON-RPC 2.0 service over a Unix domain socket.
+
+    Messages are newline-delimited JSON. Every operation of
+    src.core.operations (organize, backup, revert, move, analyze, ...) is a
+    method taking the same parameters, plus:
+
+    - ``cancel`` {"id": <request id>}: stop a request sent on the same connection
+    - ``logs`` {"month": "YYYYMM", "tail": N}: read the operation log
+    - ``ping``: check the server is alive
+
+    A request with ``"progress": true`` in its params receives
+    ``progress`` notifications ({"id", "completed", "total", "path"}) while
+    it runs. Requests from all connections share one bounded worker pool,
+    and the process, with its I/O scheduler and listing cache, stays warm
+    between requests.
+
+    Example (with socat)::
+
+        echo '{"jsonrpc":"2.0","id":1,"method":"analyze","params":{"directory":"/data"}}' \\
+            | socat - UNIX-CONNECT:$HOME/.onlyfiles/onlyfiles.sock
+    """
+
+    def __init__(self, socket_path: Optional[Path] = None, workers: int = DEFAULT_WORKERS,
+                 on_request: Optional[Callable[[str, Dict[str, Any], Optional[str]], None]] = None):
+        """
+        Args:
+            socket_path: Socket to listen on, defaults to ~/.onlyfiles/onlyfiles.sock
+            workers: Requests run at the same time, across all connections
+            on_request: Called after each request with (method, params, error message or None)
+        """
+        self.socket_path = Path(socket_path or default_socket_path())
+        self.workers = max(1, workers)
+        self.on_request = on_request
+        self.logger = Logger()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._server: Optional[_UnixServer] = None
+        self._methods: Dict[str, Callable[[Dict[str, Any], Callable, threading.Event], Any]] = {
+            'ping': lambda params, progress, cancel: {'pong': True, 'time': time.time()},
+            'logs': self._logs,
+        }
+
+    def bind(self):
+        """
+        Create the socket; serve_forever() does this itself if it has not been done.
+
+        Raises:
+            OSError: If the socket cannot be created or another server is using it
+        """
+        self._prepare_socket()
+        self._server = _UnixServer(str(self.socket_path), _Connection)
+        self._server.rpc = self  # type: ignore[attr-defined]
+        os.chmod(self.socket_path, 0o600)
+
+    def serve_forever(self):
+        """
+        Listen on the socket until shutdown() is called.
+
+        Raises:
+            OSError: If the socket cannot be created or another server is using it
+        """
+        if self._server is None:
+            self.bind()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="onlyfiles-rpc")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._executor.shutdown(wait=True)
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+    def shutdown(self):
+        """Stop accepting requests; call from another thread or a signal handler."""
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def dispatch(self, connection: _Connection, request: Any):
+        """Validate a request and run it on the worker pool."""
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or not isinstance(request.get('method'), str):
+            connection.send({'jsonrpc': '2.0', 'id': request.get('id') if isinstance(request, dict) else None,
+                             'error': {'code': INVALID_REQUEST, 'message': 'Invalid JSON-RPC 2.0 request'}})
+            return
+        request_id = request.get('id')
+        if not isinstance(request_id, (str, int, type(None))) or isinstance(request_id, bool):
+            connection.send({'jsonrpc': '2.0', 'id': None,
+                             'error': {'code': INVALID_REQUEST, 'message': 'id must be a string or a number'}})
+            return
+        method = request['method']
+        params = request.get('params') or {}
+        if not isinstance(params, dict):
+            self._reply_error(connection, request_id, RPCError(INVALID_PARAMS, 'params must be an object'))
+            return
+
+        if method == 'cancel':
+            # Answered right away so it never waits behind the requests it cancels
+            if request_id is not None:
+                connection.send({'jsonrpc': '2.0', 'id': request_id,
+                                 'result': {'cancelled': connection.cancel(params.get('id'))}})
+            return
+
+        if method not in self._methods and method not in OPERATIONS:
+            self._reply_error(connection, request_id, RPCError(METHOD_NOT_FOUND, f"Unknown method '{method}'"))
+            return
+        try:
+            cancel = connection.register(request_id) if request_id is not None else threading.Event()
+        except RPCError as e:
+            self._reply_error(connection, request_id, e)
+            return
+        self._executor.submit(self._run, connection, request_id, method, params, cancel)
+
+    def _run(self, connection: _Connection, request_id: Any, method: str, params: Dict[str, Any],
+             cancel: threading.Event):
+        """Run one request and send its response."""
+        last_sent = [0.0]
+
+        def progress(completed: int, total: int, path: str):
+            now = time.monotonic()
+            if now - last_sent[0] >= PROGRESS_INTERVAL or completed == total:
+                last_sent[0] = now
+                connection.send({'jsonrpc': '2.0', 'method': 'progress',
+                                 'params': {'id': request_id, 'completed': completed, 'total': total, 'path': path}})
+
+        wants_progress = bool(params.pop('progress', False)) and request_id is not None
+        error: Optional[RPCError] = None
+        result = None
+        try:
+            if cancel.is_set():
+                raise OperationCancelled()
+            if method in self._methods:
+                result = self._methods[method](params, progress if wants_progress else None, cancel)
+            else:
+                result = run_operation(method, params, progress if wants_progress else None, cancel)
+            if cancel.is_set():
+                raise OperationCancelled()
+        except RPCError as e:
+            error = e
+        except OperationCancelled:
+            error = RPCError(REQUEST_CANCELLED, 'Request cancelled')
+        except (ValueError, KeyError, TypeError) as e:
+            error = RPCError(INVALID_PARAMS, str(e))
+        except Exception as e:
+            error = RPCError(OPERATION_FAILED, f"{type(e).__name__}: {e}")
+        finally:
+            if request_id is not None:
+                connection.unregister(request_id)
+
+        if request_id is not None:
+            if error is None:
+                connection.send({'jsonrpc': '2.0', 'id': request_id, 'result': result})
+            else:
+                self._reply_error(connection, request_id, error)
+        if self.on_request is not None:
+            self.on_request(method, params, str(error) if error else None)
+
+    def _logs(self, params: Dict[str, Any], progress: Callable, cancel: threading.Event) -> Dict[str, Any]:
+        """Return the current month's log, or another month's, optionally only its last lines."""
+        month = params.get('month')
+        text = self.logger.get_logs_for_month(str(month)) if month else self.logger.get_logs()
+        if text is None:
+            raise RPCError(INVALID_PARAMS, f"No log for month {month}")
+        lines = text.splitlines()
+        tail = params.get('tail')
+        if tail is not None:
+            lines = lines[-int(tail):] if int(tail) > 0 else []
+        return {'lines': lines}
+
+    @staticmethod
+    def _reply_error(connection: _Connection, request_id: Any, error: RPCError):
+        if request_id is not None:
+            connection.send({'jsonrpc': '2.0', 'id': request_id,
+                             'error': {'code': error.code, 'message': str(error)}})
+
+    def _prepare_socket(self):
+        """Remove a stale socket file, refusing to take over one a live server is using."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            self.socket_path.unlink()
+            return
+        finally:
+            probe.close()
+        raise OSError(f"Another server is already listening on {self.socket_path}")
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from src.core.filesystem import FileSystem
+
+# Directories remembered at most
+DEFAULT_MAX_DIRECTORIES = 4096
+# Seconds a listing is trusted; bounds how stale the size of a file rewritten in place can be
+DEFAULT_TTL = 60.0
+
+
+@dataclass
+class ScannedFile:
+    """A regular file found in a directory listing."""
+
+    name: str
+    size: int
+    mtime: float
+
+
+@dataclass
+class _Listing:
+    key: Tuple[int, int, int]
+    scanned: float
+    files: List[ScannedFile]
+    subdirectories: List[str]
+
+
+class ScanCache:
+    """
+    In-memory cache of directory listings for long-running processes.
+
+    A listing is reused while the directory's inode and mtime are
+    unchanged (adding, removing or renaming an entry updates the mtime)
+    and it is younger than the TTL, so repeated requests on the same
+    directories skip both the listing and the per-file stats.
+    """
+
+    def __init__(self, max_directories: int = DEFAULT_MAX_DIRECTORIES, ttl: float = DEFAULT_TTL):
+        """
+        Args:
+            max_directories: Listings kept, least recently used ones are dropped first
+            ttl: Seconds after which a listing is read again even if the directory looks unchanged
+        """
+        self.max_directories = max_directories
+        self.ttl = ttl
+        self._listings: "OrderedDict[str, _Listing]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def list(self, directory: str) -> Tuple[List[ScannedFile], List[str]]:
+        """
+        List a directory's regular files and subdirectories, from the cache when it is still valid.
+
+        Args:
+            directory: Directory to list
+
+        Returns:
+            Tuple[List[ScannedFile], List[str]]: Files, and names of subdirectories
+
+        Raises:
+            OSError: If the directory cannot be read
+        """
+        fs = FileSystem.current()
+        directory = os.path.abspath(directory)
+        st = fs.stat(directory)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        now = time.monotonic()
+        with self._lock:
+            listing = self._listings.get(directory)
+            if listing is not None and listing.key == key and now - listing.scanned < self.ttl:
+                self._listings.move_to_end(directory)
+                return listing.files, listing.subdirectories
+
+        files, subdirectories = [], []
+        with fs.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        entry_stat = entry.stat(follow_symlinks=False)
+                        files.append(ScannedFile(entry.name, entry_stat.st_size, entry_stat.st_mtime))
+                except OSError:
+                    continue
+
+        with self._lock:
+            self._listings[directory] = _Listing(key, now, files, subdirectories)
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.max_directories:
+                self._listings.popitem(last=False)
+        return files, subdirectories
+
+    def invalidate(self, directory: Optional[str] = None):
+        """
+        Forget a directory's listing, or every listing.
+
+        Args:
+            directory: Directory to forget, None for all
+        """
+        with self._lock:
+            if directory is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.abspath(directory), None)
@@ -0,0 +1,196 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import shutil
+import threading
+import time
+from typing import Optional
+
+# ioprio_set syscall numbers per architecture (see linux/ioprio.h)
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'amd64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'arm64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+    's390x': 282,
+    'riscv64': 30,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that blocks callers to hold a steady rate.
+
+    Consumers may take more tokens than are available; the bucket goes into
+    debt and the caller sleeps until the debt is paid off. This lets callers
+    consume whole copy chunks at once instead of paying Python overhead per
+    byte, while the long-run rate still converges on ``rate``.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Maximum tokens that can accumulate, defaults to one second's worth
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float = 1):
+        """
+        Take tokens from the bucket, sleeping as long as needed to stay within the rate.
+
+        Args:
+            amount: Number of tokens to take
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Throttle:
+    """Bandwidth and file-rate limits shared by all workers of an operation."""
+
+    def __init__(self, max_bytes_per_sec: Optional[int] = None, max_files_per_sec: Optional[float] = None):
+        """
+        Args:
+            max_bytes_per_sec: Maximum bytes copied per second, None for unlimited
+            max_files_per_sec: Maximum files processed per second, None for unlimited
+        """
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.max_files_per_sec = max_files_per_sec
+        self._bytes = TokenBucket(max_bytes_per_sec) if max_bytes_per_sec else None
+        self._files = TokenBucket(max_files_per_sec) if max_files_per_sec else None
+
+    @property
+    def limits_bytes(self) -> bool:
+        """Whether copies need to go through the chunked, throttled path."""
+        return self._bytes is not None
+
+    @property
+    def chunk_size(self) -> int:
+        """Copy chunk size: about a tenth of a second of bandwidth, 64 KiB to 4 MiB."""
+        if self._bytes is None:
+            return 4 * 1024 * 1024
+        return int(min(4 * 1024 * 1024, max(64 * 1024, self._bytes.rate / 10)))
+
+    def file(self):
+        """Account for one file operation."""
+        if self._files is not None:
+            self._files.consume(1)
+
+    def data(self, nbytes: int):
+        """Account for ``nbytes`` bytes of data transfer."""
+        if self._bytes is not None and nbytes > 0:
+            self._bytes.consume(nbytes)
+
+
+def copy_file_throttled(source: str, destination: str, throttle: Throttle) -> str:
+    """
+    Copy a file's data and metadata like shutil.copy2, at the throttle's byte rate.
+
+    The data is moved with os.sendfile in chunks sized to the rate, so the
+    kernel does the copying and Python only runs once per chunk. Where
+    sendfile cannot copy between the two files, a readinto loop over one
+    reusable buffer is used instead.
+
+    Args:
+        source: File to copy
+        destination: Destination file path, or directory to copy into
+
+    Returns:
+        str: Path of the copy
+    """
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+
+    chunk = throttle.chunk_size
+    with open(source, 'rb') as fsrc, open(destination, 'wb') as fdst:
+        offset = 0
+        if hasattr(os, 'sendfile'):
+            try:
+                while True:
+                    sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, chunk)
+                    if not sent:
+                        break
+                    offset += sent
+                    throttle.data(sent)
+            except OSError:
+                # Some filesystems refuse sendfile; nothing was copied in that case
+                if offset:
+                    raise
+
+        if offset == 0:
+            buffer = bytearray(chunk)
+            view = memoryview(buffer)
+            while True:
+                read = fsrc.readinto(buffer)
+                if not read:
+                    break
+                fdst.write(view[:read])
+                throttle.data(read)
+    shutil.copystat(source, destination)
+    return destination
+
+
+def set_process_priority(nice: Optional[int] = None, ionice: Optional[str] = None) -> bool:
+    """
+    Lower the CPU and/or I/O scheduling priority of the current process.
+
+    Args:
+        nice: Niceness increment, as accepted by os.nice (e.g. 10)
+        ionice: I/O class and optional level such as "idle" or "best-effort:7"
+
+    Returns:
+        bool: True if every requested setting was applied
+
+    Raises:
+        ValueError: If the ionice specification is invalid
+    """
+    applied = True
+    if nice:
+        try:
+            os.nice(nice)
+        except (OSError, AttributeError):
+            applied = False
+
+    if ionice:
+        name, _, level = ionice.partition(':')
+        if name not in IOPRIO_CLASSES:
+            raise ValueError(f"Unknown I/O class '{name}', expected one of {', '.join(IOPRIO_CLASSES)}")
+        level_value = int(level) if level else (0 if name == 'idle' else 4)
+        if not 0 <= level_value <= 7:
+            raise ValueError("I/O priority level must be between 0 and 7")
+        applied = _ioprio_set(IOPRIO_CLASSES[name], level_value) and applied
+    return applied
+
+
+def _ioprio_set(io_class: int, level: int) -> bool:
+    """Call the Linux ioprio_set syscall for the current process."""
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+    if platform.system() != "Linux" or syscall_number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        priority = (io_class << IOPRIO_CLASS_SHIFT) | level
+        return libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, priority) == 0
+    except (OSError, AttributeError):
+        return False
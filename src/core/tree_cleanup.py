@@ -0,0 +1,159 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Optional
+
+from src.core.dir_lock import LockManager
+from src.core.filesystem import FileSystem
+from src.core.io_scheduler import IOScheduler, IOTask, OperationCancelled, ProgressCallback
+from src.utils.metrics import Metrics
+from src.utils.profiling import traced
+
+
+@dataclass
+class CleanupReport:
+    """Empty directories found below a root, and what happened to them."""
+
+    root: str
+    # Every empty directory, deepest first
+    empty: List[str] = field(default_factory=list)
+    # The outermost directory of each empty subtree, sorted
+    tops: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class TreeCleanup:
+    """Finds and removes empty directories left behind by organizing, reverting and moving."""
+
+    @staticmethod
+    def find_empty(root: str, include_hidden: bool = False,
+                   cancel: Optional[threading.Event] = None) -> CleanupReport:
+        """
+        Find the directories below root that contain nothing but empty directories.
+
+        The tree is listed once, top-down, and emptiness is then decided
+        bottom-up from what was listed, so every directory costs a single
+        scandir. The root itself is never reported. Symlinks count as
+        content and are never followed, and directories that cannot be
+        listed count as not empty.
+
+        Args:
+            root: Directory to search
+            include_hidden: Also look into and report directories whose names start with '.',
+                which tools such as git rely on even when they are empty
+            cancel: Event that stops the search when set; what was found so far is not reported
+
+        Returns:
+            CleanupReport: The empty directories, with nothing removed yet
+        """
+        fs = FileSystem.current()
+        root = os.path.abspath(root)
+        report = CleanupReport(root)
+        # Directories in the order they were listed: every parent before its children
+        order: List[str] = []
+        children: Dict[str, List[str]] = {}
+        has_content: Dict[str, bool] = {}
+        pending = [root]
+        while pending:
+            if cancel is not None and cancel.is_set():
+                return report
+            directory = pending.pop()
+            order.append(directory)
+            subdirectories = []
+            content = False
+            try:
+                with fs.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            is_dir = False
+                        if is_dir and (include_hidden or not entry.name.startswith('.')):
+                            subdirectories.append(entry.path)
+                        else:
+                            content = True
+            except OSError:
+                content = True
+            has_content[directory] = content
+            children[directory] = subdirectories
+            pending.extend(subdirectories)
+        Metrics.shared().inc('syscalls_total', len(order), call='scandir')
+
+        empty = set()
+        for directory in reversed(order):
+            if not has_content[directory] and all(child in empty for child in children[directory]):
+                empty.add(directory)
+        empty.discard(root)
+        report.empty = [directory for directory in reversed(order) if directory in empty]
+        report.tops = sorted(directory for directory in empty if os.path.dirname(directory) not in empty)
+        return report
+
+    @staticmethod
+    @traced('cleanup')
+    def remove_empty(root: str, dry_run: bool = False, include_hidden: bool = False,
+                     progress: Optional[ProgressCallback] = None,
+                     cancel: Optional[threading.Event] = None) -> CleanupReport:
+        """
+        Remove the empty directories below root, many at a time.
+
+        Directories are removed one depth at a time, deepest first, each
+        depth in parallel on the shared I/O scheduler, so a directory is
+        only removed once everything below it is gone. A directory that
+        gained content since the search is left in place, along with its
+        parents, and reported as an error.
+
+        Args:
+            root: Directory to clean up; it is kept even if it ends up empty
+            dry_run: Only find the empty directories
+            include_hidden: Also remove directories whose names start with '.'
+            progress: Called with (completed, total, path) as directories are removed
+            cancel: Event that stops the remaining removals when set
+
+        Returns:
+            CleanupReport: The empty directories found, and those removed
+
+        Raises:
+            LockTimeout: If another run keeps the directory locked for longer than the lock timeout
+        """
+        metrics = Metrics.shared()
+        with LockManager.shared().acquire(root, exclusive=not dry_run, purpose='cleanup'):
+            with metrics.phase('cleanup.scan'):
+                report = TreeCleanup.find_empty(root, include_hidden, cancel)
+            if dry_run or not report.empty:
+                return report
+
+            fs = FileSystem.current()
+            by_depth: Dict[int, List[str]] = {}
+            for directory in report.empty:
+                by_depth.setdefault(directory.count(os.sep), []).append(directory)
+            total = len(report.empty)
+            # Parents of directories that could not be removed, which cannot be removed either
+            blocked = set()
+
+            with metrics.phase('cleanup.remove'):
+                for depth in sorted(by_depth, reverse=True):
+                    if cancel is not None and cancel.is_set():
+                        break
+                    tasks = []
+                    for directory in by_depth[depth]:
+                        if directory in blocked:
+                            blocked.add(os.path.dirname(directory))
+                            report.errors[directory] = 'Directory not empty'
+                            continue
+                        tasks.append(IOTask(directory, directory, partial(fs.rmdir, directory)))
+                    offset = len(report.removed) + len(report.errors)
+                    level_progress = None
+                    if progress is not None:
+                        level_progress = lambda completed, _total, path: progress(offset + completed, total, path)
+                    for result in IOScheduler.shared().run(tasks, level_progress, cancel):
+                        if result.ok:
+                            report.removed.append(result.task.source)
+                        elif not isinstance(result.error, OperationCancelled):
+                            blocked.add(os.path.dirname(result.task.source))
+                            report.errors[result.task.source] = str(result.error)
+                            metrics.count_error('cleanup', result.error)
+            metrics.inc('directories_removed_total', len(report.removed))
+            metrics.inc('syscalls_total', len(report.removed), call='rmdir')
+            return report
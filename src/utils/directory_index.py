@@ -0,0 +1,359 @@
+import os
+import re
+import heapq
+import hashlib
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Pseudo filesystems that are never useful jump targets when indexing from "/"
+DEFAULT_EXCLUDES = ("/proc", "/sys", "/dev", "/run")
+
+INDEX_HEADER = "ONLYFILES-DIRINDEX 1"
+
+
+class DirectoryIndex:
+    """
+    Compact, persistent index of every directory below a root path.
+
+    Paths are kept as one sorted, newline separated string plus an array of
+    line offsets, so millions of directories cost only a few bytes of overhead
+    each and a search is a single string or regular expression scan in C. Each
+    directory's mtime is stored alongside it, which lets ``refresh`` rescan
+    only the directories whose contents changed since the last build.
+    """
+
+    def __init__(self, root: str = "/", index_dir: Optional[Path] = None,
+                 excludes: Iterable[str] = DEFAULT_EXCLUDES):
+        self.root = os.path.abspath(root)
+        self.index_dir = index_dir or Path.home() / '.onlyfiles' / 'index'
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        root_hash = hashlib.sha1(self.root.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+        self.index_file = self.index_dir / f"dirs_{root_hash}.idx"
+        self.excludes = {os.path.abspath(e) for e in excludes}
+        self.built_at = 0.0
+        self._blob = ""
+        self._folded: Optional[str] = ""
+        self._offsets = array('q', [0])
+        self._mtimes = array('q')
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._mtimes)
+
+    def load(self) -> bool:
+        """
+        Load the index from disk.
+
+        Returns:
+            bool: True if a valid index file was loaded, False otherwise
+        """
+        try:
+            with open(self.index_file, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                header = f.readline().rstrip('\n').split('\t')
+                if len(header) != 3 or header[0] != INDEX_HEADER or header[1] != self.root:
+                    return False
+                entries = {}
+                for line in f:
+                    mtime, _, path = line.rstrip('\n').partition('\t')
+                    if path:
+                        entries[path] = int(mtime)
+                built_at = float(header[2])
+        except (OSError, ValueError):
+            return False
+
+        self._set_entries(entries)
+        self.built_at = built_at
+        return True
+
+    def save(self) -> bool:
+        """
+        Write the index to disk atomically.
+
+        Returns:
+            bool: True if the index was saved successfully, False otherwise
+        """
+        tmp_file = self.index_file.with_suffix('.tmp')
+        try:
+            with open(tmp_file, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                f.write(f"{INDEX_HEADER}\t{self.root}\t{self.built_at}\n")
+                for i in range(len(self)):
+                    f.write(f"{self._mtimes[i]}\t{self._path_at(i)}\n")
+            os.replace(tmp_file, self.index_file)
+            return True
+        except OSError:
+            return False
+
+    def build(self) -> int:
+        """
+        Walk the whole tree below the root and rebuild the index from scratch.
+
+        Returns:
+            int: Number of indexed directories
+        """
+        entries: Dict[str, int] = {}
+        self._walk(self.root, entries)
+        self._set_entries(entries)
+        self.built_at = time.time()
+        self.save()
+        return len(self)
+
+    def load_or_build(self) -> int:
+        """
+        Load the persisted index, building it first if none exists yet.
+
+        Returns:
+            int: Number of indexed directories
+        """
+        if not self.load():
+            return self.build()
+        return len(self)
+
+    def refresh(self, subtree: Optional[str] = None) -> int:
+        """
+        Bring the index up to date by rescanning only changed directories.
+
+        A directory's mtime changes whenever an entry is added to, removed
+        from or renamed inside it, so comparing the stored mtimes against a
+        fresh ``stat`` is enough to find every place the tree changed.
+
+        Args:
+            subtree: Optional path to limit the refresh to
+
+        Returns:
+            int: Number of directories whose listing changed
+        """
+        if subtree is None:
+            positions: Iterable[int] = range(len(self))
+        else:
+            subtree = os.path.abspath(subtree)
+            start, end = self._subtree_range(subtree)
+            positions = list(range(start, end))
+            own = self._bisect(subtree)
+            if own < len(self) and self._path_at(own) == subtree:
+                positions.insert(0, own)
+
+        entries = None
+        changed = 0
+        for i in positions:
+            path = self._path_at(i)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtimes[i]:
+                continue
+
+            if entries is None:
+                entries = self._entries()
+            changed += 1
+            if mtime is None:
+                entries.pop(path, None)
+                self._drop_subtree(path, entries)
+                continue
+
+            # Rescan the direct children; new ones are walked in full and
+            # vanished ones are dropped together with their descendants
+            entries[path] = mtime
+            indexed = set(self._children(path))
+            current = set(self._list_subdirs(path))
+            for gone in indexed - current:
+                entries.pop(gone, None)
+                self._drop_subtree(gone, entries)
+            for new in current - indexed:
+                self._walk(new, entries)
+
+        if entries is not None:
+            self._set_entries(entries)
+            self.built_at = time.time()
+            self.save()
+        return changed
+
+    def search(self, query: str, limit: int = 20) -> List[str]:
+        """
+        Find directories matching a query, best matches first.
+
+        Substring matches are preferred, ranked by whether the query hits the
+        directory's own name and by path length. If there are not enough of
+        them, fuzzy matches (query characters in order, with gaps) fill the
+        remaining slots.
+
+        Args:
+            query: Text to look for, case-insensitively
+            limit: Maximum number of results
+
+        Returns:
+            List[str]: Matching directory paths
+        """
+        query = query.strip()
+        if not query or not len(self):
+            return []
+
+        with self._lock:
+            blob, folded = self._blob, self._folded
+        lowered = query.lower()
+        if folded is not None:
+            # Case-folded copy with identical offsets: plain str.find and
+            # case-sensitive regexes on it are several times faster than re.I
+            haystack, query, flags = folded, lowered, 0
+        else:
+            haystack, flags = blob, re.IGNORECASE
+
+        def substring_matches():
+            for path in self._lines_containing(query, haystack, blob, flags):
+                name = os.path.basename(path).lower()
+                if name == lowered:
+                    rank = 0
+                elif name.startswith(lowered):
+                    rank = 1
+                elif lowered in name:
+                    rank = 2
+                else:
+                    rank = 3
+                yield (rank, 0, len(path), path)
+
+        def fuzzy_matches(seen):
+            # Each gap excludes the next query character, so the pattern
+            # matches the earliest subsequence without any backtracking
+            parts = [re.escape(query[0])]
+            for char in query[1:]:
+                escaped = re.escape(char)
+                parts.append(f"[^\\n{escaped}]*{escaped}")
+            pattern = re.compile("".join(parts), flags)
+            for path in self._matching_lines(pattern, haystack, blob):
+                if path in seen:
+                    continue
+                match = pattern.search(path.lower() if flags == 0 else path)
+                name_start = len(path) - len(os.path.basename(path))
+                rank = 4 if match.start() >= name_start else 5
+                yield (rank, match.end() - match.start(), len(path), path)
+
+        results = heapq.nsmallest(limit, substring_matches())
+        if len(results) < limit:
+            # Fewer substring hits than the limit means we already hold all of them
+            seen = {key[-1] for key in results}
+            results += heapq.nsmallest(limit - len(results), fuzzy_matches(seen))
+        return [key[-1] for key in results]
+
+    @staticmethod
+    def _lines_containing(text: str, haystack: str, blob: str, flags: int):
+        """Yield every line of the blob whose haystack line contains ``text``."""
+        if flags:
+            yield from DirectoryIndex._matching_lines(re.compile(re.escape(text), flags), haystack, blob)
+            return
+        pos = 0
+        find = haystack.find
+        while True:
+            found = find(text, pos)
+            if found < 0:
+                return
+            start = haystack.rfind('\n', 0, found) + 1
+            end = haystack.find('\n', found)
+            yield blob[start:end]
+            pos = end + 1
+
+    @staticmethod
+    def _matching_lines(pattern, haystack: str, blob: str):
+        """Yield every line of the blob whose haystack line matches the pattern."""
+        pos = 0
+        search = pattern.search
+        while True:
+            match = search(haystack, pos)
+            if match is None:
+                return
+            start = haystack.rfind('\n', 0, match.start()) + 1
+            end = haystack.find('\n', match.start())
+            yield blob[start:end]
+            pos = end + 1
+
+    def _walk(self, top: str, entries: Dict[str, int]):
+        """Add ``top`` and every directory below it to ``entries``."""
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            try:
+                entries[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            stack.extend(self._list_subdirs(path))
+
+    def _list_subdirs(self, path: str) -> List[str]:
+        """List the indexable subdirectories directly below ``path``."""
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_dir(follow_symlinks=False):
+                            continue
+                    except OSError:
+                        continue
+                    if '\n' in entry.path or entry.path in self.excludes:
+                        continue
+                    subdirs.append(entry.path)
+        except OSError:
+            pass
+        return subdirs
+
+    def _drop_subtree(self, path: str, entries: Dict[str, int]):
+        """Remove every descendant of ``path`` known to the index from ``entries``."""
+        start, end = self._subtree_range(path)
+        for i in range(start, end):
+            entries.pop(self._path_at(i), None)
+
+    def _children(self, path: str) -> List[str]:
+        """Return the indexed direct subdirectories of ``path``."""
+        start, end = self._subtree_range(path)
+        children = []
+        for i in range(start, end):
+            child = self._path_at(i)
+            if os.path.dirname(child) == path:
+                children.append(child)
+        return children
+
+    def _entries(self) -> Dict[str, int]:
+        """Expand the compact representation back into a path -> mtime dict."""
+        return {self._path_at(i): self._mtimes[i] for i in range(len(self))}
+
+    def _set_entries(self, entries: Dict[str, int]):
+        """Replace the index contents with the given path -> mtime dict."""
+        paths = sorted(entries)
+        offsets = array('q', [0])
+        position = 0
+        for path in paths:
+            position += len(path) + 1
+            offsets.append(position)
+        blob = "\n".join(paths) + "\n" if paths else ""
+        mtimes = array('q', (entries[p] for p in paths))
+        folded: Optional[str] = blob.lower()
+        if len(folded) != len(blob):
+            # A few non-ASCII characters change length when lowered
+            folded = None
+        with self._lock:
+            self._blob = blob
+            self._folded = folded
+            self._offsets = offsets
+            self._mtimes = mtimes
+
+    def _path_at(self, i: int) -> str:
+        """Return the i-th indexed path."""
+        return self._blob[self._offsets[i]:self._offsets[i + 1] - 1]
+
+    def _bisect(self, target: str) -> int:
+        """Return the position of the first indexed path not less than ``target``."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._path_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _subtree_range(self, path: str) -> Tuple[int, int]:
+        """Return the [start, end) index range of the descendants of ``path``."""
+        prefix = path.rstrip(os.sep) + os.sep
+        # All strings sharing a prefix are contiguous in sorted order
+        return self._bisect(prefix), self._bisect(prefix[:-1] + chr(ord(os.sep) + 1))
@@ -1,17 +1,24 @@
 import os
+import threading
+import time
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from rich.table import Table
 from rich.console import Console
+from src.utils.directory_index import DirectoryIndex
+from src.core.drive_operations import DriveOperations
 
 console = Console()
 
+# Indexes older than this are refreshed in the background when used
+INDEX_REFRESH_INTERVAL = 3600
+
 class FileNavigator:
     def __init__(self):
-        pass
+        self._indexes: Dict[str, DirectoryIndex] = {}
 
     def get_available_drives(self) -> List[str]:
-        """Returns list of available drives on Windows or root on Linux."""
+        """Returns list of available drives on Windows or mount points on Linux."""
         if os.name == 'nt':  # Windows
             drives = []
             for letter in range(65, 91):  # A-Z
@@ -19,7 +26,7 @@ class FileNavigator:
                 if os.path.exists(drive):
                     drives.append(drive)
             return drives
-        return ["/"]  # Linux/Unix
+        return DriveOperations.get_available_drives()  # Linux/Unix
 
     def list_directory(self, path: str) -> List[Tuple[str, str, str]]:
         """Lists directories in a specific path."""
@@ -81,6 +88,7 @@ class FileNavigator:
         
         console.print("\nOptions:")
         console.print("- Enter folder number to navigate")
+        console.print("- Enter 'J <text>' to jump to a directory by name")
         console.print("- Enter 'S' to select current directory")
         console.print("- Enter 'B' to go back")
         console.print("- Enter 'C' to cancel")
@@ -94,6 +102,7 @@ class FileNavigator:
         """
         # First, select the drive
         current_path = self.display_drives()
+        drive = current_path
         
         while True:
             # Get the list of directories first
@@ -103,9 +112,15 @@ class FileNavigator:
             self.display_directory(current_path)
             
             # Get user choice
-            choice = input("\nChoose an option: ").strip().upper()
+            raw_choice = input("\nChoose an option: ").strip()
+            choice = raw_choice.upper()
             
-            if choice == 'C':
+            if choice == 'J' or choice.startswith('J '):
+                jump_path = self.jump_to_directory(drive, raw_choice[1:].strip())
+                if jump_path:
+                    current_path = jump_path
+                continue
+            elif choice == 'C':
                 console.print("[yellow]Operation cancelled by user.[/yellow]")
                 return None
             elif choice == 'S':
@@ -134,4 +149,56 @@ class FileNavigator:
                 else:
                     console.print("[red]Invalid option![/red]")
             except (ValueError, IndexError) as e:
-                console.print(f"[red]Invalid option! Error: {str(e)}[/red]") 
\ No newline at end of file
+                console.print(f"[red]Invalid option! Error: {str(e)}[/red]") 
+
+    def get_directory_index(self, root: str) -> DirectoryIndex:
+        """
+        Returns the directory index for a drive, loading or building it on first use.
+
+        Stale indexes are refreshed on a background thread so that searching
+        can start immediately with the previously indexed tree.
+        """
+        index = self._indexes.get(root)
+        if index is None:
+            index = DirectoryIndex(root)
+            if not index.load():
+                with console.status(f"Indexing directories under {root} (first use)..."):
+                    index.build()
+            elif time.time() - index.built_at > INDEX_REFRESH_INTERVAL:
+                threading.Thread(target=index.refresh, daemon=True).start()
+            self._indexes[root] = index
+        return index
+
+    def jump_to_directory(self, root: str, query: str = "") -> Optional[str]:
+        """
+        Searches the directory index and returns the directory the user picks.
+
+        Args:
+            root: Drive whose index should be searched
+            query: Text to search for; prompted for when empty
+
+        Returns:
+            Optional[str]: Selected directory path, or None if nothing was chosen
+        """
+        if not query:
+            query = input("Jump to (part of a directory name): ").strip()
+            if not query:
+                return None
+
+        matches = self.get_directory_index(root).search(query)
+        matches = [path for path in matches if os.path.isdir(path)]
+        if not matches:
+            console.print(f"[yellow]No directories match '{query}'[/yellow]")
+            return None
+
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Index", style="cyan")
+        table.add_column("Directory", style="green")
+        for i, path in enumerate(matches, 1):
+            table.add_row(str(i), path)
+        console.print(table)
+
+        choice = input(f"Choose a directory [1-{len(matches)}] or press Enter to cancel: ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(matches):
+            return matches[int(choice) - 1]
+        return None
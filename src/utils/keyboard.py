@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+from typing import Optional
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import select
+    import termios
+    import tty
+
+ESCAPE = '\x1b'
+
+
+class KeyReader:
+    """
+    Reads single key presses without waiting for Enter, while other output keeps going.
+
+    Use it as a context manager: on POSIX terminals it switches stdin to
+    cbreak mode (Ctrl-C still interrupts) and restores it on exit. When
+    stdin is not a terminal nothing is ever read, so piped input is left
+    alone.
+    """
+
+    def __init__(self):
+        self._saved = None
+        self.interactive = sys.stdin.isatty()
+
+    def __enter__(self) -> "KeyReader":
+        if self.interactive and os.name != 'nt':
+            fd = sys.stdin.fileno()
+            self._saved = termios.tcgetattr(fd)
+            tty.setcbreak(fd)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._saved is not None:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self._saved)
+            self._saved = None
+
+    def poll(self, timeout: float = 0.0) -> Optional[str]:
+        """
+        Wait up to timeout seconds for a key press.
+
+        Escape sequences sent by arrow and function keys are swallowed, so
+        ESCAPE is only returned for the Esc key itself.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            Optional[str]: The key, or None if none was pressed
+        """
+        if not self.interactive:
+            return None
+        if os.name == 'nt':
+            return self._poll_windows(timeout)
+        if not self._ready(timeout):
+            return None
+        key = os.read(sys.stdin.fileno(), 1).decode('utf-8', errors='replace')
+        if key == ESCAPE and self._ready(0.02):
+            # Rest of an escape sequence, not the Esc key
+            os.read(sys.stdin.fileno(), 32)
+            return None
+        return key
+
+    @staticmethod
+    def _ready(timeout: float) -> bool:
+        readable, _, _ = select.select([sys.stdin], [], [], timeout)
+        return bool(readable)
+
+    @staticmethod
+    def _poll_windows(timeout: float) -> Optional[str]:
+        deadline = time.monotonic() + timeout
+        while True:
+            if msvcrt.kbhit():
+                key = msvcrt.getwch()
+                if key in ('\x00', '\xe0'):
+                    # Arrow and function keys arrive as two characters
+                    msvcrt.getwch()
+                    return None
+                return key
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.02)
@@ -1,7 +1,11 @@
 import os
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import List, Optional
+from typing import IO, Iterator, List, Optional
+
+from src.utils.profiling import traced
 
 class Logger:
     """Handles logging operations in a clean and organized way."""
@@ -10,6 +14,8 @@ class Logger:
         self.log_dir = Path.home() / '.onlyfiles' / 'logs'
         self.log_dir.mkdir(parents=True, exist_ok=True)
         self.log_file = self.log_dir / f"onlyfiles_{datetime.now().strftime('%Y%m')}.log"
+        self._lock = threading.Lock()
+        self._open_file: Optional[IO[str]] = None
     
     def get_log_file(self) -> Path:
         """Returns the path of the current log file."""
@@ -27,12 +33,34 @@ class Logger:
         """Logs a warning message."""
         self._write_log('WARNING', message)
     
+    @contextmanager
+    def batch(self) -> Iterator["Logger"]:
+        """
+        Keep the log file open while the block runs, instead of reopening it for every message.
+        
+        Messages from all threads go through the one open file and are
+        flushed when the block ends.
+        """
+        with self._lock:
+            self._open_file = open(self.log_file, 'a', encoding='utf-8')
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._open_file.close()
+                self._open_file = None
+    
+    @traced('log.write')
     def _write_log(self, level: str, message: str):
         """Writes a message to the log file."""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_entry = f"[{timestamp}] {level}: {message}\n"
         
         try:
+            with self._lock:
+                if self._open_file is not None:
+                    self._open_file.write(log_entry)
+                    return
             with open(self.log_file, 'a', encoding='utf-8') as f:
                 f.write(log_entry)
         except Exception as e:
@@ -0,0 +1,285 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.utils.profiling import Profiler
+
+# Upper bounds, in seconds, of the duration histogram buckets
+DURATION_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+
+# Prefix of every metric name in the Prometheus output
+METRIC_PREFIX = 'onlyfiles_'
+
+# Type and help text of each metric, in output order
+METRICS = {
+    'files_scanned_total': ('counter', 'Files found while scanning directories.'),
+    'files_moved_total': ('counter', 'Files moved into place.'),
+    'bytes_copied_total': ('counter', 'Bytes of file data copied or stored.'),
+    'directories_removed_total': ('counter', 'Empty directories removed by cleanup.'),
+    'syscalls_total': ('counter', 'File system calls made, by call.'),
+    'errors_total': ('counter', 'Failed file operations, by operation and exception type.'),
+    'phase_duration_seconds': ('histogram', 'Time spent in each phase of an operation.'),
+    'io_task_duration_seconds': ('histogram', 'Time taken by single file operations on the I/O scheduler.'),
+    'run_duration_seconds': ('gauge', 'Duration of the last run.'),
+    'run_timestamp_seconds': ('gauge', 'Unix time at which the last run finished.'),
+}
+
+STATS_FORMATS = ('json', 'prometheus')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Shard:
+    """Counters and histograms written by a single thread."""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+
+class Metrics:
+    """
+    Process-wide counters, histograms and gauges.
+
+    Each thread records into its own shard, so the hot paths (a counter
+    increment per file, a histogram observation per scheduled task) take
+    no lock; shards are only merged when a snapshot is taken. Histograms
+    use the fixed DURATION_BUCKETS.
+    """
+
+    _shared: Optional["Metrics"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "Metrics":
+        """Return the registry the core engines record into."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        """
+        Add to a counter.
+
+        Args:
+            name: Metric name, e.g. 'files_moved_total'
+            amount: Amount to add
+            **labels: Label values distinguishing series of the metric
+        """
+        counters = self._shard().counters
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        """
+        Record a value, in seconds, in a histogram.
+
+        Args:
+            name: Metric name, e.g. 'phase_duration_seconds'
+            value: Observed value
+            **labels: Label values distinguishing series of the metric
+        """
+        histograms = self._shard().histograms
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        histogram = histograms.get(key)
+        if histogram is None:
+            # One count per bucket, one for +Inf, then the sum
+            histogram = histograms[key] = [0] * (len(DURATION_BUCKETS) + 2)
+        histogram[bisect_left(DURATION_BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        """
+        Set a gauge to a value.
+
+        Args:
+            name: Metric name
+            value: New value
+            **labels: Label values distinguishing series of the metric
+        """
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a block of code as a phase, e.g. ``with metrics.phase('organize.scan'):``.
+
+        The phase is also recorded as a span while the Profiler is running.
+
+        Args:
+            name: Phase name
+        """
+        start = time.perf_counter()
+        try:
+            with Profiler.shared().span(name):
+                yield
+        finally:
+            self.observe('phase_duration_seconds', time.perf_counter() - start, phase=name)
+
+    def count_error(self, operation: str, error: BaseException):
+        """
+        Count a failed file operation by the type of its exception.
+
+        Args:
+            operation: Operation that failed, e.g. 'organize'
+            error: The exception raised
+        """
+        self.inc('errors_total', operation=operation, type=type(error).__name__)
+
+    def snapshot(self) -> Dict[str, Dict[Labels, object]]:
+        """
+        Merge every thread's shard into one view.
+
+        Returns:
+            Dict[str, Dict[Labels, object]]: For each metric, its value per label set;
+                histograms are lists of bucket counts followed by the sum
+        """
+        merged: Dict[str, Dict[Labels, object]] = {}
+        with self._lock:
+            shards = list(self._shards)
+            gauges = dict(self._gauges)
+        for shard in shards:
+            # Copying a dict is atomic, so owners can keep writing meanwhile
+            for (name, labels), value in shard.counters.copy().items():
+                series = merged.setdefault(name, {})
+                series[labels] = series.get(labels, 0) + value
+            for (name, labels), histogram in shard.histograms.copy().items():
+                series = merged.setdefault(name, {})
+                total = series.get(labels)
+                series[labels] = list(histogram) if total is None else [a + b for a, b in zip(total, histogram)]
+        for (name, labels), value in gauges.items():
+            merged.setdefault(name, {})[labels] = value
+        return merged
+
+    def to_json(self) -> str:
+        """
+        Render all metrics as JSON.
+
+        Returns:
+            str: JSON document with counters, histograms and gauges
+        """
+        document = {'started': self.started, 'counters': {}, 'histograms': {}, 'gauges': {}}
+        for name, series in self._ordered(self.snapshot()):
+            kind = METRICS.get(name, ('counter', ''))[0]
+            values = []
+            for labels, value in sorted(series.items()):
+                if kind == 'histogram':
+                    buckets = {str(bound): count for bound, count in zip(DURATION_BUCKETS, value)}
+                    buckets['+Inf'] = value[len(DURATION_BUCKETS)]
+                    values.append({'labels': dict(labels), 'count': sum(value[:-1]), 'sum': value[-1],
+                                   'buckets': buckets})
+                else:
+                    values.append({'labels': dict(labels), 'value': value})
+            document[kind + 's'][name] = values
+        return json.dumps(document, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: Text suitable for the node exporter's textfile collector
+        """
+        lines = []
+        for name, series in self._ordered(self.snapshot()):
+            kind, help_text = METRICS.get(name, ('counter', ''))
+            full_name = METRIC_PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in sorted(series.items()):
+                if kind != 'histogram':
+                    lines.append(f"{full_name}{self._format_labels(labels)} {self._format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + (float('inf'),), value):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{full_name}_bucket{self._format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{self._format_labels(labels)} {self._format_value(value[-1])}")
+                lines.append(f"{full_name}_count{self._format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, stats_format: str, destination: Optional[str] = None):
+        """
+        Record the run's duration and write all metrics out.
+
+        Files are replaced atomically, so a collector never reads half a file.
+
+        Args:
+            stats_format: 'json' or 'prometheus'
+            destination: File to write, or None or '-' for standard error
+        """
+        now = time.time()
+        self.set_gauge('run_duration_seconds', now - self.started)
+        self.set_gauge('run_timestamp_seconds', now)
+        text = self.to_json() + '\n' if stats_format == 'json' else self.to_prometheus()
+
+        if destination in (None, '-'):
+            sys.stderr.write(text)
+            return
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".onlyfiles-stats-")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def reset(self):
+        """Forget everything recorded so far and restart the run clock."""
+        with self._lock:
+            for shard in self._shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+            self._gauges.clear()
+            self.started = time.time()
+
+    def _shard(self) -> _Shard:
+        """Return the calling thread's shard, registering it on first use."""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    @staticmethod
+    def _ordered(snapshot: Dict[str, Dict[Labels, object]]) -> List[Tuple[str, Dict[Labels, object]]]:
+        """Order metrics as declared in METRICS, unknown ones last."""
+        order = {name: position for position, name in enumerate(METRICS)}
+        return sorted(snapshot.items(), key=lambda item: (order.get(item[0], len(order)), item[0]))
+
+    @staticmethod
+    def _format_labels(labels: Labels) -> str:
+        """Render a label set as {name="value",...}."""
+        if not labels:
+            return ''
+        escaped = (
+            f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for name, value in labels
+        )
+        return '{' + ','.join(escaped) + '}'
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        """Render a sample value, without a trailing .0 for whole numbers."""
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
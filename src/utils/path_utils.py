@@ -1,7 +1,10 @@
+import math
 import os
 from pathlib import Path
 from typing import Tuple, Optional, Union, List
 
+from src.core.filesystem import FileSystem
+
 class PathUtils:
     """Handles path-related operations in a clean and organized way."""
     
@@ -27,15 +30,15 @@ class PathUtils:
         source = PathUtils.expand_user_path(source)
         destination = PathUtils.expand_user_path(destination)
             
-        if not os.path.exists(source):
+        if not FileSystem.current().exists(source):
             print(f"Error: Source path '{source}' does not exist.")
             return None, None
             
-        if not os.path.exists(destination):
+        if not FileSystem.current().exists(destination):
             create_dir = input(f"Destination '{destination}' does not exist. Create it? (y/n): ").lower()
             if create_dir == 'y':
                 try:
-                    os.makedirs(destination, exist_ok=True)
+                    FileSystem.current().makedirs(destination, exist_ok=True)
                     print(f"Created directory: {destination}")
                 except Exception as e:
                     print(f"Error creating directory: {str(e)}")
@@ -58,6 +61,52 @@ class PathUtils:
         """
         return command.lower() in ['cancel', '-c']
     
+    @staticmethod
+    def format_size(size_bytes: float) -> str:
+        """
+        Format a byte count as a human-readable size.
+        
+        Args:
+            size_bytes: Size in bytes
+            
+        Returns:
+            str: Formatted size (e.g., '1.5 GB')
+        """
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if abs(size_bytes) < 1024 or unit == 'TB':
+                break
+            size_bytes /= 1024
+        return f"{size_bytes:.0f} {unit}" if unit == 'B' else f"{size_bytes:.1f} {unit}"
+    
+    @staticmethod
+    def parse_size(text: str) -> int:
+        """
+        Parse a human-readable size such as '512K', '10M' or '1.5G' into bytes.
+        
+        Args:
+            text: Size with an optional K/M/G/T suffix (powers of 1024)
+            
+        Returns:
+            int: Size in bytes
+            
+        Raises:
+            ValueError: If the text is not a valid size
+        """
+        units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+        value = text.strip().upper()
+        if value.endswith('IB'):
+            value = value[:-2]
+        elif value.endswith('B'):
+            value = value[:-1]
+        suffix = value[-1:] if value[-1:] in units else ''
+        number = value[:-1] if suffix else value
+        size = float(number) * units[suffix]
+        if not math.isfinite(size):
+            raise ValueError(f"Size must be a finite number: {text}")
+        if size < 0:
+            raise ValueError(f"Size must not be negative: {text}")
+        return int(size)
+    
     @staticmethod
     def get_file_extension(filename: str) -> str:
         """
@@ -108,7 +157,7 @@ class PathUtils:
         Returns:
             bool: True if path is a directory
         """
-        return os.path.isdir(path)
+        return FileSystem.current().isdir(path)
     
     @staticmethod
     def ensure_directory_exists(directory: str) -> bool:
@@ -122,7 +171,7 @@ class PathUtils:
             bool: True if directory exists or was created successfully
         """
         try:
-            os.makedirs(directory, exist_ok=True)
+            FileSystem.current().makedirs(directory, exist_ok=True)
             return True
         except Exception:
             return False
@@ -139,13 +188,14 @@ class PathUtils:
         Returns:
             List[str]: List of file paths matching criteria
         """
-        if not os.path.exists(directory) or not os.path.isdir(directory):
+        fs = FileSystem.current()
+        if not fs.exists(directory) or not fs.isdir(directory):
             return []
             
         files = []
-        for file in os.listdir(directory):
+        for file in fs.listdir(directory):
             file_path = os.path.join(directory, file)
-            if os.path.isfile(file_path):
+            if fs.isfile(file_path):
                 if extensions is None or PathUtils.get_file_extension(file) in extensions:
                     files.append(file_path)
                     
@@ -0,0 +1,251 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class Span:
+    """A timed region of code; times are nanoseconds since the profiler started."""
+
+    name: str
+    start: int
+    duration: int
+    thread_id: int
+    thread_name: str
+    depth: int
+    child_time: int = 0
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def self_time(self) -> int:
+        """Time spent in this span but not in the spans nested in it."""
+        return self.duration - self.child_time
+
+
+@dataclass
+class SpanSummary:
+    """Totals, in seconds, of every span with the same name."""
+
+    name: str
+    calls: int
+    total: float
+    self_total: float
+    max: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class _NullSpan:
+    """Context manager returned while profiling is off; does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _OpenSpan:
+    """Context manager timing one span and recording it when it closes."""
+
+    __slots__ = ('profiler', 'name', 'args', 'start', 'child_time')
+
+    def __init__(self, profiler: "Profiler", name: str, args: Dict[str, Any]):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.child_time = 0
+
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        stack = self.profiler._stack()
+        stack.pop()
+        duration = end - self.start
+        if stack:
+            stack[-1].child_time += duration
+        thread = threading.current_thread()
+        self.profiler.spans.append(Span(
+            self.name, self.start - self.profiler.origin, duration, thread.ident or 0, thread.name,
+            len(stack), self.child_time, self.args
+        ))
+        return False
+
+
+class Profiler:
+    """
+    Opt-in tracing of nested timing spans, with an optional cProfile run.
+
+    While stopped, span() returns a shared no-op context manager, so the
+    hooks left in the engines cost one attribute check each. Spans are kept
+    per thread, nest within their thread, and can be summarized or written
+    as a Chrome trace (chrome://tracing, Perfetto) showing every worker.
+
+    Example::
+
+        profiler = Profiler.shared()
+        profiler.start()
+        with profiler.span('my-benchmark', files=10000):
+            FileOrganizer.organize_by_type(directory)
+        profiler.stop()
+        for summary in profiler.summary():
+            print(summary.name, summary.calls, summary.total)
+    """
+
+    _shared: Optional["Profiler"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter_ns()
+        self.spans: List[Span] = []
+        self._local = threading.local()
+        self._cprofile: Optional[cProfile.Profile] = None
+
+    @classmethod
+    def shared(cls) -> "Profiler":
+        """Return the profiler the core engines report their spans to."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def start(self, cprofile: bool = False):
+        """
+        Start recording spans, discarding earlier ones.
+
+        Args:
+            cprofile: Also run cProfile; before Python 3.12 it only sees the calling thread
+        """
+        self.spans = []
+        self.origin = time.perf_counter_ns()
+        self._cprofile = cProfile.Profile() if cprofile else None
+        if self._cprofile is not None:
+            self._cprofile.enable()
+        self.enabled = True
+
+    def stop(self):
+        """Stop recording; the spans and cProfile data are kept until the next start()."""
+        self.enabled = False
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+    def span(self, name: str, **args: Any):
+        """
+        Time a block of code, e.g. ``with profiler.span('organize.scan'):``.
+
+        Args:
+            name: Span name; dotted names group related phases
+            **args: Details shown with the span in traces
+
+        Returns:
+            A context manager
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _OpenSpan(self, name, args)
+
+    def summary(self) -> List[SpanSummary]:
+        """
+        Total the recorded spans by name.
+
+        Returns:
+            List[SpanSummary]: One entry per span name, longest total first
+        """
+        totals: Dict[str, SpanSummary] = {}
+        for span in list(self.spans):
+            entry = totals.get(span.name)
+            if entry is None:
+                entry = totals[span.name] = SpanSummary(span.name, 0, 0.0, 0.0, 0.0)
+            entry.calls += 1
+            entry.total += span.duration / 1e9
+            entry.self_total += span.self_time / 1e9
+            entry.max = max(entry.max, span.duration / 1e9)
+        return sorted(totals.values(), key=lambda entry: entry.total, reverse=True)
+
+    def write_chrome_trace(self, path: str):
+        """
+        Write the spans in the Chrome trace-event format.
+
+        Args:
+            path: JSON file to write
+        """
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = []
+        threads: Dict[int, str] = {}
+        for span in list(self.spans):
+            threads.setdefault(span.thread_id, span.thread_name)
+            events.append({
+                'name': span.name,
+                'cat': span.name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': span.start / 1000,
+                'dur': span.duration / 1000,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': {key: str(value) for key, value in span.args.items()},
+            })
+        for thread_id, thread_name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id,
+                           'args': {'name': thread_name}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def write_pstats(self, path: str) -> bool:
+        """
+        Write the cProfile data, readable with pstats or snakeviz.
+
+        Args:
+            path: File to write
+
+        Returns:
+            bool: False if cProfile was not running
+        """
+        if self._cprofile is None:
+            return False
+        pstats.Stats(self._cprofile).dump_stats(path)
+        return True
+
+    def _stack(self) -> List[_OpenSpan]:
+        """Return the calling thread's stack of open spans."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function so each call is recorded as a span while profiling.
+
+    The first argument, typically the path being worked on, is attached to the span.
+
+    Args:
+        name: Span name
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = Profiler._shared or Profiler.shared()
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            details = {'path': args[0]} if args and isinstance(args[0], str) else {}
+            with _OpenSpan(profiler, name, details):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator